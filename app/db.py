@@ -1,24 +1,83 @@
 """
 SQLite database setup and helpers for multi-app RAG system.
-Stores: apps metadata, files metadata, training status.
+Stores: apps metadata, files metadata, training status, background jobs.
 """
 import sqlite3
 import os
-from datetime import datetime
+import json
+import threading
+import time
+from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 
 # Database path
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "storage", "metadata.db")
+DB_PATH = os.getenv("METADATA_DB_PATH") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "storage", "metadata.db")
 
 
-def get_connection() -> sqlite3.Connection:
-    """Get SQLite connection with row factory for dict-like access."""
+# Connection tuning
+BUSY_TIMEOUT_SECONDS = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))
+MMAP_SIZE_BYTES = int(os.getenv("DB_MMAP_SIZE_MB", "64")) * 1024 * 1024
+
+_local = threading.local()
+
+# App metadata cache. Validated against the apps_version counter, but only after
+# PRAGMA data_version shows another connection committed something, so writes from
+# other uvicorn workers are seen within APP_CACHE_CHECK_INTERVAL seconds
+APP_CACHE_ENABLED = os.getenv("APP_CACHE", "1") == "1"
+APP_CACHE_CHECK_INTERVAL = float(os.getenv("APP_CACHE_CHECK_INTERVAL", "0"))
+
+_app_cache: Dict[str, Any] = {"version": None, "apps": {}, "all": None, "checked_at": float("-inf")}
+_app_cache_lock = threading.Lock()
+_app_cache_stats = {"hits": 0, "misses": 0}
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Connection kept open and reused by the thread that created it.
+    close() only returns it to the pool (rolling back anything uncommitted);
+    use close_connection() to really close it.
+    """
+    
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+
+def _open_connection() -> PooledConnection:
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_SECONDS, factory=PooledConnection)
     conn.row_factory = sqlite3.Row
+    # WAL lets readers run alongside a writer (other threads and uvicorn workers);
+    # NORMAL sync is durable across app crashes in WAL mode and avoids an fsync per commit.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT_SECONDS * 1000)}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE_BYTES}")
+    conn.execute("PRAGMA temp_store=MEMORY")
     return conn
 
 
+def get_connection() -> sqlite3.Connection:
+    """Get this thread's SQLite connection (opened once, then reused) with dict-like rows."""
+    key = (os.getpid(), DB_PATH)
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "key", None) != key:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.key = key
+    return conn
+
+
+def close_connection():
+    """Really close this thread's connection (e.g. before the thread exits)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        sqlite3.Connection.close(conn)
+        _local.conn = None
+
+
 def init_db():
     """Initialize database tables."""
     conn = get_connection()
@@ -50,34 +109,114 @@ def init_db():
         )
     """)
     
+    # Indexed files table (which chunks in the vector store came from which file version)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS indexed_files (
+            app_id TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_hash TEXT NOT NULL,
+            chunk_ids TEXT NOT NULL,
+            indexed_at TEXT NOT NULL,
+            PRIMARY KEY (app_id, file_path),
+            FOREIGN KEY (app_id) REFERENCES apps(app_id)
+        )
+    """)
+    
+    # Jobs table (background training runs)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            app_id TEXT NOT NULL,
+            job_type TEXT NOT NULL,
+            status TEXT DEFAULT 'QUEUED',
+            stage TEXT,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (app_id) REFERENCES apps(app_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_app_status ON jobs(app_id, status)")
+    # Which process is running a job, and until when its claim holds without renewal
+    _add_column(cursor, "jobs", "owner", "TEXT")
+    _add_column(cursor, "jobs", "lease_expires_at", "TEXT")
+    
+    # Per-app settings added after the first release
+    _add_column(cursor, "apps", "vector_backend", "TEXT")
+    _add_column(cursor, "apps", "vector_dtype", "TEXT")
+    _add_column(cursor, "apps", "vector_rerank", "INTEGER")
+    _add_column(cursor, "apps", "llm_model", "TEXT")
+    _add_column(cursor, "apps", "llm_temperature", "REAL")
+    
+    # Version counter bumped by triggers on every apps write (from any process),
+    # used to validate the in-memory app cache
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('apps_version', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS apps_version_{event.lower()} AFTER {event} ON apps
+            BEGIN
+                UPDATE meta SET value = value + 1 WHERE key = 'apps_version';
+            END
+        """)
+    
+    # Indexes for the per-app file lookups
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_app_uploaded ON files(app_id, uploaded_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_app_hash ON files(app_id, file_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_app_filename ON files(app_id, filename)")
+    
     conn.commit()
     conn.close()
     print("[OK] Database initialized")
 
 
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    """Add a column to an existing table if it isn't there yet."""
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
 # ============== APP OPERATIONS ==============
 
-def create_app(app_id: str, name: str) -> Dict[str, Any]:
-    """Create a new app."""
+# Per-app settings that can be changed after creation (NULL = server default)
+APP_SETTINGS = ("vector_backend", "vector_dtype", "vector_rerank", "llm_model", "llm_temperature")
+
+
+def create_app(app_id: str, name: str, **settings: Any) -> Dict[str, Any]:
+    """Create a new app. `settings` may set any of APP_SETTINGS."""
+    unknown = set(settings) - set(APP_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown app setting(s): {', '.join(sorted(unknown))}")
     conn = get_connection()
     cursor = conn.cursor()
     now = datetime.utcnow().isoformat()
+    columns = ["app_id", "name", "created_at", "updated_at", *settings]
     
     try:
         cursor.execute(
-            "INSERT INTO apps (app_id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
-            (app_id, name, now, now)
+            f"INSERT INTO apps ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            (app_id, name, now, now, *settings.values())
         )
         conn.commit()
-        return {"app_id": app_id, "name": name, "status": "CREATED", "created_at": now}
+        invalidate_app_cache()
+        return {"app_id": app_id, "name": name, "status": "CREATED", "created_at": now, **settings}
     except sqlite3.IntegrityError:
         raise ValueError(f"App '{app_id}' already exists")
     finally:
         conn.close()
 
 
-def get_app(app_id: str) -> Optional[Dict[str, Any]]:
-    """Get app by ID."""
+def _fetch_app(app_id: str) -> Optional[Dict[str, Any]]:
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM apps WHERE app_id = ?", (app_id,))
@@ -86,8 +225,7 @@ def get_app(app_id: str) -> Optional[Dict[str, Any]]:
     return dict(row) if row else None
 
 
-def get_all_apps() -> List[Dict[str, Any]]:
-    """Get all apps."""
+def _fetch_all_apps() -> List[Dict[str, Any]]:
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM apps ORDER BY created_at DESC")
@@ -96,6 +234,101 @@ def get_all_apps() -> List[Dict[str, Any]]:
     return [dict(row) for row in rows]
 
 
+def _apps_version() -> int:
+    conn = get_connection()
+    row = conn.execute("SELECT value FROM meta WHERE key = 'apps_version'").fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+def _validate_app_cache():
+    """
+    Drop cached apps if any process changed the apps table since they were read.
+    Cheap in the common case: PRAGMA data_version on this thread's connection only
+    changes when another connection commits, and only then is apps_version read.
+    """
+    now = time.monotonic()
+    if now - _app_cache["checked_at"] < APP_CACHE_CHECK_INTERVAL:
+        return
+    conn = get_connection()
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    seen = getattr(_local, "apps_seen", None)
+    if seen is not None and seen == (data_version, _app_cache["version"]):
+        # Nothing committed elsewhere since this thread last read apps_version
+        _app_cache["checked_at"] = now
+        return
+    version = _apps_version()
+    _local.apps_seen = (data_version, version)
+    with _app_cache_lock:
+        if version != _app_cache["version"]:
+            _app_cache["apps"].clear()
+            _app_cache["all"] = None
+            _app_cache["version"] = version
+        _app_cache["checked_at"] = now
+
+
+def invalidate_app_cache():
+    """Forget cached app rows (called after local writes to the apps table)."""
+    with _app_cache_lock:
+        _app_cache["apps"].clear()
+        _app_cache["all"] = None
+        _app_cache["version"] = None
+        _app_cache["checked_at"] = float("-inf")
+
+
+def get_app(app_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get app by ID (read-through cached). Unknown ids are not cached, so arbitrary
+    ids in requests can't grow the cache.
+    """
+    if not APP_CACHE_ENABLED:
+        return _fetch_app(app_id)
+    
+    _validate_app_cache()
+    # Hits read the dict without the lock (single dict reads are atomic under the GIL)
+    app = _app_cache["apps"].get(app_id)
+    if app is not None:
+        _app_cache_stats["hits"] += 1
+        return dict(app)
+    _app_cache_stats["misses"] += 1
+    version = _app_cache["version"]
+    
+    app = _fetch_app(app_id)
+    if app is None:
+        return None
+    with _app_cache_lock:
+        # Don't store a row read across an invalidation
+        if _app_cache["version"] == version and version is not None:
+            _app_cache["apps"][app_id] = app
+    return dict(app)
+
+
+def get_all_apps() -> List[Dict[str, Any]]:
+    """Get all apps (read-through cached)."""
+    if not APP_CACHE_ENABLED:
+        return _fetch_all_apps()
+    
+    _validate_app_cache()
+    apps = _app_cache["all"]
+    if apps is not None:
+        _app_cache_stats["hits"] += 1
+        return [dict(app) for app in apps]
+    _app_cache_stats["misses"] += 1
+    version = _app_cache["version"]
+    
+    apps = _fetch_all_apps()
+    with _app_cache_lock:
+        if _app_cache["version"] == version and version is not None:
+            _app_cache["all"] = apps
+    return [dict(app) for app in apps]
+
+
+def app_cache_stats() -> Dict[str, Any]:
+    """Return app metadata cache statistics."""
+    with _app_cache_lock:
+        return {**_app_cache_stats, "entries": len(_app_cache["apps"])}
+
+
 def update_app_status(app_id: str, status: str, last_indexed_at: Optional[str] = None):
     """Update app training status."""
     conn = get_connection()
@@ -114,16 +347,38 @@ def update_app_status(app_id: str, status: str, last_indexed_at: Optional[str] =
         )
     conn.commit()
     conn.close()
+    invalidate_app_cache()
+
+
+def update_app_settings(app_id: str, **settings: Any):
+    """Update per-app settings (see APP_SETTINGS)."""
+    unknown = set(settings) - set(APP_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown app setting(s): {', '.join(sorted(unknown))}")
+    if not settings:
+        return
+    conn = get_connection()
+    assignments = ", ".join(f"{column} = ?" for column in settings)
+    conn.execute(
+        f"UPDATE apps SET {assignments}, updated_at = ? WHERE app_id = ?",
+        (*settings.values(), datetime.utcnow().isoformat(), app_id)
+    )
+    conn.commit()
+    conn.close()
+    invalidate_app_cache()
 
 
 def delete_app(app_id: str):
-    """Delete an app and its files from database."""
+    """Delete an app, its files, index records and jobs from database."""
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM files WHERE app_id = ?", (app_id,))
+    cursor.execute("DELETE FROM jobs WHERE app_id = ?", (app_id,))
+    cursor.execute("DELETE FROM indexed_files WHERE app_id = ?", (app_id,))
     cursor.execute("DELETE FROM apps WHERE app_id = ?", (app_id,))
     conn.commit()
     conn.close()
+    invalidate_app_cache()
 
 
 # ============== FILE OPERATIONS ==============
@@ -151,6 +406,74 @@ def add_file(app_id: str, filename: str, file_path: str, file_size: int, file_ha
     }
 
 
+def get_file_by_name(app_id: str, filename: str) -> Optional[Dict[str, Any]]:
+    """Get the latest file record for a filename in an app."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM files WHERE app_id = ? AND filename = ? ORDER BY uploaded_at DESC LIMIT 1",
+        (app_id, filename)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def upsert_file(app_id: str, filename: str, file_path: str, file_size: int, file_hash: str) -> Dict[str, Any]:
+    """
+    Add or replace file metadata. A filename has one record per app; re-uploading
+    it replaces the record (and drops older duplicates) instead of adding a row.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    
+    cursor.execute(
+        "DELETE FROM files WHERE app_id = ? AND filename = ?",
+        (app_id, filename)
+    )
+    cursor.execute(
+        "INSERT INTO files (app_id, filename, file_path, file_size, file_hash, uploaded_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (app_id, filename, file_path, file_size, file_hash, now)
+    )
+    file_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    
+    return {
+        "id": file_id,
+        "app_id": app_id,
+        "filename": filename,
+        "file_size": file_size,
+        "uploaded_at": now
+    }
+
+
+def get_all_file_hashes() -> List[str]:
+    """Get every distinct file hash referenced by any app."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT file_hash FROM files WHERE file_hash IS NOT NULL")
+    rows = cursor.fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def get_referenced_file_hashes(file_hashes: List[str]) -> List[str]:
+    """Return the hashes in `file_hashes` that are still referenced by any app."""
+    hashes = list(set(file_hashes))
+    referenced = []
+    conn = get_connection()
+    cursor = conn.cursor()
+    for i in range(0, len(hashes), 500):
+        batch = hashes[i:i + 500]
+        placeholders = ",".join("?" * len(batch))
+        cursor.execute(f"SELECT DISTINCT file_hash FROM files WHERE file_hash IN ({placeholders})", batch)
+        referenced.extend(row[0] for row in cursor.fetchall())
+    conn.close()
+    return referenced
+
+
 def get_files_for_app(app_id: str) -> List[Dict[str, Any]]:
     """Get all files for an app."""
     conn = get_connection()
@@ -179,6 +502,234 @@ def delete_files_for_app(app_id: str):
     conn.close()
 
 
+# ============== INDEXED FILE OPERATIONS ==============
+
+def get_indexed_files(app_id: str) -> Dict[str, Dict[str, Any]]:
+    """Get index records for an app, keyed by file path."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM indexed_files WHERE app_id = ?", (app_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    
+    indexed = {}
+    for row in rows:
+        record = dict(row)
+        record["chunk_ids"] = json.loads(record["chunk_ids"])
+        indexed[record["file_path"]] = record
+    return indexed
+
+
+def set_indexed_file(app_id: str, file_path: str, file_hash: str, chunk_ids: List[str]):
+    """Record which chunk IDs were indexed for a file version."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    cursor.execute(
+        "INSERT OR REPLACE INTO indexed_files (app_id, file_path, file_hash, chunk_ids, indexed_at) VALUES (?, ?, ?, ?, ?)",
+        (app_id, file_path, file_hash, json.dumps(chunk_ids), now)
+    )
+    conn.commit()
+    conn.close()
+
+
+def delete_indexed_file(app_id: str, file_path: str):
+    """Delete the index record for a file."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM indexed_files WHERE app_id = ? AND file_path = ?", (app_id, file_path))
+    conn.commit()
+    conn.close()
+
+
+def delete_indexed_files_for_app(app_id: str):
+    """Delete all index records for an app (forces a full rebuild on next training)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM indexed_files WHERE app_id = ?", (app_id,))
+    conn.commit()
+    conn.close()
+
+
+# ============== JOB OPERATIONS ==============
+
+# Jobs in these states still hold the app (used for de-duplication)
+ACTIVE_JOB_STATUSES = ("QUEUED", "RUNNING")
+
+
+def _job_from_row(row) -> Dict[str, Any]:
+    job = dict(row)
+    job["progress"] = json.loads(job["progress"]) if job.get("progress") else {}
+    job["result"] = json.loads(job["result"]) if job.get("result") else None
+    return job
+
+
+def create_job(job_id: str, app_id: str, job_type: str) -> Optional[Dict[str, Any]]:
+    """
+    Create a queued job unless the app already has a queued or running job of
+    that type. The check and the insert are one statement, so this holds across
+    processes sharing the database. Returns the new job, or None if one was active.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    
+    cursor.execute(
+        """
+        INSERT INTO jobs (job_id, app_id, job_type, status, created_at, updated_at)
+        SELECT ?, ?, ?, 'QUEUED', ?, ?
+        WHERE NOT EXISTS (
+            SELECT 1 FROM jobs WHERE app_id = ? AND job_type = ? AND status IN (?, ?)
+        )
+        """,
+        (job_id, app_id, job_type, now, now, app_id, job_type, *ACTIVE_JOB_STATUSES)
+    )
+    created = cursor.rowcount == 1
+    conn.commit()
+    conn.close()
+    return get_job(job_id) if created else None
+
+
+def claim_job(job_id: str, owner: str, lease_seconds: float) -> bool:
+    """
+    Atomically move a queued job to RUNNING for `owner`.
+    Returns False if the job is no longer queued (another worker claimed it).
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow()
+    cursor.execute(
+        """
+        UPDATE jobs SET status = 'RUNNING', stage = 'starting', owner = ?, lease_expires_at = ?,
+            started_at = ?, updated_at = ?
+        WHERE job_id = ? AND status = 'QUEUED'
+        """,
+        (owner, (now + timedelta(seconds=lease_seconds)).isoformat(), now.isoformat(), now.isoformat(), job_id)
+    )
+    claimed = cursor.rowcount == 1
+    conn.commit()
+    conn.close()
+    return claimed
+
+
+def renew_job_leases(owner: str, lease_seconds: float) -> int:
+    """Extend the lease of every running job held by `owner`. Returns jobs renewed."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    expires = (datetime.utcnow() + timedelta(seconds=lease_seconds)).isoformat()
+    cursor.execute(
+        "UPDATE jobs SET lease_expires_at = ? WHERE owner = ? AND status = 'RUNNING'",
+        (expires, owner)
+    )
+    renewed = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return renewed
+
+
+def requeue_job(job: Dict[str, Any]) -> bool:
+    """
+    Put a running job back in the queue, as long as it still has the owner and
+    lease it had when `job` was read (so only one worker re-queues it).
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    cursor.execute(
+        """
+        UPDATE jobs SET status = 'QUEUED', stage = 'resumed', owner = NULL, lease_expires_at = NULL,
+            updated_at = ?
+        WHERE job_id = ? AND status = 'RUNNING' AND owner IS ? AND lease_expires_at IS ?
+        """,
+        (now, job["job_id"], job.get("owner"), job.get("lease_expires_at"))
+    )
+    requeued = cursor.rowcount == 1
+    conn.commit()
+    conn.close()
+    return requeued
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Get job by ID."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return _job_from_row(row) if row else None
+
+
+def get_active_job(app_id: str, job_type: str) -> Optional[Dict[str, Any]]:
+    """Get the queued or running job of a type for an app, if any."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM jobs WHERE app_id = ? AND job_type = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+        (app_id, job_type, *ACTIVE_JOB_STATUSES)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return _job_from_row(row) if row else None
+
+
+def get_unfinished_jobs() -> List[Dict[str, Any]]:
+    """Get all queued or running jobs (e.g. to resume after a restart)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+        ACTIVE_JOB_STATUSES
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return [_job_from_row(row) for row in rows]
+
+
+def get_jobs_for_app(app_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Get recent jobs for an app."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM jobs WHERE app_id = ? ORDER BY created_at DESC LIMIT ?",
+        (app_id, limit)
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return [_job_from_row(row) for row in rows]
+
+
+def update_job(job_id: str, status: Optional[str] = None, stage: Optional[str] = None,
+               progress: Optional[Dict[str, Any]] = None, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None):
+    """Update job status/progress. Only the given fields are changed."""
+    now = datetime.utcnow().isoformat()
+    fields = {"updated_at": now}
+    if status is not None:
+        fields["status"] = status
+        if status == "RUNNING":
+            fields["started_at"] = now
+        elif status not in ACTIVE_JOB_STATUSES:
+            fields["finished_at"] = now
+    if stage is not None:
+        fields["stage"] = stage
+    if progress is not None:
+        fields["progress"] = json.dumps(progress)
+    if result is not None:
+        fields["result"] = json.dumps(result)
+    if error is not None:
+        fields["error"] = error
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    cursor.execute(
+        f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+        (*fields.values(), job_id)
+    )
+    conn.commit()
+    conn.close()
+
+
 # Initialize on import
 init_db()
 
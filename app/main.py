@@ -2,19 +2,27 @@
 FastAPI application for Multi-App RAG Chatbot.
 Provides REST API endpoints for app management, file upload, training, and chat.
 """
+import asyncio
+import json
 import os
 import re
+import threading
 from typing import List, Optional
 from datetime import datetime
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, field_validator
 
 from app import db
-from app.services import storage, indexing, rag
+from app.services import (
+    storage, indexing, rag, llm, embeddings, vector_cache, answer_cache, query_batcher, workers, jobs,
+    context_packer,
+)
+from app.services.metrics import PROMETHEUS_CONTENT_TYPE, register_collector, render as render_metrics
 
 # ============== FastAPI App Setup ==============
 
@@ -24,6 +32,58 @@ app = FastAPI(
     version="1.0.0"
 )
 
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject file uploads larger than UPLOAD_MAX_REQUEST_BYTES before the body is buffered:
+    by Content-Length up front, or by counting bytes as they arrive for chunked requests.
+    """
+    
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+    
+    def _detail(self) -> str:
+        return f"Upload exceeds the request limit of {self.max_bytes // (1024 * 1024)} MB"
+    
+    async def _reject(self, send):
+        response = JSONResponse(status_code=413, content={"detail": self._detail()})
+        await send({"type": "http.response.start", "status": response.status_code,
+                    "headers": response.raw_headers})
+        await send({"type": "http.response.body", "body": response.body})
+    
+    async def __call__(self, scope, receive, send):
+        if not (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and re.fullmatch(r"/api/apps/[^/]+/files", scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+        
+        received = 0
+        
+        async def _receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while FastAPI reads the body; it is passed through as a 413
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+        
+        await self.app(scope, _receive, send)
+
+
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=storage.UPLOAD_MAX_REQUEST_BYTES)
+
+
 # CORS middleware for React frontend
 app.add_middleware(
     CORSMiddleware,
@@ -36,7 +96,54 @@ app.add_middleware(
 
 # ============== Pydantic Models ==============
 
-class CreateAppRequest(BaseModel):
+class IndexSettings(BaseModel):
+    """Per-app index settings; unset fields keep the app's current value (or the server default)."""
+    vectorBackend: Optional[str] = None  # "chroma" or "flat"
+    vectorDtype: Optional[str] = None    # flat only: "float32", "float16" or "int8"
+    vectorRerank: Optional[bool] = None  # flat only: re-score top candidates in float32
+    
+    @field_validator("vectorBackend")
+    @classmethod
+    def validate_vector_backend(cls, v):
+        if v is not None and v not in indexing.VECTOR_BACKENDS:
+            raise ValueError(f"vectorBackend must be one of: {', '.join(indexing.VECTOR_BACKENDS)}")
+        return v
+    
+    @field_validator("vectorDtype")
+    @classmethod
+    def validate_vector_dtype(cls, v):
+        if v is not None and v not in indexing.VECTOR_DTYPES:
+            raise ValueError(f"vectorDtype must be one of: {', '.join(indexing.VECTOR_DTYPES)}")
+        return v
+    
+    def app_settings(self) -> dict:
+        """Settings to store on the app (db column -> value), set fields only."""
+        settings = {
+            "vector_backend": self.vectorBackend,
+            "vector_dtype": self.vectorDtype,
+            "vector_rerank": None if self.vectorRerank is None else int(self.vectorRerank),
+        }
+        return {k: v for k, v in settings.items() if v is not None}
+
+
+class LlmSettings(BaseModel):
+    """Per-app LLM overrides; unset fields use OPENAI_MODEL / OPENAI_TEMPERATURE."""
+    llmModel: Optional[str] = None
+    llmTemperature: Optional[float] = None
+    
+    @field_validator("llmTemperature")
+    @classmethod
+    def validate_llm_temperature(cls, v):
+        if v is not None and not 0 <= v <= 2:
+            raise ValueError("llmTemperature must be between 0 and 2")
+        return v
+    
+    def llm_settings(self) -> dict:
+        settings = {"llm_model": self.llmModel, "llm_temperature": self.llmTemperature}
+        return {k: v for k, v in settings.items() if v is not None}
+
+
+class CreateAppRequest(IndexSettings, LlmSettings):
     appId: str
     name: str
     
@@ -50,6 +157,10 @@ class CreateAppRequest(BaseModel):
         return v.lower()
 
 
+class TrainRequest(IndexSettings):
+    """Optional train body: index settings to apply from this training on."""
+
+
 class ChatRequest(BaseModel):
     appId: str
     message: str
@@ -62,6 +173,23 @@ class ChatRequest(BaseModel):
         return v.strip()
 
 
+class ChatBatchRequest(BaseModel):
+    appId: str
+    questions: List[str]
+    
+    @field_validator("questions")
+    @classmethod
+    def validate_questions(cls, v):
+        if not v:
+            raise ValueError("questions cannot be empty")
+        if len(v) > rag.BATCH_MAX_QUESTIONS:
+            raise ValueError(f"At most {rag.BATCH_MAX_QUESTIONS} questions per batch")
+        questions = [q.strip() for q in v]
+        if any(not q for q in questions):
+            raise ValueError("Questions cannot be empty")
+        return questions
+
+
 class AppResponse(BaseModel):
     success: bool
     data: Optional[dict] = None
@@ -78,6 +206,16 @@ class ChatResponse(BaseModel):
     answer: Optional[str] = None
     sources: List[str] = []
     error: Optional[str] = None
+    cached: Optional[str] = None  # "exact" or "semantic" when served from the answer cache
+
+
+class ChatBatchItem(ChatResponse):
+    question: str
+
+
+class ChatBatchResponse(BaseModel):
+    success: bool
+    results: List[ChatBatchItem]
 
 
 # ============== Health Check ==============
@@ -92,13 +230,78 @@ async def health():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
 
+@app.get("/api/metrics")
+async def metrics():
+    """Worker pool and cache metrics."""
+    return {
+        "chat_pool": workers.chat_pool.stats(),
+        "chat_async": workers.chat_limiter.stats(),
+        "vector_cache": vector_cache.stats(),
+        "app_cache": db.app_cache_stats(),
+        "answer_cache": answer_cache.stats(),
+        "query_batcher": query_batcher.stats(),
+        "llm": llm.stats(),
+        "context": context_packer.stats(),
+    }
+
+
+def _service_metrics():
+    """Gauges and totals read from service stats on each /metrics scrape."""
+    pool, limiter, train = workers.chat_pool.stats(), workers.chat_limiter.stats(), jobs.stats()
+    batcher = query_batcher.stats()
+    yield "rag_active_requests", "gauge", "Chat requests currently being processed", [
+        ({"pool": "chat"}, pool["active"]),
+        ({"pool": "chat_async"}, limiter["inflight"]),
+    ]
+    yield "rag_queue_depth", "gauge", "Work waiting for a worker", [
+        ({"queue": "chat"}, pool["queue_depth"]),
+        ({"queue": "query_embed"}, sum(m["pending"] for m in batcher["models"].values())),
+        ({"queue": "train"}, train["queued"]),
+    ]
+    yield "rag_train_jobs_running", "gauge", "Training jobs holding a training worker", [({}, train["running"])]
+    yield "rag_chat_rejected_total", "counter", "Chat requests rejected with 503", [
+        ({"pool": "chat"}, pool["rejected"]),
+        ({"pool": "chat_async"}, limiter["rejected"]),
+    ]
+
+    answers, vectors, apps = answer_cache.stats(), vector_cache.stats(), db.app_cache_stats()
+    caches = {
+        "answer": (answers["exact_hits"] + answers["semantic_hits"], answers["misses"], answers["entries"]),
+        "vector_store": (vectors["hits"], vectors["misses"], vectors["entries"]),
+        "app": (apps["hits"], apps["misses"], apps["entries"]),
+    }
+    yield "rag_cache_hits_total", "counter", "Cache hits", [({"cache": c}, v[0]) for c, v in caches.items()]
+    yield "rag_cache_misses_total", "counter", "Cache misses", [({"cache": c}, v[1]) for c, v in caches.items()]
+    yield "rag_cache_hit_ratio", "gauge", "Cache hits / lookups since start", [
+        ({"cache": c}, v[0] / (v[0] + v[1]) if v[0] + v[1] else 0) for c, v in caches.items()
+    ]
+    yield "rag_cache_entries", "gauge", "Entries held per cache", [({"cache": c}, v[2]) for c, v in caches.items()]
+
+    context = context_packer.stats()
+    yield "rag_context_tokens_total", "counter", "Context tokens retrieved vs. sent to the LLM", [
+        ({"kind": "retrieved"}, context["tokens_in"]),
+        ({"kind": "sent"}, context["tokens_sent"]),
+    ]
+
+
+register_collector(_service_metrics)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: chat / training stage latencies, per-app counters, caches, queues."""
+    return Response(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 # ============== App Management ==============
 
 @app.post("/api/apps", response_model=AppResponse)
 async def create_app(request: CreateAppRequest):
     """Create a new app."""
     try:
-        app_data = db.create_app(request.appId, request.name)
+        app_data = db.create_app(
+            request.appId, request.name, **request.app_settings(), **request.llm_settings()
+        )
         storage.ensure_app_dirs(request.appId)
         print(f"[OK] Created app: {request.appId}")
         return AppResponse(success=True, data=app_data)
@@ -129,6 +332,22 @@ async def get_app(app_id: str):
     return AppResponse(success=True, data=app_data)
 
 
+@app.patch("/api/apps/{app_id}", response_model=AppResponse)
+async def update_app(app_id: str, request: LlmSettings):
+    """Update an app's LLM overrides (model, temperature). Takes effect on the next chat."""
+    app_data = db.get_app(app_id)
+    if not app_data:
+        raise HTTPException(status_code=404, detail=f"App '{app_id}' not found")
+    
+    settings = request.llm_settings()
+    if settings:
+        db.update_app_settings(app_id, **settings)
+        # Cached answers came from the previous model/temperature
+        answer_cache.invalidate(app_id)
+    
+    return AppResponse(success=True, data=db.get_app(app_id))
+
+
 @app.delete("/api/apps/{app_id}", response_model=AppResponse)
 async def delete_app(app_id: str):
     """Delete an app and all its data."""
@@ -136,11 +355,17 @@ async def delete_app(app_id: str):
     if not app_data:
         raise HTTPException(status_code=404, detail=f"App '{app_id}' not found")
     
+    file_hashes = [f["file_hash"] for f in db.get_files_for_app(app_id) if f.get("file_hash")]
+    
     # Delete storage
     storage.delete_app_storage(app_id)
     
     # Delete from database
     db.delete_app(app_id)
+    answer_cache.invalidate(app_id)
+    
+    # Drop this app's blobs that no other app references
+    storage.release_blobs(file_hashes, db.get_referenced_file_hashes(file_hashes))
     
     print(f"[DEL] Deleted app: {app_id}")
     return AppResponse(success=True, data={"message": f"App '{app_id}' deleted"})
@@ -157,7 +382,9 @@ async def upload_files(app_id: str, files: List[UploadFile] = File(...)):
         raise HTTPException(status_code=404, detail=f"App '{app_id}' not found")
     
     uploaded = []
+    unchanged = []
     errors = []
+    remaining = storage.UPLOAD_MAX_REQUEST_BYTES
     
     for file in files:
         # Validate file extension
@@ -166,28 +393,47 @@ async def upload_files(app_id: str, files: List[UploadFile] = File(...)):
             continue
         
         try:
-            # Read file content
-            content = await file.read()
-            
-            # Compute hash
-            file_hash = storage.compute_file_hash(content)
+            # Stream into the blob store in chunks (hashing as we go) off the event loop
+            _, file_size, file_hash = await run_in_threadpool(
+                storage.save_upload_stream,
+                file.file,
+                file.filename,
+                min(storage.UPLOAD_MAX_FILE_BYTES, remaining)
+            )
+            remaining -= file_size
             
-            # Save file
-            file_path = storage.save_file(app_id, file.filename, content)
+            # Identical content under the same name is a no-op
+            existing = await run_in_threadpool(db.get_file_by_name, app_id, file.filename)
+            if (existing and existing["file_hash"] == file_hash
+                    and os.path.exists(existing["file_path"])):
+                unchanged.append(file.filename)
+                continue
             
-            # Add to database
-            file_data = db.add_file(
+            # Reference the blob from the app and record it
+            file_path = await run_in_threadpool(storage.link_blob, app_id, file.filename, file_hash)
+            file_data = await run_in_threadpool(
+                db.upsert_file,
                 app_id=app_id,
                 filename=file.filename,
                 file_path=file_path,
-                file_size=len(content),
+                file_size=file_size,
                 file_hash=file_hash
             )
             
+            # The replaced content may have been this blob's last reference
+            if existing and existing["file_hash"] and existing["file_hash"] != file_hash:
+                old_hashes = [existing["file_hash"]]
+                referenced = await run_in_threadpool(db.get_referenced_file_hashes, old_hashes)
+                await run_in_threadpool(storage.release_blobs, old_hashes, referenced)
+            
             uploaded.append(file_data)
             
+        except storage.FileTooLargeError as e:
+            errors.append(str(e))
         except Exception as e:
             errors.append(f"Error uploading {file.filename}: {str(e)}")
+        finally:
+            await file.close()
     
     # Update app status to indicate new files (needs retraining)
     if uploaded:
@@ -197,6 +443,7 @@ async def upload_files(app_id: str, files: List[UploadFile] = File(...)):
         success=True,
         data={
             "uploaded": uploaded,
+            "unchanged": unchanged,
             "errors": errors,
             "message": f"Uploaded {len(uploaded)} file(s)"
         }
@@ -216,9 +463,13 @@ async def list_files(app_id: str):
 
 # ============== Training / Indexing ==============
 
-@app.post("/api/apps/{app_id}/train", response_model=AppResponse)
-async def train_app(app_id: str):
-    """Train (index) an app's documents."""
+@app.post("/api/apps/{app_id}/train", response_model=AppResponse, status_code=202)
+async def train_app(app_id: str, request: Optional[TrainRequest] = None):
+    """
+    Queue training (indexing) of an app's documents.
+    Returns a job id; poll GET /api/jobs/{job_id} for progress.
+    The optional body changes index settings for this and later trainings.
+    """
     # Validate app exists
     app_data = db.get_app(app_id)
     if not app_data:
@@ -232,19 +483,52 @@ async def train_app(app_id: str):
             detail=f"No files uploaded for app '{app_id}'. Please upload files first."
         )
     
-    try:
-        num_docs, num_chunks = indexing.build_index(app_id)
-        return AppResponse(
-            success=True,
-            data={
-                "message": f"Training complete for app '{app_id}'",
-                "documents": num_docs,
-                "chunks": num_chunks,
-                "status": "READY"
-            }
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    settings = {
+        k: v for k, v in (request.app_settings() if request else {}).items()
+        if v != app_data.get(k)
+    }
+    if settings:
+        # A running build keeps the settings it started with
+        if db.get_active_job(app_id, jobs.JOB_TYPE_TRAIN):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Training is in progress for app '{app_id}'; change settings after it finishes"
+            )
+        db.update_app_settings(app_id, **settings)
+    
+    job, created = jobs.enqueue_training(app_id)
+    return AppResponse(
+        success=True,
+        data={
+            "message": (
+                f"Training queued for app '{app_id}'" if created
+                else f"Training already in progress for app '{app_id}'"
+            ),
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "deduplicated": not created
+        }
+    )
+
+
+@app.get("/api/apps/{app_id}/jobs")
+async def list_jobs(app_id: str):
+    """List recent jobs for an app."""
+    app_data = db.get_app(app_id)
+    if not app_data:
+        raise HTTPException(status_code=404, detail=f"App '{app_id}' not found")
+    
+    return {"success": True, "data": db.get_jobs_for_app(app_id)}
+
+
+@app.get("/api/jobs/{job_id}", response_model=AppResponse)
+async def get_job(job_id: str):
+    """Get a job's status and per-stage progress."""
+    job = db.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    
+    return AppResponse(success=True, data=job)
 
 
 # ============== Chat ==============
@@ -252,7 +536,23 @@ async def train_app(app_id: str):
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Send a chat message to an app's RAG system."""
-    result = rag.chat(request.appId, request.message)
+    # Exact cache hits are answered here without waiting for a chat worker; the app
+    # lookup may query SQLite, so it still runs off the event loop
+    result = await run_in_threadpool(rag.get_cached_answer, request.appId, request.message)
+    if result is not None:
+        return ChatResponse(success=True, answer=result["answer"], sources=result["sources"], cached=result["cached"])
+    
+    try:
+        if workers.CHAT_ASYNC:
+            result = await workers.chat_limiter.run(rag.achat, request.appId, request.message, exact_cache_checked=True)
+        else:
+            result = await workers.chat_pool.run(rag.chat, request.appId, request.message, exact_cache_checked=True)
+    except workers.PoolFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
@@ -260,7 +560,87 @@ async def chat(request: ChatRequest):
     return ChatResponse(
         success=True,
         answer=result["answer"],
-        sources=result["sources"]
+        sources=result["sources"],
+        cached=result.get("cached")
+    )
+
+
+@app.post("/api/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(request: ChatBatchRequest):
+    """
+    Answer up to CHAT_BATCH_MAX questions for one app in a single request.
+    Results are returned in input order; a failed question doesn't fail the batch.
+    """
+    try:
+        result = await workers.chat_pool.run(rag.chat_batch, request.appId, request.questions)
+    except workers.PoolFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return ChatBatchResponse(
+        success=True,
+        results=[
+            ChatBatchItem(question=question, **item)
+            for question, item in zip(request.questions, result["results"])
+        ]
+    )
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Stream a chat answer as Server-Sent Events.
+    Emits a `sources` event after retrieval, `token` events as the answer is
+    generated, then `done` (or `error`).
+    """
+    _, error = await run_in_threadpool(rag.check_app_ready, request.appId)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    
+    def _produce():
+        # Runs in the chat pool; hands events back to the event loop as they arrive
+        try:
+            for event in rag.chat_stream(request.appId, request.message):
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, None)
+    
+    try:
+        workers.chat_pool.submit(_produce)
+    except workers.PoolFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    async def _sse():
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            # Client went away (or stream finished): stop generating tokens
+            cancelled.set()
+    
+    return StreamingResponse(
+        _sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
@@ -303,9 +683,27 @@ async def startup():
     """Initialize on startup."""
     print("[START] Starting Multi-App RAG Chatbot API...")
     db.init_db()
+    # Collect blobs whose release was skipped (still in their grace period) or interrupted
+    storage.remove_unreferenced_blobs(db.get_all_file_hashes())
+    if embeddings.WARMUP_ON_STARTUP:
+        try:
+            embeddings.warmup()
+        except Exception as e:
+            # Not fatal: the model is loaded lazily on first use instead
+            print(f"[WARN] Embedding warmup failed: {e}")
+    if jobs.RESUME_ON_STARTUP:
+        jobs.resume_unfinished_jobs()
     print("[OK] API ready!")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    """Release worker threads on shutdown."""
+    workers.chat_pool.shutdown()
+    jobs.shutdown()
+    embeddings.shutdown_process_pool()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,209 @@
+"""
+Answer cache service.
+Remembers chat answers per app, keyed by the normalized question, so repeated
+questions skip retrieval and the LLM. Optionally (semantic mode) a question whose
+embedding is close enough to a cached question's reuses that answer.
+
+Entries are tagged with a version of the app (its last_indexed_at and LLM
+settings, read from the metadata DB on every lookup); a lookup with a different
+version drops every entry for that app, so answers never outlive the index or
+model they were generated with, even when another worker process retrained or
+updated the app.
+
+Each app keeps its own entries plus a lazily stacked matrix of their question
+embeddings, so a semantic lookup only scores that app's questions, and does so
+outside the lock.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Configuration
+ENABLED = os.getenv("ANSWER_CACHE", "1") == "1"
+TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "0") == "1"
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# app_id -> {"version", "entries": {normalized question -> entry}, "generation", "index"}
+# where "index" is (questions, stacked vectors, created times) or None until needed
+_apps: Dict[str, Dict[str, Any]] = {}
+# (app_id, normalized question) for every entry, least recently used first
+_lru: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(question: str) -> str:
+    """Normalize a question for exact matching (case, whitespace, trailing punctuation)."""
+    return _WHITESPACE.sub(" ", question).strip().lower().rstrip("?!. ")
+
+
+def _app_state(app_id: str, version: Optional[str]) -> Dict[str, Any]:
+    """An app's entries, dropped first if they were generated against a different version. Caller holds _lock."""
+    state = _apps.get(app_id)
+    if state is not None and state["version"] != version:
+        _drop_app(app_id)
+        _stats["invalidations"] += 1
+        state = None
+    if state is None:
+        state = _apps[app_id] = {"version": version, "entries": {}, "generation": 0, "index": None}
+    return state
+
+
+def _changed(state: Dict[str, Any]):
+    state["generation"] += 1
+    state["index"] = None
+
+
+def _drop_app(app_id: str):
+    state = _apps.pop(app_id, None)
+    if state is not None:
+        for question in state["entries"]:
+            del _lru[(app_id, question)]
+
+
+def _remove(app_id: str, question: str):
+    state = _apps[app_id]
+    del state["entries"][question]
+    del _lru[(app_id, question)]
+    _changed(state)
+
+
+def _expired(entry: Dict[str, Any], now: float) -> bool:
+    return TTL_SECONDS > 0 and now - entry["created"] > TTL_SECONDS
+
+
+def _result(entry: Dict[str, Any], match: str) -> Dict[str, Any]:
+    return {"answer": entry["answer"], "sources": list(entry["sources"]), "match": match}
+
+
+def get(app_id: str, version: Optional[str], question: str) -> Optional[Dict[str, Any]]:
+    """Exact lookup. Returns {"answer", "sources", "match"} or None."""
+    if not ENABLED:
+        return None
+    question = normalize(question)
+    with _lock:
+        state = _app_state(app_id, version)
+        entry = state["entries"].get(question)
+        if entry is not None and _expired(entry, time.time()):
+            _remove(app_id, question)
+            _stats["expirations"] += 1
+            entry = None
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        _lru.move_to_end((app_id, question))
+        _stats["exact_hits"] += 1
+        return _result(entry, "exact")
+
+
+def get_similar(app_id: str, version: Optional[str], vector: List[float]) -> Optional[Dict[str, Any]]:
+    """
+    Semantic lookup: reuse the answer of the most similar cached question of this app
+    if its cosine similarity is at least ANSWER_CACHE_SIMILARITY.
+    """
+    if not (ENABLED and SEMANTIC):
+        return None
+    query = np.asarray(vector, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    with _lock:
+        state = _app_state(app_id, version)
+        index, generation = state["index"], state["generation"]
+        if index is None:
+            items = [(q, e["vector"], e["created"]) for q, e in state["entries"].items() if e["vector"] is not None]
+
+    if index is None:
+        if not items:
+            return None
+        # Stack outside the lock; keep the result unless the app changed meanwhile
+        index = (
+            [q for q, _, _ in items],
+            np.stack([v for _, v, _ in items]),
+            np.array([c for _, _, c in items]),
+        )
+        with _lock:
+            if _apps.get(app_id) is state and state["generation"] == generation:
+                state["index"] = index
+
+    questions, matrix, created = index
+    scores = matrix @ query
+    if TTL_SECONDS > 0:
+        scores[time.time() - created > TTL_SECONDS] = -np.inf
+    best = int(np.argmax(scores))
+    if scores[best] < SIMILARITY_THRESHOLD:
+        return None
+
+    with _lock:
+        entry = state["entries"].get(questions[best])
+        if _apps.get(app_id) is not state or entry is None:
+            # Invalidated or evicted while scoring
+            return None
+        _lru.move_to_end((app_id, questions[best]))
+        _stats["semantic_hits"] += 1
+        # The exact lookup that preceded this one counted a miss
+        _stats["misses"] -= 1
+        return _result(entry, "semantic")
+
+
+def put(app_id: str, version: Optional[str], question: str, answer: str,
+        sources: List[str], vector: Optional[List[float]] = None):
+    """Store an answer; `vector` (the question embedding) enables semantic matches to it."""
+    if not ENABLED:
+        return
+    if vector is not None:
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+
+    question = normalize(question)
+    with _lock:
+        state = _app_state(app_id, version)
+        state["entries"][question] = {
+            "answer": answer,
+            "sources": list(sources),
+            "vector": vector,
+            "created": time.time(),
+        }
+        _lru[(app_id, question)] = None
+        _lru.move_to_end((app_id, question))
+        _changed(state)
+        while len(_lru) > MAX_ENTRIES:
+            evicted_app, evicted_question = next(iter(_lru))
+            _remove(evicted_app, evicted_question)
+            _stats["evictions"] += 1
+
+
+def invalidate(app_id: str):
+    """Drop every cached answer for an app."""
+    with _lock:
+        _drop_app(app_id)
+
+
+def clear():
+    """Drop every cached answer."""
+    with _lock:
+        _apps.clear()
+        _lru.clear()
+
+
+def stats() -> Dict[str, Any]:
+    """Return cache statistics."""
+    with _lock:
+        hits = _stats["exact_hits"] + _stats["semantic_hits"]
+        lookups = hits + _stats["misses"]
+        return {
+            **_stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(_lru),
+            "max_entries": MAX_ENTRIES,
+            "ttl_seconds": TTL_SECONDS,
+            "semantic": SEMANTIC,
+        }
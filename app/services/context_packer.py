@@ -0,0 +1,252 @@
+"""
+Context packing service.
+Turns retrieved chunks into the context sent to the LLM: drops duplicates, merges
+chunks that overlap (neighbouring chunks share CHUNK_OVERLAP characters), keeps them
+in relevance order and stops at a per-model token budget.
+"""
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from app.services.metrics import Histogram
+
+# Configuration
+ENABLED = os.getenv("CONTEXT_PACKING", "1") == "1"
+TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Per-model overrides, e.g. "gpt-4o=12000,gpt-3.5-turbo=3000"
+TOKEN_BUDGETS = os.getenv("CONTEXT_TOKEN_BUDGETS", "")
+# Shortest shared prefix/suffix (in characters) treated as chunk overlap
+MIN_OVERLAP_CHARS = int(os.getenv("CONTEXT_MIN_OVERLAP", "40"))
+# Word-shingle Jaccard similarity above which two chunks count as near-duplicates
+NEAR_DUPLICATE = float(os.getenv("CONTEXT_NEAR_DUPLICATE", "0.9"))
+# Don't bother appending a truncated chunk with fewer tokens left than this
+MIN_TAIL_TOKENS = 50
+
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000)
+SHINGLE_WORDS = 5
+
+_lock = threading.Lock()
+_encoders: Dict[str, Any] = {}
+_tokens_sent = Histogram(TOKEN_BUCKETS)
+_stats = {
+    "requests": 0,
+    "chunks_in": 0,
+    "chunks_out": 0,
+    "duplicates_dropped": 0,
+    "overlaps_merged": 0,
+    "chunks_over_budget": 0,
+    "tokens_in": 0,
+    "tokens_sent": 0,
+}
+
+
+def _parse_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in spec.split(","):
+        model, _, value = item.partition("=")
+        if model.strip() and value.strip():
+            budgets[model.strip()] = int(value)
+    return budgets
+
+
+_budgets = _parse_budgets(TOKEN_BUDGETS)
+
+
+def get_budget(model: Optional[str] = None) -> int:
+    """Token budget for the context sent to `model` (CONTEXT_TOKEN_BUDGETS, else CONTEXT_TOKEN_BUDGET)."""
+    return _budgets.get(model or "", TOKEN_BUDGET)
+
+
+def _get_encoder(model: Optional[str]):
+    """tiktoken encoding for `model`, or None when tiktoken isn't installed."""
+    key = model or ""
+    with _lock:
+        if key in _encoders:
+            return _encoders[key]
+    try:
+        import tiktoken
+        try:
+            encoder = tiktoken.encoding_for_model(model or "gpt-3.5-turbo")
+        except KeyError:
+            encoder = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        encoder = None
+    with _lock:
+        _encoders[key] = encoder
+    return encoder
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count tokens with tiktoken; estimates ~4 characters per token without it."""
+    encoder = _get_encoder(model)
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _truncate(text: str, tokens: int, model: Optional[str]) -> str:
+    encoder = _get_encoder(model)
+    if encoder is not None:
+        return encoder.decode(encoder.encode(text)[:tokens])
+    return text[:tokens * 4]
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text)
+    if len(words) <= SHINGLE_WORDS:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if shorter than MIN_OVERLAP_CHARS)."""
+    longest = min(len(a), len(b))
+    # The splitter trims whitespace at chunk edges, so probe with a prefix of b and
+    # confirm each candidate end position in a
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = a.find(probe, len(a) - longest)
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(probe, start + 1)
+    return 0
+
+
+def _merge(docs: List[Document]) -> Tuple[List[Document], int, int]:
+    """
+    Drop exact / contained / near-duplicate chunks and join overlapping chunks of the
+    same source. `docs` is in relevance order; a merged chunk takes the position of
+    its most relevant part. Returns (docs, duplicates dropped, overlaps merged).
+    """
+    kept: List[Document] = []
+    shingles: List[set] = []
+    dropped = merged = 0
+    for doc in docs:
+        text = doc.page_content.strip()
+        normalized = _normalize(text)
+        doc_shingles = _shingles(normalized)
+        duplicate = False
+        for i, other in enumerate(kept):
+            other_normalized = _normalize(other.page_content)
+            if normalized in other_normalized:
+                duplicate = True
+            elif other_normalized in normalized:
+                # The new chunk covers the kept one: keep the rank, take the longer text
+                kept[i] = Document(page_content=text, metadata=other.metadata)
+                shingles[i] = doc_shingles
+                duplicate = True
+            elif len(doc_shingles & shingles[i]) / max(1, len(doc_shingles | shingles[i])) >= NEAR_DUPLICATE:
+                duplicate = True
+            if duplicate:
+                break
+        if duplicate:
+            dropped += 1
+            continue
+
+        joined = False
+        source = doc.metadata.get("source")
+        for i, other in enumerate(kept):
+            if other.metadata.get("source") != source:
+                continue
+            other_text = other.page_content
+            after, before = _overlap(other_text, text), _overlap(text, other_text)
+            if after:
+                combined = other_text + text[after:]
+            elif before:
+                combined = text + other_text[before:]
+            else:
+                continue
+            kept[i] = Document(page_content=combined, metadata=other.metadata)
+            shingles[i] = _shingles(_normalize(combined))
+            merged += 1
+            joined = True
+            break
+        if not joined:
+            kept.append(Document(page_content=text, metadata=doc.metadata))
+            shingles.append(doc_shingles)
+    return kept, dropped, merged
+
+
+def pack(docs: List[Document], model: Optional[str] = None, budget: Optional[int] = None) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Build the context for one LLM request from retrieved `docs` (most relevant first).
+    Returns (packed docs, report) where the report has chunk counts and the tokens
+    retrieved vs. sent. With CONTEXT_PACKING=0 the docs are returned unchanged.
+    """
+    budget = get_budget(model) if budget is None else budget
+    tokens_in = sum(count_tokens(doc.page_content, model) for doc in docs)
+    if not ENABLED or not docs:
+        report = {"chunks_in": len(docs), "chunks_out": len(docs), "duplicates_dropped": 0,
+                  "overlaps_merged": 0, "chunks_over_budget": 0, "budget": budget,
+                  "tokens_in": tokens_in, "tokens_sent": tokens_in}
+        return docs, report
+
+    merged_docs, dropped, merged = _merge(docs)
+    # A merged chunk can bridge two kept ones; repeat until nothing joins
+    while merged and len(merged_docs) > 1:
+        merged_docs, more_dropped, more_merged = _merge(merged_docs)
+        dropped += more_dropped
+        merged += more_merged
+        if not (more_dropped or more_merged):
+            break
+
+    packed, used, over_budget = [], 0, 0
+    for doc in merged_docs:
+        remaining = budget - used
+        tokens = count_tokens(doc.page_content, model)
+        if tokens <= remaining:
+            packed.append(doc)
+            used += tokens
+            continue
+        # Later chunks are less relevant but may be small enough to still fit
+        over_budget += 1
+        if remaining >= MIN_TAIL_TOKENS or not packed:
+            # Fill what's left with the start of this chunk
+            text = _truncate(doc.page_content, max(remaining, 0), model)
+            if text:
+                packed.append(Document(page_content=text, metadata=doc.metadata))
+                used += count_tokens(text, model)
+
+    report = {
+        "chunks_in": len(docs),
+        "chunks_out": len(packed),
+        "duplicates_dropped": dropped,
+        "overlaps_merged": merged,
+        "chunks_over_budget": over_budget,
+        "budget": budget,
+        "tokens_in": tokens_in,
+        "tokens_sent": used,
+    }
+    with _lock:
+        _stats["requests"] += 1
+        for key in ("chunks_in", "chunks_out", "duplicates_dropped", "overlaps_merged",
+                    "chunks_over_budget", "tokens_in", "tokens_sent"):
+            _stats[key] += report[key]
+    _tokens_sent.observe(used)
+    return packed, report
+
+
+def stats() -> Dict[str, Any]:
+    """Return packing totals and the distribution of context tokens sent per request."""
+    with _lock:
+        totals = dict(_stats)
+    saved = totals["tokens_in"] - totals["tokens_sent"]
+    return {
+        "enabled": ENABLED,
+        "default_budget": TOKEN_BUDGET,
+        "budgets": dict(_budgets),
+        "tokenizer": "tiktoken" if _get_encoder(None) is not None else "estimate",
+        **totals,
+        "tokens_saved": saved,
+        "tokens_saved_pct": round(100 * saved / totals["tokens_in"], 1) if totals["tokens_in"] else 0.0,
+        "tokens_sent_per_request": _tokens_sent.snapshot(),
+    }
@@ -0,0 +1,239 @@
+"""
+Embedding cache service.
+Persistent, content-addressed cache of chunk embeddings keyed by (model name, chunk-text hash),
+shared across apps and retrains.
+
+Layout (under EMBED_CACHE_DIR):
+- index.db            SQLite index: (model, text_hash) -> row in the model's vector file
+- <model-slug>.f32    raw float32 rows, one embedding per row
+
+The vector file is a fixed-size slab once it reaches the size cap: new entries
+reuse the rows of the least recently used ones. Rows are reserved (and any evicted
+entries dropped) in one committed transaction before the vectors are written, and
+only referenced by new entries after the write, so a failed write can never leave
+an entry pointing at another entry's vector.
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Configuration
+CACHE_DIR = os.getenv(
+    "EMBED_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "storage", "embedding_cache")
+)
+ENABLED = os.getenv("EMBED_CACHE", "1") == "1"
+MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "1024"))
+
+_lock = threading.Lock()
+
+
+def text_hash(text: str) -> str:
+    """Content hash used as the cache key for a chunk of text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _model_slug(model_name: str) -> str:
+    return hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:16]
+
+
+def _vectors_path(model_name: str) -> str:
+    return os.path.join(CACHE_DIR, f"{_model_slug(model_name)}.f32")
+
+
+def _get_connection() -> sqlite3.Connection:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Rollback journal (not WAL) so an exclusive writer also excludes readers of the vector file
+    conn = sqlite3.connect(os.path.join(CACHE_DIR, "index.db"), timeout=30, isolation_level=None)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS models (
+            model TEXT PRIMARY KEY,
+            dim INTEGER NOT NULL,
+            next_row INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS entries (
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            row INTEGER NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_lru ON entries(model, last_used)")
+    # Rows reserved by a put that failed before its entries were committed
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS free_rows (
+            model TEXT NOT NULL,
+            row INTEGER NOT NULL,
+            PRIMARY KEY (model, row)
+        )
+    """)
+    return conn
+
+
+def _read_rows(path: str, rows: List[int], dim: int) -> List[np.ndarray]:
+    row_bytes = dim * 4
+    vectors = []
+    with open(path, "rb") as f:
+        for row in rows:
+            f.seek(row * row_bytes)
+            vectors.append(np.frombuffer(f.read(row_bytes), dtype=np.float32))
+    return vectors
+
+
+def get_many(model_name: str, hashes: List[str]) -> List[Optional[np.ndarray]]:
+    """Look up cached vectors; returns one vector (or None on a miss) per hash."""
+    if not hashes:
+        return []
+    results: List[Optional[np.ndarray]] = [None] * len(hashes)
+
+    with _lock:
+        conn = _get_connection()
+        try:
+            conn.execute("BEGIN")
+            model = conn.execute("SELECT dim FROM models WHERE model = ?", (model_name,)).fetchone()
+            path = _vectors_path(model_name)
+            if model is None or not os.path.exists(path):
+                conn.execute("COMMIT")
+                return results
+
+            found: Dict[str, int] = {}
+            unique = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                for h, row in conn.execute(
+                    f"SELECT text_hash, row FROM entries WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model_name, *batch)
+                ):
+                    found[h] = row
+
+            # Read while still inside the transaction so no writer can reuse these rows
+            hit_hashes = list(found)
+            vectors = dict(zip(hit_hashes, _read_rows(path, [found[h] for h in hit_hashes], model[0])))
+            conn.execute("COMMIT")
+
+            if hit_hashes:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model_name, h) for h in hit_hashes]
+                )
+        finally:
+            conn.close()
+
+    for i, h in enumerate(hashes):
+        results[i] = vectors.get(h)
+    return results
+
+
+def put_many(model_name: str, items: List[Tuple[str, List[float]]]):
+    """Store vectors for (text_hash, vector) pairs, evicting least recently used rows when full."""
+    items = list(dict(items).items())
+    if not items:
+        return
+    dim = len(items[0][1])
+    max_rows = max((MAX_MB * 1024 * 1024) // (dim * 4), 1)
+
+    with _lock:
+        conn = _get_connection()
+        try:
+            conn.execute("BEGIN EXCLUSIVE")
+            model = conn.execute("SELECT dim, next_row FROM models WHERE model = ?", (model_name,)).fetchone()
+            if model is None:
+                conn.execute("INSERT INTO models (model, dim, next_row) VALUES (?, ?, 0)", (model_name, dim))
+                next_row = 0
+            elif model[0] != dim:
+                raise ValueError(f"Embedding dimension changed for {model_name}: {model[0]} -> {dim}")
+            else:
+                next_row = model[1]
+
+            # Skip entries another writer stored meanwhile
+            existing = set()
+            for i in range(0, len(items), 500):
+                batch = [h for h, _ in items[i:i + 500]]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(r[0] for r in conn.execute(
+                    f"SELECT text_hash FROM entries WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model_name, *batch)
+                ))
+            items = [(h, v) for h, v in items if h not in existing][:max_rows]
+
+            # Reuse rows freed by failed puts, append new rows until the cap, then take over
+            # the rows of the least recently used entries
+            rows = [r[0] for r in conn.execute(
+                "SELECT row FROM free_rows WHERE model = ? LIMIT ?", (model_name, len(items))
+            )]
+            conn.executemany("DELETE FROM free_rows WHERE model = ? AND row = ?", [(model_name, r) for r in rows])
+            fresh = min(len(items) - len(rows), max_rows - next_row)
+            rows.extend(range(next_row, next_row + fresh))
+            needed = len(items) - len(rows)
+            if needed:
+                evicted = conn.execute(
+                    "SELECT text_hash, row FROM entries WHERE model = ? ORDER BY last_used LIMIT ?",
+                    (model_name, needed)
+                ).fetchall()
+                conn.executemany(
+                    "DELETE FROM entries WHERE model = ? AND text_hash = ?",
+                    [(model_name, h) for h, _ in evicted]
+                )
+                rows.extend(row for _, row in evicted)
+            items = items[:len(rows)]
+            conn.execute("UPDATE models SET next_row = ? WHERE model = ?", (next_row + fresh, model_name))
+            # Commit the reservation before touching the file: the reserved rows are now
+            # unreferenced, so overwriting them cannot corrupt any entry
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            conn.close()
+            raise
+
+        try:
+            path = _vectors_path(model_name)
+            row_bytes = dim * 4
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                for row, (_, vector) in zip(rows, items):
+                    f.seek(row * row_bytes)
+                    f.write(np.asarray(vector, dtype=np.float32).tobytes())
+
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (model, text_hash, row, last_used) VALUES (?, ?, ?, ?)",
+                [(model_name, h, row, now) for row, (h, _) in zip(rows, items)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # Hand the reserved rows to the next put instead of leaking them
+            conn.executemany(
+                "INSERT OR IGNORE INTO free_rows (model, row) VALUES (?, ?)",
+                [(model_name, r) for r in rows]
+            )
+            raise
+        finally:
+            conn.close()
+
+
+def stats() -> Dict[str, int]:
+    """Return entry count and on-disk size of the cache."""
+    conn = _get_connection()
+    try:
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    finally:
+        conn.close()
+    size = sum(
+        os.path.getsize(os.path.join(CACHE_DIR, name))
+        for name in os.listdir(CACHE_DIR)
+        if os.path.isfile(os.path.join(CACHE_DIR, name))
+    )
+    return {"entries": entries, "bytes": size, "max_mb": MAX_MB}
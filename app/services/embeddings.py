@@ -0,0 +1,137 @@
+"""
+Embedding provider service.
+Loads each embedding model once per process and shares it between indexing and RAG.
+"""
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+# Default embedding model (same as existing config)
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+WARMUP_ON_STARTUP = os.getenv("EMBED_WARMUP", "1") == "1"
+# Process pool for bulk (training) encoding; 0 or 1 encodes in-process
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+# Torch threads per encoding process (0 = let torch decide / split cores between workers)
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+
+_models: Dict[str, HuggingFaceEmbeddings] = {}
+_models_lock = threading.Lock()
+_load_locks: Dict[str, threading.Lock] = {}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _set_torch_threads(threads: int):
+    if threads <= 0:
+        return
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _get_load_lock(model_name: str) -> threading.Lock:
+    """Get the per-model lock used to serialize the first load of a model."""
+    with _models_lock:
+        lock = _load_locks.get(model_name)
+        if lock is None:
+            lock = threading.Lock()
+            _load_locks[model_name] = lock
+        return lock
+
+
+def get_embeddings(model_name: Optional[str] = None) -> HuggingFaceEmbeddings:
+    """
+    Get the shared embedding model instance.
+    The model is loaded on first use; concurrent callers wait for that single load.
+    """
+    model_name = model_name or EMBED_MODEL
+
+    embedding = _models.get(model_name)
+    if embedding is not None:
+        return embedding
+
+    with _get_load_lock(model_name):
+        # Another thread may have finished loading while we waited
+        embedding = _models.get(model_name)
+        if embedding is None:
+            print(f"[EMBED] Loading embedding model: {model_name}")
+            _set_torch_threads(EMBED_THREADS)
+            embedding = HuggingFaceEmbeddings(model_name=model_name)
+            with _models_lock:
+                _models[model_name] = embedding
+            print(f"[OK] Embedding model loaded: {model_name}")
+    return embedding
+
+
+def warmup(model_name: Optional[str] = None):
+    """Load the model and run one encode so the first request doesn't pay for it."""
+    embedding = get_embeddings(model_name)
+    embedding.embed_query("warmup")
+
+
+def loaded_models() -> list:
+    """Return the names of models currently loaded in this process."""
+    with _models_lock:
+        return list(_models.keys())
+
+
+def unload(model_name: Optional[str] = None):
+    """Drop a loaded model (or all models) so it can be garbage collected."""
+    with _models_lock:
+        if model_name is None:
+            _models.clear()
+        else:
+            _models.pop(model_name, None)
+
+
+# ============== Multi-process encoding ==============
+
+def _init_worker(model_name: str, threads: int):
+    """Process pool initializer: pin torch threads and load the model once per worker."""
+    global EMBED_THREADS
+    EMBED_THREADS = threads
+    get_embeddings(model_name)
+
+
+def encode_batch(model_name: str, texts: List[str]) -> List[List[float]]:
+    """Encode one batch of documents (runs in-process or in a pool worker)."""
+    return get_embeddings(model_name).embed_documents(texts)
+
+
+def get_process_pool(model_name: Optional[str] = None) -> Optional[ProcessPoolExecutor]:
+    """
+    Get the shared encoding process pool, or None when EMBED_WORKERS <= 1.
+    Workers are started once (spawn, so they don't inherit server threads) and reused.
+    """
+    global _pool
+    if EMBED_WORKERS <= 1:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            model_name = model_name or EMBED_MODEL
+            threads = EMBED_THREADS or max(1, (os.cpu_count() or 1) // EMBED_WORKERS)
+            print(f"[EMBED] Starting {EMBED_WORKERS} encoding worker(s), {threads} thread(s) each")
+            _pool = ProcessPoolExecutor(
+                max_workers=EMBED_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_name, threads),
+            )
+        return _pool
+
+
+def shutdown_process_pool():
+    """Stop the encoding worker processes."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
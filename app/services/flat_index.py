@@ -0,0 +1,379 @@
+"""
+Flat vector index.
+A minimal vector store for small and medium apps: normalized embeddings in a
+memory-mapped .npy file plus a JSON sidecar with chunk ids, text and metadata.
+Search is an exact dot-product top-k; MMR runs with NumPy over the fetch_k candidates.
+
+Vectors can be stored compactly (float16, or int8 with a per-row scale) to cut the
+memory a hot index needs. Compact indexes also keep the float32 vectors on disk, used
+to rebuild the index and, when rerank is on, to re-score the top candidates exactly.
+
+Layout (one directory per app):
+- current.json      {"generation": "gen-..."}: the live generation, swapped in atomically
+- gen-<id>/         one complete, immutable index written by persist():
+  - vectors.npy       search matrix, one L2-normalized row per chunk (float32, float16 or int8)
+  - scales.npy        int8 only: float32 scale per row (row = int8 values * scale)
+  - vectors_f32.npy   compact indexes only: the float32 rows
+  - chunks.json       {"count", "dtype", "rerank", "ids", "documents", "metadatas"} in row order
+"""
+import json
+import os
+import shutil
+import uuid
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+FULL_VECTORS_FILE = "vectors_f32.npy"
+CHUNKS_FILE = "chunks.json"
+CURRENT_FILE = "current.json"
+GENERATION_PREFIX = "gen-"
+# Attempts to open an index whose generation is replaced (and removed) mid-open
+OPEN_ATTEMPTS = 3
+
+DTYPES = ("float32", "float16", "int8")
+# With rerank, this many times k candidates are re-scored with float32 vectors
+RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+# Rows scored per step; bounds the float32 working copy of a compact matrix
+SCORE_BLOCK_ROWS = 16384
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Convert normalized float32 rows to `dtype`; returns (matrix, per-row scales or None)."""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127 if len(vectors) else np.zeros(0, dtype=np.float32)
+        scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales
+    return np.ascontiguousarray(vectors, dtype=np.float32), None
+
+
+def _index_dir(persist_directory: str) -> Optional[str]:
+    """Directory of the current generation, or None if nothing was persisted."""
+    try:
+        with open(os.path.join(persist_directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return os.path.join(persist_directory, json.load(f)["generation"])
+    except FileNotFoundError:
+        return None
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def mmr(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Maximal marginal relevance over normalized candidate vectors.
+    Returns positions into `candidates`, in selection order.
+    """
+    if len(candidates) == 0 or k <= 0:
+        return []
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[:, selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, similarity[:, best], out=redundancy)
+    return selected
+
+
+class FlatVectorStore(VectorStore):
+    """
+    Exact-search vector store over a memory-mapped matrix.
+    Opened read-only (memory-mapped) for chat; pass writable=True to load it into memory
+    for upsert()/delete(), then persist() to replace the files on disk.
+    `dtype` and `rerank` apply when persisting; a read-only store uses what was persisted.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings, writable: bool = False,
+                 dtype: str = "float32", rerank: bool = False):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype '{dtype}' (expected one of: {', '.join(DTYPES)})")
+        self.persist_directory = persist_directory
+        self._embedding = embedding_function
+        self._writable = writable
+        self.dtype = dtype
+        self.rerank = rerank
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[dict] = []
+        # Writable: float32 rows in memory. Read-only: the (memory-mapped) search matrix,
+        # its int8 scales, and the float32 rows of a compact index.
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._scales: Optional[np.ndarray] = None
+        self._full: Optional[np.ndarray] = None
+        self._sidecar_bytes = 0
+
+        if self.exists(persist_directory):
+            self._load(writable)
+
+    def _load(self, writable: bool):
+        for attempt in range(OPEN_ATTEMPTS):
+            directory = _index_dir(self.persist_directory)
+            if directory is None:
+                # Cleared since exists() was checked: open empty, as for a missing index
+                return
+            try:
+                return self._load_from(directory, writable)
+            except FileNotFoundError:
+                # persist() swapped in a new generation and removed this one mid-open
+                if attempt == OPEN_ATTEMPTS - 1:
+                    raise
+
+    def _load_from(self, directory: str, writable: bool):
+        def _file(name: str) -> str:
+            return os.path.join(directory, name)
+
+        with open(_file(CHUNKS_FILE), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        stored_dtype = sidecar.get("dtype", "float32")
+        mmap_mode = None if writable else "r"
+
+        if writable:
+            # Rebuild from full-precision rows; dtype/rerank come from the caller
+            source = FULL_VECTORS_FILE if stored_dtype != "float32" else VECTORS_FILE
+            vectors = np.load(_file(source)).astype(np.float32, copy=False)
+        else:
+            self.dtype = stored_dtype
+            self.rerank = bool(sidecar.get("rerank", False))
+            vectors = np.load(_file(VECTORS_FILE), mmap_mode=mmap_mode)
+            if stored_dtype == "int8":
+                self._scales = np.load(_file(SCALES_FILE))
+            if stored_dtype != "float32":
+                self._full = np.load(_file(FULL_VECTORS_FILE), mmap_mode=mmap_mode)
+
+        if len(vectors) != sidecar["count"]:
+            raise ValueError(f"Flat index at {self.persist_directory} is inconsistent; rebuild it")
+        self._sidecar_bytes = os.path.getsize(_file(CHUNKS_FILE))
+        self._ids = sidecar["ids"]
+        self._documents = sidecar["documents"]
+        self._metadatas = sidecar["metadatas"]
+        self._vectors = vectors
+
+    @staticmethod
+    def exists(persist_directory: str) -> bool:
+        return _index_dir(persist_directory) is not None
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def matrix_bytes(self) -> int:
+        """Bytes of the search matrix and int8 scales, i.e. what scoring pages in."""
+        scales = self._scales.nbytes if self._scales is not None else 0
+        return int(self._vectors.nbytes) + scales
+
+    def resident_bytes(self) -> int:
+        """
+        Approximate memory a hot index needs: the search matrix (and int8 scales) plus
+        the chunk text and metadata. The float32 rows of a compact index are left out;
+        only the few candidate rows used for rerank / MMR are ever read.
+        """
+        return self.matrix_bytes() + self._sidecar_bytes
+
+    # ---------- Writes ----------
+
+    def _require_writable(self):
+        if not self._writable:
+            raise RuntimeError("FlatVectorStore was opened read-only")
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        self._require_writable()
+        remove = set(ids or [])
+        keep = [i for i, chunk_id in enumerate(self._ids) if chunk_id not in remove]
+        if len(keep) == len(self._ids):
+            return True
+        self._ids = [self._ids[i] for i in keep]
+        self._documents = [self._documents[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._vectors = self._vectors[keep]
+        return True
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]],
+               metadatas: List[dict], documents: List[str]):
+        """Add rows, replacing any existing rows with the same ids."""
+        self._require_writable()
+        if not ids:
+            return
+        self.delete(ids=ids)
+        vectors = _normalize(embeddings)
+        if len(self._vectors) == 0:
+            self._vectors = vectors
+        else:
+            if vectors.shape[1] != self._vectors.shape[1]:
+                raise ValueError(f"Embedding dimension changed: {self._vectors.shape[1]} -> {vectors.shape[1]}")
+            self._vectors = np.concatenate([self._vectors, vectors])
+        self._ids.extend(ids)
+        self._documents.extend(documents)
+        self._metadatas.extend(metadata or {} for metadata in metadatas)
+
+    def persist(self):
+        """
+        Write the index to disk (in self.dtype) as a new generation, then switch to it
+        by atomically replacing current.json. Readers see either the old index or the
+        new one, never a mix; those that already opened the old one keep their
+        memory maps (by inode) after its files are removed.
+        """
+        self._require_writable()
+        os.makedirs(self.persist_directory, exist_ok=True)
+        vectors = np.ascontiguousarray(self._vectors, dtype=np.float32)
+        matrix, scales = quantize(vectors, self.dtype)
+
+        generation = f"{GENERATION_PREFIX}{uuid.uuid4().hex[:12]}"
+        directory = os.path.join(self.persist_directory, generation)
+        os.makedirs(directory)
+        np.save(os.path.join(directory, VECTORS_FILE), matrix)
+        if scales is not None:
+            np.save(os.path.join(directory, SCALES_FILE), scales)
+        if self.dtype != "float32":
+            np.save(os.path.join(directory, FULL_VECTORS_FILE), vectors)
+        with open(os.path.join(directory, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "count": len(self._ids),
+                "dtype": self.dtype,
+                "rerank": self.rerank,
+                "ids": self._ids,
+                "documents": self._documents,
+                "metadatas": self._metadatas,
+            }, f)
+
+        current_tmp = os.path.join(self.persist_directory, f"{CURRENT_FILE}.{generation}.tmp")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation}, f)
+        os.replace(current_tmp, os.path.join(self.persist_directory, CURRENT_FILE))
+
+        # Drop older generations
+        for name in os.listdir(self.persist_directory):
+            if name.startswith(GENERATION_PREFIX) and name != generation:
+                shutil.rmtree(os.path.join(self.persist_directory, name), ignore_errors=True)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        self.upsert(ids, self._embedding.embed_documents(texts), metadatas or [{} for _ in texts], texts)
+        self.persist()
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   persist_directory: Optional[str] = None, **kwargs: Any) -> "FlatVectorStore":
+        if not persist_directory:
+            raise ValueError("persist_directory is required")
+        store = cls(persist_directory, embedding, writable=True)
+        store.add_texts(texts, metadatas, ids=kwargs.get("ids"))
+        return store
+
+    # ---------- Search ----------
+
+    def _document(self, row: int) -> Document:
+        return Document(page_content=self._documents[row], metadata=dict(self._metadatas[row]))
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """Approximate scores of every row for normalized query rows (shape: rows x queries)."""
+        if self.dtype == "float32" or self._writable:
+            scores = np.asarray(self._vectors @ queries.T, dtype=np.float32)
+        else:
+            scores = np.empty((len(self._vectors), len(queries)), dtype=np.float32)
+            for start in range(0, len(self._vectors), SCORE_BLOCK_ROWS):
+                block = np.asarray(self._vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+                scores[start:start + len(block)] = block @ queries.T
+        if self._scales is not None:
+            scores *= self._scales[:, None]
+        return scores
+
+    def _rows(self, rows) -> np.ndarray:
+        """Float32 vectors of the given rows (exact when full-precision rows are kept)."""
+        source = self._full if self._full is not None else self._vectors
+        vectors = np.asarray(source[rows], dtype=np.float32)
+        if self._full is None and self._scales is not None:
+            vectors = vectors * self._scales[rows][:, None]
+        return vectors
+
+    def _rank(self, query: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Top k rows for one query; with rerank, candidates are re-scored in float32."""
+        if self.rerank and self._full is not None:
+            candidates = _top_k(scores, k * max(RERANK_FACTOR, 1))
+            exact = self._rows(candidates) @ query
+            return [(int(candidates[i]), float(exact[i])) for i in _top_k(exact, k)]
+        return [(int(row), float(scores[row])) for row in _top_k(scores, k)]
+
+    def _search(self, embedding: List[float], k: int) -> List[Tuple[int, float]]:
+        if not self._ids:
+            return []
+        query = _normalize(embedding)
+        return self._rank(query, self._scores(query[None, :])[:, 0], k)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Return (document, cosine similarity) pairs, most similar first."""
+        return [(self._document(row), score) for row, score in self._search(self._embedding.embed_query(query), k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [self._document(row) for row, _ in self._search(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        candidates = [row for row, _ in self._search(embedding, fetch_k)]
+        if not candidates:
+            return []
+        picked = mmr(_normalize(embedding), self._rows(candidates), k, lambda_mult)
+        return [self._document(candidates[i]) for i in picked]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k, fetch_k, lambda_mult
+        )
+
+    def batch_search(self, embeddings: List[List[float]], k: int, fetch_k: Optional[int] = None,
+                     lambda_mult: float = 0.5) -> List[List[Document]]:
+        """
+        Search many queries with one matrix product.
+        With fetch_k, each query's top fetch_k candidates are re-ranked with MMR.
+        """
+        if not self._ids or not embeddings:
+            return [[] for _ in embeddings]
+        queries = _normalize(embeddings)
+        scores = self._scores(queries)
+        results = []
+        for i, query in enumerate(queries):
+            ranked = [row for row, _ in self._rank(query, scores[:, i], fetch_k or k)]
+            if fetch_k and ranked:
+                ranked = [ranked[j] for j in mmr(query, self._rows(ranked), k, lambda_mult)]
+            results.append([self._document(row) for row in ranked])
+        return results
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities already
+        return lambda score: score
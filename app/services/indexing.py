@@ -1,56 +1,190 @@
 """
 Indexing service for building vector databases.
-Handles document loading, chunking, embedding, and Chroma persistence.
+Handles document loading, chunking, embedding, and vector store persistence
+(Chroma, or the flat NumPy index selected per app).
 """
 import os
+import hashlib
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
 from datetime import datetime
-from typing import List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from app.services.storage import get_files_dir, get_chroma_dir, get_all_file_paths, clear_chroma_dir
-from app.db import update_app_status, get_files_for_app
+from app.services.storage import (
+    get_files_dir, get_chroma_dir, get_flat_index_dir, get_all_file_paths,
+    clear_chroma_dir, clear_flat_index_dir, compute_file_hash_from_path
+)
+from app.services.embeddings import get_embeddings, encode_batch, get_process_pool, EMBED_MODEL, EMBED_WORKERS
+from app.services import vector_cache, embedding_cache, metrics
+from app.services.loaders import load_file
+from app.services.flat_index import FlatVectorStore, DTYPES as VECTOR_DTYPES
+from app.db import (
+    get_app, update_app_status, get_files_for_app,
+    get_indexed_files, set_indexed_file, delete_indexed_file, delete_indexed_files_for_app
+)
 
-# Embedding model (same as existing config)
-EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 CHUNK_SIZE = 800
 CHUNK_OVERLAP = 120
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# Document parsing processes (0 = one per CPU core, 1 = parse in-process)
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "0"))
+# Per-file parse timeout in seconds (0 = no limit)
+LOAD_TIMEOUT = int(os.getenv("LOAD_TIMEOUT", "120"))
 
+# Vector store backend for apps that don't choose one: "chroma" or "flat"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_BACKENDS = ("chroma", "flat")
+# Flat backend only: stored vector precision ("float32", "float16", "int8") and
+# whether to re-score the top candidates with float32 vectors
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+VECTOR_RERANK = os.getenv("VECTOR_RERANK", "0") == "1"
 
-def load_documents(app_id: str) -> List:
-    """Load all documents for an app."""
-    file_paths = get_all_file_paths(app_id)
+# Prometheus instruments (GET /metrics)
+TRAIN_BUCKETS_SECONDS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+TRAIN_STAGE_SECONDS = metrics.histogram(
+    "rag_train_stage_seconds",
+    "Training duration per stage (delete, load, chunk, embed, persist)",
+    ["stage"],
+    buckets=TRAIN_BUCKETS_SECONDS,
+)
+TRAIN_CHUNKS = metrics.counter("rag_train_chunks_total", "Chunks embedded and stored by training", ["app"])
+TRAIN_CHUNKS_PER_SECOND = metrics.histogram(
+    "rag_train_chunks_per_second",
+    "Chunk throughput of the embed + persist stages per training run",
+    buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000),
+)
+
+# Progress callback: progress(stage, **info), e.g. progress("embedding", chunks_embedded=512)
+ProgressCallback = Callable[..., None]
+
+
+def _no_progress(stage: str, **info):
+    pass
+
+
+def get_vector_backend(app_id: str) -> str:
+    """Return the vector store backend an app uses (its own setting or VECTOR_BACKEND)."""
+    app = get_app(app_id) or {}
+    backend = app.get("vector_backend") or VECTOR_BACKEND
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector backend '{backend}' (expected one of: {', '.join(VECTOR_BACKENDS)})")
+    return backend
+
+
+def get_vector_precision(app_id: str) -> Tuple[str, bool]:
+    """Return (dtype, rerank) for an app's flat index (its own settings or the defaults)."""
+    app = get_app(app_id) or {}
+    dtype = app.get("vector_dtype") or VECTOR_DTYPE
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype '{dtype}' (expected one of: {', '.join(VECTOR_DTYPES)})")
+    rerank = app.get("vector_rerank")
+    return dtype, VECTOR_RERANK if rerank is None else bool(rerank)
+
+
+def get_index_dir(app_id: str, backend: str) -> str:
+    """Directory holding an app's index for the given backend."""
+    return get_flat_index_dir(app_id) if backend == "flat" else get_chroma_dir(app_id)
+
+
+def open_vector_store(app_id: str, backend: str, embedding, writable: bool = False):
+    """
+    Open an app's vector store. `writable` only matters for the flat backend,
+    which is memory-mapped read-only unless it is being rebuilt (and then
+    persisted with the app's current precision settings).
+    """
+    if backend == "flat":
+        if not writable:
+            return FlatVectorStore(get_flat_index_dir(app_id), embedding)
+        dtype, rerank = get_vector_precision(app_id)
+        return FlatVectorStore(get_flat_index_dir(app_id), embedding, writable=True, dtype=dtype, rerank=rerank)
+    return Chroma(persist_directory=get_chroma_dir(app_id), embedding_function=embedding)
+
+
+def _load_in_pool(file_paths: List[str], on_loaded: Callable[[int, List, Optional[str]], None]):
+    """
+    Parse files in a process pool. Results are delivered in input order; a file that
+    crashes its worker or exceeds LOAD_TIMEOUT is reported as an error instead of
+    failing or stalling the run.
+    """
+    workers = min(LOAD_WORKERS or (os.cpu_count() or 1), len(file_paths))
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    timed_out = False
+    try:
+        futures = [pool.submit(load_file, path, LOAD_TIMEOUT) for path in file_paths]
+        for i, future in enumerate(futures):
+            try:
+                docs, error = future.result(timeout=(LOAD_TIMEOUT + 5) if LOAD_TIMEOUT else None)
+            except FuturesTimeout:
+                timed_out = True
+                docs, error = [], f"timed out after {LOAD_TIMEOUT}s"
+                print(f"[ERR] Error loading {file_paths[i]}: {error}")
+            except Exception as e:
+                # e.g. BrokenProcessPool when a parser crashes its worker
+                docs, error = [], f"loader worker failed: {e or type(e).__name__}"
+                print(f"[ERR] Error loading {file_paths[i]}: {error}")
+            on_loaded(i, docs, error)
+    finally:
+        pool.shutdown(wait=not timed_out, cancel_futures=True)
+        if timed_out:
+            # Stuck parsers would otherwise keep running after the run finishes
+            for process in list(getattr(pool, "_processes", {}).values()):
+                process.terminate()
+
+
+def load_documents(app_id: str, progress: Optional[ProgressCallback] = None,
+                   file_paths: Optional[List[str]] = None) -> Tuple[List, Dict[str, str]]:
+    """
+    Load documents for an app (all files, or only `file_paths` if given).
+    PDF-heavy runs are parsed in parallel worker processes (LOAD_WORKERS); documents
+    are always returned in file path order so the index is reproducible.
+    Returns (documents, {file path: error} for files that could not be loaded).
+    """
+    progress = progress or _no_progress
+    if file_paths is None:
+        file_paths = get_all_file_paths(app_id)
+        if not file_paths:
+            raise ValueError(f"No files found for app '{app_id}'. Please upload files first.")
+    file_paths = sorted(file_paths)
     
-    if not file_paths:
-        raise ValueError(f"No files found for app '{app_id}'. Please upload files first.")
+    results: List[List] = [[] for _ in file_paths]
+    errors: Dict[str, str] = {}
+    failed_at: Dict[int, str] = {}
+    loaded = 0
+    progress("loading", files_total=len(file_paths), files_loaded=0, files_failed=0)
     
-    all_docs = []
-    for file_path in file_paths:
-        try:
-            # Determine loader based on extension
-            ext = os.path.splitext(file_path)[1].lower()
-            
-            if ext in [".txt", ".md"]:
-                loader = TextLoader(file_path, encoding="utf-8")
-                docs = loader.load()
-                all_docs.extend(docs)
-                print(f"[LOAD] Loaded: {os.path.basename(file_path)}")
-            elif ext == ".pdf":
-                # Requires `pypdf` (see requirements.txt)
-                loader = PyPDFLoader(file_path)
-                docs = loader.load()
-                all_docs.extend(docs)
-                print(f"[LOAD] Loaded PDF: {os.path.basename(file_path)} ({len(docs)} page(s))")
-            else:
-                print(f"[SKIP] Skipping unsupported file: {os.path.basename(file_path)}")
-                
-        except Exception as e:
-            print(f"[ERR] Error loading {file_path}: {e}")
+    def _on_loaded(i: int, docs: List, error: Optional[str]):
+        nonlocal loaded
+        loaded += 1
+        results[i] = docs
+        if error:
+            errors[os.path.basename(file_paths[i])] = error
+            failed_at[i] = error
+        progress("loading", files_total=len(file_paths), files_loaded=loaded,
+                 files_failed=len(errors), errors=errors)
+    
+    # Spawning workers only pays off for CPU-bound parsing (PDFs) across several files.
+    # The in-process timeout relies on SIGALRM, which only works on the main thread;
+    # training runs on a worker thread, so PDFs there always go through the pool
+    # when a timeout is set, even a single file.
+    has_pdf = any(p.lower().endswith(".pdf") for p in file_paths)
+    parallel = LOAD_WORKERS != 1 and len(file_paths) > 1
+    needs_timeout = LOAD_TIMEOUT > 0 and threading.current_thread() is not threading.main_thread()
+    if has_pdf and (parallel or needs_timeout):
+        _load_in_pool(file_paths, _on_loaded)
+    else:
+        for i, file_path in enumerate(file_paths):
+            docs, error = load_file(file_path, LOAD_TIMEOUT)
+            _on_loaded(i, docs, error)
     
-    return all_docs
+    if errors:
+        print(f"[WARN] {len(errors)} file(s) could not be loaded: {', '.join(errors)}")
+    failed = {file_paths[i]: error for i, error in failed_at.items()}
+    return [doc for docs in results for doc in docs], failed
 
 
 def chunk_documents(docs: List) -> List:
@@ -66,65 +200,250 @@ def chunk_documents(docs: List) -> List:
     return chunks
 
 
-def build_index(app_id: str) -> Tuple[int, int]:
+def embed_texts(texts: List[str], progress: Optional[ProgressCallback] = None) -> Tuple[List[List[float]], Dict[str, int]]:
     """
-    Build/rebuild vector index for an app.
-    Returns (num_docs, num_chunks).
+    Embedding stage: encode texts in batches of EMBED_BATCH_SIZE.
+    Cached vectors are reused; the rest are encoded in-process or fanned out to the
+    encoding process pool (EMBED_WORKERS). Both paths encode exactly the same
+    batches, so results are identical.
+    Returns (vectors in input order, {"hits": ..., "misses": ...}).
     """
+    progress = progress or _no_progress
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    
+    hashes = [embedding_cache.text_hash(t) for t in texts]
+    if embedding_cache.ENABLED:
+        try:
+            for i, vector in enumerate(embedding_cache.get_many(EMBED_MODEL, hashes)):
+                if vector is not None:
+                    vectors[i] = vector.tolist()
+        except Exception as e:
+            print(f"[WARN] Embedding cache lookup failed: {e}")
+    
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    cache_stats = {"hits": len(texts) - len(missing), "misses": len(missing)}
+    batches = [missing[i:i + EMBED_BATCH_SIZE] for i in range(0, len(missing), EMBED_BATCH_SIZE)]
+    
+    pool = get_process_pool(EMBED_MODEL) if len(batches) > 1 else None
+    if pool is not None:
+        results = (f.result() for f in [
+            pool.submit(encode_batch, EMBED_MODEL, [texts[i] for i in batch]) for batch in batches
+        ])
+    else:
+        results = (encode_batch(EMBED_MODEL, [texts[i] for i in batch]) for batch in batches)
+    
+    start = time.perf_counter()
+    done = 0
+    for batch, batch_vectors in zip(batches, results):
+        for i, vector in zip(batch, batch_vectors):
+            vectors[i] = vector
+        if embedding_cache.ENABLED:
+            try:
+                embedding_cache.put_many(EMBED_MODEL, [(hashes[i], vectors[i]) for i in batch])
+            except Exception as e:
+                print(f"[WARN] Embedding cache store failed: {e}")
+        
+        done += len(batch)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        rate = done / elapsed
+        progress(
+            "embedding",
+            chunks_total=len(missing),
+            chunks_embedded=done,
+            chunks_per_sec=round(rate, 1),
+            eta_seconds=round((len(missing) - done) / rate, 1),
+            cache_hits=cache_stats["hits"],
+        )
+    
+    elapsed = time.perf_counter() - start
+    if missing:
+        print(
+            f"[EMBED] Encoded {len(missing)} chunks in {elapsed:.1f}s "
+            f"({len(missing) / max(elapsed, 1e-9):.1f} chunks/s, "
+            f"{f'{EMBED_WORKERS} worker processes' if pool else 'in-process'}, "
+            f"batch={EMBED_BATCH_SIZE})"
+        )
+    print(f"[EMBED] Embedding cache: {cache_stats['hits']} hit(s), {cache_stats['misses']} miss(es)")
+    return vectors, cache_stats
+
+
+def persist_chunks(vectordb, chunks: List, ids: List[str], vectors: List[List[float]]):
+    """Add pre-embedded chunks to the vector store (Chroma: in batches)."""
+    if isinstance(vectordb, FlatVectorStore):
+        vectordb.upsert(ids, vectors, [c.metadata for c in chunks], [c.page_content for c in chunks])
+        vectordb.persist()
+        return
+    
+    collection = vectordb._collection
+    for i in range(0, len(chunks), EMBED_BATCH_SIZE):
+        batch = chunks[i:i + EMBED_BATCH_SIZE]
+        collection.upsert(
+            ids=ids[i:i + EMBED_BATCH_SIZE],
+            embeddings=vectors[i:i + EMBED_BATCH_SIZE],
+            metadatas=[c.metadata for c in batch],
+            documents=[c.page_content for c in batch],
+        )
+
+
+def _current_file_hashes(app_id: str) -> Dict[str, str]:
+    """Map each file on disk to its content hash (from upload metadata when available)."""
+    known = {}
+    # Newest upload first, so a re-uploaded file path maps to its latest hash
+    for row in get_files_for_app(app_id):
+        if row.get("file_hash"):
+            known.setdefault(row["file_path"], row["file_hash"])
+    
+    hashes = {}
+    for file_path in get_all_file_paths(app_id):
+        hashes[file_path] = known.get(file_path) or compute_file_hash_from_path(file_path)
+    return hashes
+
+
+def _chunk_ids(file_path: str, file_hash: str, count: int) -> List[str]:
+    """Deterministic chunk IDs for one version of a file."""
+    prefix = hashlib.sha1(f"{file_path}:{file_hash}".encode("utf-8")).hexdigest()[:16]
+    return [f"{prefix}-{i}" for i in range(count)]
+
+
+def build_index(app_id: str, progress: Optional[ProgressCallback] = None,
+                full: bool = False) -> Dict[str, Any]:
+    """
+    Build or incrementally update the vector index for an app.
+    Only new or changed files (by content hash) are embedded; vectors of removed
+    or replaced files are deleted. A full rebuild happens when `full` is set or
+    there is no usable existing index.
+    `progress` (optional) is called as progress(stage, **info) while the build runs.
+    Returns counts of documents, chunks and files added/removed/skipped.
+    """
+    progress = progress or _no_progress
     print(f"\n[INDEX] Starting indexing for app: {app_id}")
     
     try:
         # Update status to INDEXING
         update_app_status(app_id, "INDEXING")
+        backend = get_vector_backend(app_id)
+        if backend == "flat":
+            dtype, rerank = get_vector_precision(app_id)
+            print(f"[INDEX] Flat index: dtype={dtype} rerank={'on' if rerank else 'off'}")
+        
+        current = _current_file_hashes(app_id)
+        if not current:
+            raise ValueError(f"No files found for app '{app_id}'. Please upload files first.")
         
-        # Clear existing Chroma DB (clean rebuild)
-        clear_chroma_dir(app_id)
+        indexed = get_indexed_files(app_id)
+        if full or not indexed or not index_exists(app_id, backend):
+            # Clean rebuild; also drops an index left over from another backend
+            clear_chroma_dir(app_id)
+            clear_flat_index_dir(app_id)
+            delete_indexed_files_for_app(app_id)
+            indexed = {}
+        
+        to_add = [p for p, h in current.items() if indexed.get(p, {}).get("file_hash") != h]
+        to_remove = [p for p in indexed if p not in current or p in to_add]
+        skipped = [p for p in current if p not in to_add]
+        print(f"[INDEX] Files: {len(to_add)} to add, {len(to_remove)} to remove, {len(skipped)} unchanged")
+        progress("planning", files_added=len(to_add), files_removed=len(to_remove), files_skipped=len(skipped))
+        
+        vectordb = open_vector_store(app_id, backend, get_embeddings(EMBED_MODEL), writable=True)
+        
+        # Delete vectors of removed or replaced files
+        with TRAIN_STAGE_SECONDS.time("delete"):
+            for file_path in to_remove:
+                chunk_ids = indexed[file_path]["chunk_ids"]
+                if chunk_ids:
+                    vectordb.delete(ids=chunk_ids)
+                delete_indexed_file(app_id, file_path)
         
         # Load documents
-        docs = load_documents(app_id)
+        with TRAIN_STAGE_SECONDS.time("load"):
+            docs, failed = load_documents(app_id, progress, file_paths=to_add) if to_add else ([], {})
         # Drop docs with no extractable text (common with scanned/image-only PDFs)
         docs = [d for d in docs if getattr(d, "page_content", "").strip()]
-        if not docs:
+        if not docs and not skipped:
             raise ValueError(
                 "No text could be extracted from the uploaded documents. "
                 "If you're indexing scanned/image-only PDFs, run OCR first and upload the OCR'd text/PDF."
             )
         
         # Chunk documents
-        chunks = chunk_documents(docs)
-        if not chunks:
+        progress("chunking", documents=len(docs))
+        with TRAIN_STAGE_SECONDS.time("chunk"):
+            chunks = chunk_documents(docs) if docs else []
+        if not chunks and not skipped:
             raise ValueError("No text chunks could be created from the uploaded documents.")
+        progress("chunking", documents=len(docs), chunks=len(chunks))
         
-        # Create embeddings
-        print(f"[EMBED] Creating embeddings with {EMBED_MODEL}...")
-        embedding = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+        # Group chunks per file so each file version gets its own chunk IDs
+        chunks_by_file: Dict[str, List] = {p: [] for p in to_add}
+        for chunk in chunks:
+            chunks_by_file.setdefault(chunk.metadata.get("source"), []).append(chunk)
+        ordered_chunks, ordered_ids = [], []
+        for file_path, file_chunks in chunks_by_file.items():
+            ordered_chunks.extend(file_chunks)
+            ordered_ids.extend(_chunk_ids(file_path, current.get(file_path, ""), len(file_chunks)))
         
-        # Build and persist Chroma DB
-        chroma_dir = get_chroma_dir(app_id)
-        vectordb = Chroma.from_documents(
-            documents=chunks,
-            embedding=embedding,
-            persist_directory=chroma_dir
-        )
+        # Create embeddings (reusing cached vectors of identical chunk text from any app)
+        cache_stats = {"hits": 0, "misses": 0}
+        vectors: List[List[float]] = []
+        started = time.perf_counter()
+        if ordered_chunks:
+            print(f"[EMBED] Creating embeddings with {EMBED_MODEL}...")
+            with TRAIN_STAGE_SECONDS.time("embed"):
+                vectors, cache_stats = embed_texts([c.page_content for c in ordered_chunks], progress)
+        
+        # Persist to the vector store
+        progress("persisting", chunks=len(ordered_chunks))
+        with TRAIN_STAGE_SECONDS.time("persist"):
+            persist_chunks(vectordb, ordered_chunks, ordered_ids, vectors)
+        if ordered_chunks:
+            TRAIN_CHUNKS.inc(metrics.bounded_label("app", app_id), amount=len(ordered_chunks))
+            TRAIN_CHUNKS_PER_SECOND.observe(len(ordered_chunks) / max(time.perf_counter() - started, 1e-9))
+        # Files that failed to load get no record, so the next train retries them
+        offset = 0
+        for file_path, file_chunks in chunks_by_file.items():
+            if file_path in current and file_path not in failed:
+                set_indexed_file(app_id, file_path, current[file_path],
+                                 ordered_ids[offset:offset + len(file_chunks)])
+            offset += len(file_chunks)
+        
+        # Chats opened during the build must not keep serving the old index
+        vector_cache.invalidate(app_id)
         
-        # Update status to READY
-        now = datetime.utcnow().isoformat()
-        update_app_status(app_id, "READY", last_indexed_at=now)
+        # Update status to READY (last_indexed_at only moves when the index changed)
+        if to_add or to_remove:
+            now = datetime.utcnow().isoformat()
+            update_app_status(app_id, "READY", last_indexed_at=now)
+        else:
+            update_app_status(app_id, "READY")
         
-        print(f"[OK] Index built for app: {app_id}")
+        print(f"[OK] Index built for app: {app_id} (backend={backend})")
         print(f"   Docs: {len(docs)} | Chunks: {len(chunks)}")
         
-        return len(docs), len(chunks)
+        return {
+            "documents": len(docs),
+            "chunks": len(chunks),
+            "files_added": len(to_add),
+            "files_removed": len([p for p in to_remove if p not in current]),
+            "files_replaced": len([p for p in to_remove if p in current]),
+            "files_skipped": len(skipped),
+            "files_failed": len(failed),
+            "embedding_cache_hits": cache_stats["hits"],
+            "embedding_cache_misses": cache_stats["misses"],
+        }
         
     except Exception as e:
-        # Update status to FAILED
+        # Update status to FAILED; the index may be partially updated, so rebuild fully next time
         update_app_status(app_id, "FAILED")
+        delete_indexed_files_for_app(app_id)
         print(f"[ERR] Indexing failed for app {app_id}: {e}")
         raise
 
 
-def index_exists(app_id: str) -> bool:
-    """Check if a Chroma index exists for an app."""
+def index_exists(app_id: str, backend: Optional[str] = None) -> bool:
+    """Check if an index exists for an app (for its configured backend by default)."""
+    backend = backend or get_vector_backend(app_id)
+    if backend == "flat":
+        return FlatVectorStore.exists(get_flat_index_dir(app_id))
     chroma_dir = get_chroma_dir(app_id)
     # Check if chroma.sqlite3 exists (Chroma's persistence file)
     return os.path.exists(os.path.join(chroma_dir, "chroma.sqlite3"))
@@ -0,0 +1,179 @@
+"""
+Background job service.
+Runs training (indexing) outside the HTTP request and records progress in the jobs table.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from app import db
+from app.services import indexing, metrics
+
+# Configuration
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", "1"))
+RESUME_ON_STARTUP = os.getenv("TRAIN_RESUME_ON_STARTUP", "1") == "1"
+# Seconds a running job stays claimed without renewal; renewed every third of that
+LEASE_SECONDS = float(os.getenv("TRAIN_JOB_LEASE", "60"))
+
+JOB_TYPE_TRAIN = "train"
+
+_pool = ThreadPoolExecutor(max_workers=TRAIN_WORKERS, thread_name_prefix="train")
+_counts = {"queued": 0, "running": 0}
+_counts_lock = threading.Lock()
+_owner: Optional[Tuple[int, str]] = None
+_heartbeat: Optional[threading.Thread] = None
+_heartbeat_lock = threading.Lock()
+
+TRAIN_JOBS = metrics.counter("rag_train_jobs_total", "Finished training jobs by result", ["result"])
+TRAIN_JOB_SECONDS = metrics.histogram(
+    "rag_train_job_seconds", "Training job duration, queue wait excluded",
+    buckets=indexing.TRAIN_BUCKETS_SECONDS,
+)
+
+
+def _get_owner() -> str:
+    """Identity of this process in jobs.owner ("host:pid:token"; new token after a fork)."""
+    global _owner
+    if _owner is None or _owner[0] != os.getpid():
+        _owner = (os.getpid(), f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+    return _owner[1]
+
+
+def _owner_is_dead(owner: Optional[str]) -> bool:
+    """True if `owner` is known to be gone: a process on this host that no longer exists."""
+    if not owner:
+        return True
+    host, _, rest = owner.partition(":")
+    pid, _, _ = rest.partition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        # Same PID as this process but a different token: a previous incarnation
+        return owner != _get_owner()
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def _renew_leases():
+    """Keep this process's running jobs claimed while they run."""
+    while True:
+        time.sleep(LEASE_SECONDS / 3)
+        try:
+            db.renew_job_leases(_get_owner(), LEASE_SECONDS)
+        except Exception as e:
+            print(f"[WARN] Renewing training job leases failed: {e}")
+
+
+def _start_heartbeat():
+    global _heartbeat
+    with _heartbeat_lock:
+        if _heartbeat is None or not _heartbeat.is_alive():
+            _heartbeat = threading.Thread(target=_renew_leases, name="train-lease", daemon=True)
+            _heartbeat.start()
+
+
+def _submit(job_id: str, app_id: str):
+    _start_heartbeat()
+    with _counts_lock:
+        _counts["queued"] += 1
+    _pool.submit(_run_training, job_id, app_id)
+
+
+def enqueue_training(app_id: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Queue a training job for an app.
+    Returns (job, created). If the app already has a queued or running training
+    job, that job is returned instead and created is False.
+    """
+    while True:
+        job = db.create_job(uuid.uuid4().hex, app_id, JOB_TYPE_TRAIN)
+        if job:
+            break
+        existing = db.get_active_job(app_id, JOB_TYPE_TRAIN)
+        if existing:
+            print(f"[JOB] Training already queued for app: {app_id} (job {existing['job_id']})")
+            return existing, False
+        # The active job finished between the two queries; try again
+
+    _submit(job["job_id"], app_id)
+    print(f"[JOB] Queued training for app: {app_id} (job {job['job_id']})")
+    return job, True
+
+
+def _run_training(job_id: str, app_id: str):
+    """Run one training job, recording per-stage progress."""
+    # Several workers may have queued the same job (e.g. all resuming at startup);
+    # only the one that claims it in the database runs it
+    if not db.claim_job(job_id, _get_owner(), LEASE_SECONDS):
+        with _counts_lock:
+            _counts["queued"] -= 1
+        print(f"[JOB] Training job {job_id} was claimed by another worker; skipping")
+        return
+    with _counts_lock:
+        _counts["queued"] -= 1
+        _counts["running"] += 1
+    started = time.perf_counter()
+    outcome = "failed"
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    def report(stage: str, **info):
+        stages[stage] = {**stages.get(stage, {}), **info}
+        db.update_job(job_id, stage=stage, progress=stages)
+
+    try:
+        result = indexing.build_index(app_id, progress=report)
+        db.update_job(job_id, status="SUCCEEDED", stage="done", result=result)
+        outcome = "succeeded"
+        print(f"[JOB] Training finished for app: {app_id} (job {job_id})")
+    except Exception as e:
+        db.update_job(job_id, status="FAILED", error=str(e))
+        print(f"[JOB] Training failed for app: {app_id} (job {job_id}): {e}")
+    finally:
+        with _counts_lock:
+            _counts["running"] -= 1
+        TRAIN_JOBS.inc(outcome)
+        TRAIN_JOB_SECONDS.observe(time.perf_counter() - started)
+
+
+def resume_unfinished_jobs():
+    """
+    Queue unfinished jobs here: queued ones (whichever worker claims them first runs
+    them) and running ones whose owner has exited or stopped renewing its lease.
+    Jobs still held by a live worker are left alone.
+    """
+    now = datetime.utcnow().isoformat()
+    for job in db.get_unfinished_jobs():
+        if job["job_type"] != JOB_TYPE_TRAIN:
+            continue
+        if not db.get_app(job["app_id"]):
+            db.update_job(job["job_id"], status="FAILED", error="App no longer exists")
+            continue
+        if job["status"] == "RUNNING":
+            lease_expired = (job.get("lease_expires_at") or "") < now
+            if not (lease_expired or _owner_is_dead(job.get("owner"))):
+                continue
+            if not db.requeue_job(job):
+                continue  # Another worker re-queued (or finished) it first
+        _submit(job["job_id"], job["app_id"])
+        print(f"[JOB] Resumed training for app: {job['app_id']} (job {job['job_id']})")
+
+
+def stats() -> Dict[str, Any]:
+    """Return training jobs waiting for and holding a training worker."""
+    with _counts_lock:
+        return {"workers": TRAIN_WORKERS, **_counts}
+
+
+def shutdown():
+    """Stop accepting jobs; running jobs are left to finish (or resume on next start)."""
+    _pool.shutdown(wait=False)
@@ -1,36 +1,144 @@
 """
 LLM adapter service.
 Provides pluggable LLM interface with OpenAI and fallback options.
+
+OpenAI clients are long-lived: one HTTP connection pool per configuration, shared by
+a ChatOpenAI per (model, temperature). `.env` is re-read only when its mtime changes
+(checked at most every LLM_CONFIG_CHECK_INTERVAL seconds) or on reload_config().
 """
+import asyncio
 import os
-from typing import List, Optional
-from dotenv import load_dotenv
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from dotenv import dotenv_values, find_dotenv
+
+# Configuration (process-level; model/key settings below are read from the reloadable env)
+CONFIG_CHECK_INTERVAL = float(os.getenv("LLM_CONFIG_CHECK_INTERVAL", "2"))
+REQUEST_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+# Simulated per-call latency of the mock LLM (for offline load testing)
+MOCK_LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", "0"))
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+# Variables set in the real environment win over .env (as with load_dotenv(override=False))
+_process_env = frozenset(os.environ)
+_env_state: Dict[str, Any] = {"path": None, "mtime": None, "loaded": {}, "checked_at": float("-inf")}
+_lock = threading.Lock()
+# Shared openai clients (sync, async) and ChatOpenAI per (model, temperature)
+_openai_clients: Optional[Tuple[Any, Any]] = None
+_chat_models: Dict[Tuple[str, float], Any] = {}
+_stats = {"config_loads": 0, "clients_created": 0}
+
 
-# Load environment variables (.env) at import, but also re-check env at runtime.
-load_dotenv()
+def _reset_clients():
+    """Drop cached clients so the next get_llm() uses the current config. Caller holds _lock."""
+    global _openai_clients
+    _openai_clients = None
+    _chat_models.clear()
+
+
+def _refresh_env(force: bool = False) -> bool:
+    """Re-read .env if it changed on disk. Returns True if the config was (re)loaded."""
+    now = time.monotonic()
+    if not force and now - _env_state["checked_at"] < CONFIG_CHECK_INTERVAL:
+        return False
+
+    with _lock:
+        _env_state["checked_at"] = now
+        path = _env_state["path"] or find_dotenv()
+        try:
+            mtime = os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            mtime = None
+        if not force and path == _env_state["path"] and mtime == _env_state["mtime"]:
+            return False
+
+        values = dotenv_values(path) if mtime is not None else {}
+        for key in _env_state["loaded"]:
+            if key not in values:
+                os.environ.pop(key, None)
+        loaded = {}
+        for key, value in values.items():
+            if key in _process_env or value is None:
+                continue
+            os.environ[key] = value
+            loaded[key] = value
+
+        _env_state.update(path=path, mtime=mtime, loaded=loaded)
+        _stats["config_loads"] += 1
+        _reset_clients()
+    if not (os.getenv("OPENAI_API_KEY") or "").strip():
+        print("[WARN] OPENAI_API_KEY not found. Using mock LLM fallback.")
+    return True
+
+
+def reload_config():
+    """Re-read .env now and rebuild LLM clients on next use."""
+    _refresh_env(force=True)
 
 
 def _get_openai_api_key() -> str:
-    """
-    Read the OpenAI API key from environment at runtime.
-    This avoids 'stale' values if the env var is set after process start.
-    """
-    # Re-load .env if present; does not override existing env vars by default.
-    load_dotenv()
+    """Read the OpenAI API key from the (reloadable) environment."""
+    _refresh_env()
     return (os.getenv("OPENAI_API_KEY") or "").strip()
 
 
+def _get_openai_clients(api_key: str):
+    """Shared openai clients (one keep-alive connection pool each). Caller holds _lock."""
+    global _openai_clients
+    if _openai_clients is None:
+        import httpx
+        import openai
+        limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+        params = {
+            "api_key": api_key,
+            "organization": os.getenv("OPENAI_ORG_ID") or os.getenv("OPENAI_ORGANIZATION") or None,
+            "base_url": os.getenv("OPENAI_API_BASE") or None,
+            "timeout": REQUEST_TIMEOUT,
+            "max_retries": MAX_RETRIES,
+        }
+        _openai_clients = (
+            openai.OpenAI(http_client=httpx.Client(limits=limits, timeout=REQUEST_TIMEOUT), **params),
+            openai.AsyncOpenAI(http_client=httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT), **params),
+        )
+    return _openai_clients
+
+
 class MockLLM:
     """
     Mock LLM fallback that constructs answers from retrieved chunks.
     Used when OPENAI_API_KEY is not available.
+    `latency_ms` (default MOCK_LLM_LATENCY_MS) simulates the wait on a real API call,
+    blocking in generate()/invoke() and non-blocking in ainvoke().
     """
     
+    def __init__(self, latency_ms: Optional[float] = None):
+        self.latency = (MOCK_LATENCY_MS if latency_ms is None else latency_ms) / 1000
+    
     def __call__(self, prompt: str) -> str:
         return self.generate(prompt)
     
     def generate(self, prompt: str) -> str:
         """Generate a response based on the prompt (simple extraction)."""
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return self._answer(prompt)
+    
+    def invoke(self, prompt: str, **kwargs) -> str:
+        # kwargs (e.g. timeout) are accepted for ChatOpenAI compatibility and ignored
+        return self.generate(prompt)
+    
+    async def ainvoke(self, prompt: str, **kwargs) -> str:
+        """Awaitable generate(): the simulated latency doesn't hold a thread."""
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+    
+    def _answer(self, prompt: str) -> str:
         # Extract context from prompt if available
         if "Context:" in prompt and "Question:" in prompt:
             context_start = prompt.find("Context:") + len("Context:")
@@ -42,25 +150,48 @@ class MockLLM:
                 return f"Based on the documents: {context[:500]}..."
         
         return "I found some relevant information but need an LLM to generate a proper response. Please configure OPENAI_API_KEY."
+    
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield the generated response word by word, like a streaming LLM."""
+        for piece in re.findall(r"\S+\s*", self.generate(prompt)):
+            yield piece
+
+
+_mock_llm = MockLLM()
 
 
-def get_llm():
+def get_llm(model: Optional[str] = None, temperature: Optional[float] = None):
     """
     Get the appropriate LLM based on configuration.
-    Returns ChatOpenAI if API key exists, otherwise MockLLM.
+    Returns a cached ChatOpenAI if API key exists, otherwise MockLLM.
+    `model` / `temperature` override OPENAI_MODEL / OPENAI_TEMPERATURE (e.g. per app);
+    every override shares the same connection pool.
     """
     api_key = _get_openai_api_key()
-    if api_key:
-        print("[LLM] Using OpenAI ChatGPT")
-        from langchain_community.chat_models import ChatOpenAI
-        return ChatOpenAI(
-            model_name="gpt-3.5-turbo",
-            temperature=0,
-            openai_api_key=api_key
-        )
-    else:
-        print("[WARN] OPENAI_API_KEY not found. Using mock LLM fallback.")
-        return MockLLM()
+    if not api_key:
+        return _mock_llm
+
+    model = model or os.getenv("OPENAI_MODEL") or DEFAULT_MODEL
+    if temperature is None:
+        temperature = float(os.getenv("OPENAI_TEMPERATURE") or 0)
+    key = (model, float(temperature))
+
+    with _lock:
+        llm = _chat_models.get(key)
+        if llm is None:
+            from langchain_community.chat_models import ChatOpenAI
+            sync_client, async_client = _get_openai_clients(api_key)
+            llm = ChatOpenAI(
+                model_name=model,
+                temperature=temperature,
+                openai_api_key=api_key,
+                client=sync_client.chat.completions,
+                async_client=async_client.chat.completions,
+            )
+            _chat_models[key] = llm
+            _stats["clients_created"] += 1
+            print(f"[LLM] Using OpenAI ChatGPT (model={model}, temperature={temperature})")
+    return llm
 
 
 def has_openai_key() -> bool:
@@ -72,3 +203,18 @@ def get_llm_mode() -> str:
     """Return the current LLM mode: 'openai' or 'mock'."""
     return "openai" if has_openai_key() else "mock"
 
+
+def stats() -> Dict[str, Any]:
+    """Return LLM client registry statistics."""
+    with _lock:
+        return {
+            **_stats,
+            "mode": "openai" if (os.getenv("OPENAI_API_KEY") or "").strip() else "mock",
+            "env_file": _env_state["path"] or None,
+            "chat_models": [{"model": m, "temperature": t} for m, t in _chat_models],
+        }
+
+
+# Load environment variables (.env) at import
+_refresh_env(force=True)
+
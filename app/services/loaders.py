@@ -0,0 +1,63 @@
+"""
+Document loader service.
+Parses a single uploaded file into LangChain documents. Kept free of app/DB imports
+so it can run cheaply inside loader worker processes.
+"""
+import os
+import signal
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from langchain_community.document_loaders import TextLoader, PyPDFLoader
+
+
+@contextmanager
+def _time_limit(seconds: int):
+    """Raise TimeoutError after `seconds` (Unix main thread only; otherwise a no-op)."""
+    can_alarm = (
+        seconds > 0
+        and hasattr(signal, "SIGALRM")
+        and threading.current_thread() is threading.main_thread()
+    )
+    if not can_alarm:
+        yield
+        return
+
+    def _timeout(signum, frame):
+        raise TimeoutError(f"timed out after {seconds}s")
+
+    previous = signal.signal(signal.SIGALRM, _timeout)
+    signal.alarm(seconds)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def load_file(file_path: str, timeout: int = 0) -> Tuple[List, Optional[str]]:
+    """
+    Load one file. Never raises: returns (docs, error) so a bad file can't fail a run.
+    `timeout` (seconds, 0 = none) is enforced in-process where signals allow it.
+    """
+    name = os.path.basename(file_path)
+    try:
+        with _time_limit(timeout):
+            # Determine loader based on extension
+            ext = os.path.splitext(file_path)[1].lower()
+
+            if ext in [".txt", ".md"]:
+                docs = TextLoader(file_path, encoding="utf-8").load()
+                print(f"[LOAD] Loaded: {name}")
+            elif ext == ".pdf":
+                # Requires `pypdf` (see requirements.txt)
+                docs = PyPDFLoader(file_path).load()
+                print(f"[LOAD] Loaded PDF: {name} ({len(docs)} page(s))")
+            else:
+                print(f"[SKIP] Skipping unsupported file: {name}")
+                docs = []
+        return docs, None
+    except Exception as e:
+        print(f"[ERR] Error loading {file_path}: {e}")
+        return [], str(e) or type(e).__name__
@@ -0,0 +1,207 @@
+"""
+Metrics primitives.
+Small thread-safe instruments used by the services to report distributions, and a
+registry of labeled counters / histograms rendered in the Prometheus text format.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Default latency buckets in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Prometheus convention is seconds
+LATENCY_BUCKETS_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Distinct values kept per bounded label (e.g. app ids); the rest share OTHER_LABEL
+MAX_LABEL_VALUES = int(os.getenv("METRICS_MAX_APPS", "100"))
+OTHER_LABEL = "_other"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class Histogram:
+    """Cumulative bucketed histogram (Prometheus style: each bucket counts values <= its bound)."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self, precision: int = 3) -> Dict[str, Any]:
+        """Return {"buckets": {bound: cumulative count}, "count", "sum"}."""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = {}
+        running = 0
+        for bound, n in zip(list(self.buckets) + ["+Inf"], counts):
+            running += n
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "count": count, "sum": round(total, precision)}
+
+
+_bounded_values: Dict[str, set] = {}
+_bounded_lock = threading.Lock()
+
+
+def bounded_label(kind: str, value: str, limit: Optional[int] = None) -> str:
+    """
+    Label value with bounded cardinality: the first `limit` (METRICS_MAX_APPS) distinct
+    values of `kind` are kept, later ones are reported as OTHER_LABEL.
+    """
+    limit = MAX_LABEL_VALUES if limit is None else limit
+    with _bounded_lock:
+        seen = _bounded_values.setdefault(kind, set())
+        if value in seen:
+            return value
+        if len(seen) < limit:
+            seen.add(value)
+            return value
+    return OTHER_LABEL
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in values]
+        return lines
+
+
+class HistogramFamily:
+    """One Histogram per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS_SECONDS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children: Dict[Tuple[str, ...], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *labels: str) -> Histogram:
+        child = self._children.get(labels)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labels, Histogram(self.buckets))
+        return child
+
+    def observe(self, value: float, *labels: str):
+        self.labels(*labels).observe(value)
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the duration of the `with` block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.labels(*labels).observe(time.perf_counter() - start)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            children = sorted(self._children.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, child in children:
+            snapshot = child.snapshot(precision=6)
+            for bound, count in snapshot["buckets"].items():
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (le,))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(snapshot['sum'])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {snapshot['count']}")
+        return lines
+
+
+# Samples of a scrape-time metric: (labels, value)
+Samples = Iterable[Tuple[Dict[str, str], float]]
+# A collector returns (name, type, help, samples) tuples read from service stats
+Collector = Callable[[], Iterable[Tuple[str, str, str, Samples]]]
+
+_registry: List[Any] = []
+_collectors: List[Collector] = []
+_registry_lock = threading.Lock()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    """Create and register a counter."""
+    instrument = Counter(name, help, labelnames)
+    with _registry_lock:
+        _registry.append(instrument)
+    return instrument
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS_SECONDS) -> HistogramFamily:
+    """Create and register a (labeled) histogram."""
+    instrument = HistogramFamily(name, help, labelnames, buckets)
+    with _registry_lock:
+        _registry.append(instrument)
+    return instrument
+
+
+def register_collector(collector: Collector):
+    """Register a function called on every scrape (for gauges read from service stats)."""
+    with _registry_lock:
+        _collectors.append(collector)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render() -> str:
+    """All registered instruments and collectors in the Prometheus text exposition format."""
+    with _registry_lock:
+        instruments, collectors = list(_registry), list(_collectors)
+    lines: List[str] = []
+    for instrument in instruments:
+        lines += instrument.collect()
+    for collector in collectors:
+        try:
+            families = list(collector())
+        except Exception as e:
+            print(f"[WARN] Metrics collector failed: {e}")
+            continue
+        for name, kind, help, samples in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
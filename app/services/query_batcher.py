@@ -0,0 +1,146 @@
+"""
+Query embedding batcher.
+Collects questions from concurrent chat requests (across all apps) for a short
+window and encodes them in one model call instead of many batch-of-one calls.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.services.embeddings import get_embeddings, EMBED_MODEL
+from app.services.metrics import Histogram
+
+# Configuration
+ENABLED = os.getenv("EMBED_QUERY_BATCHING", "1") == "1"
+# How long the first question of a batch waits for others to join
+WINDOW_MS = float(os.getenv("EMBED_QUERY_WINDOW_MS", "2"))
+MAX_BATCH = int(os.getenv("EMBED_QUERY_MAX_BATCH", "32"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class QueryBatcher:
+    """Background thread that encodes queued queries in batches for one model."""
+
+    def __init__(self, model_name: str, window_ms: float = WINDOW_MS, max_batch: int = MAX_BATCH):
+        self.model_name = model_name
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.wait_ms = Histogram()    # enqueue -> batch starts encoding
+        self.encode_ms = Histogram()  # one model call per batch
+        self.total_ms = Histogram()   # enqueue -> vector returned
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="query-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def embed(self, text: str) -> List[float]:
+        """Encode one query; blocks until its batch has been encoded."""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future.result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                vectors = get_embeddings(self.model_name).embed_documents([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            self.batch_sizes.observe(len(batch))
+            self.encode_ms.observe((finished - started) * 1000)
+            for (_, future, queued), vector in zip(batch, vectors):
+                self.wait_ms.observe((started - queued) * 1000)
+                self.total_ms.observe((finished - queued) * 1000)
+                future.set_result(vector)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "pending": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_ms": self.wait_ms.snapshot(),
+            "encode_ms": self.encode_ms.snapshot(),
+            "total_ms": self.total_ms.snapshot(),
+        }
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embeddings adapter for vector stores: queries go through the shared batcher,
+    documents go straight to the model.
+    """
+
+    def __init__(self, batcher: QueryBatcher):
+        self.batcher = batcher
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_embeddings(self.batcher.model_name).embed_documents(texts)
+
+
+_batchers: Dict[str, QueryBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(model_name: Optional[str] = None) -> QueryBatcher:
+    """Get the process-wide batcher for a model."""
+    model_name = model_name or EMBED_MODEL
+    with _batchers_lock:
+        batcher = _batchers.get(model_name)
+        if batcher is None:
+            batcher = _batchers[model_name] = QueryBatcher(model_name)
+        return batcher
+
+
+def get_query_embeddings(model_name: Optional[str] = None) -> Embeddings:
+    """
+    Embeddings to use for answering queries: batched when EMBED_QUERY_BATCHING is on,
+    otherwise the shared model itself.
+    """
+    if not ENABLED:
+        return get_embeddings(model_name)
+    return BatchedEmbeddings(get_batcher(model_name))
+
+
+def stats() -> Dict[str, Any]:
+    """Return per-model batch size and latency histograms."""
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+    return {"enabled": ENABLED, "models": {b.model_name: b.stats() for b in batchers}}
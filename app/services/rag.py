@@ -2,17 +2,24 @@
 RAG (Retrieval-Augmented Generation) service.
 Handles chat logic, vector DB loading, and retrieval.
 """
+import asyncio
 import os
-from typing import Dict, Any, List, Optional
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, Iterator, List, Optional
 
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.chains import RetrievalQA
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain.chains.question_answering import load_qa_chain
 from langchain.prompts import PromptTemplate
 
-from app.services.storage import get_chroma_dir
+from app.services import vector_cache, answer_cache, context_packer, metrics
+from app.services.query_batcher import get_query_embeddings
 from app.services.llm import get_llm, has_openai_key, get_llm_mode
-from app.services.indexing import index_exists, EMBED_MODEL
+from app.services.indexing import index_exists, get_vector_backend, get_index_dir, open_vector_store
+from app.services.flat_index import FlatVectorStore
+from app.services.embeddings import get_embeddings, EMBED_MODEL
 from app.db import get_app
 
 # Configuration
@@ -20,8 +27,33 @@ TOP_K = int(os.getenv("RAG_K", "6"))
 FETCH_K = int(os.getenv("RAG_FETCH_K", "25"))
 MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.5"))
 SEARCH_TYPE = os.getenv("RAG_SEARCH_TYPE", "mmr")  # "mmr" or "similarity"
-CHAIN_TYPE = os.getenv("RAG_CHAIN_TYPE", "refine")  # "refine" or "stuff"
+# "stuff" (one LLM call), "refine" (RAG_K sequential calls) or "map_reduce". Refine
+# used to fail validation and fall back to stuff, so stuff stays the default.
+CHAIN_TYPE = os.getenv("RAG_CHAIN_TYPE", "stuff")
+# map_reduce: concurrent per-chunk calls per answer, timeout per call (seconds), and
+# threads shared by the per-chunk calls of all answers
+MAP_CONCURRENCY = int(os.getenv("RAG_MAP_CONCURRENCY", "6"))
+MAP_TIMEOUT = float(os.getenv("RAG_MAP_TIMEOUT", "20"))
+MAP_WORKERS = int(os.getenv("RAG_MAP_WORKERS", "32"))
 ENABLE_MULTI_QUERY = os.getenv("RAG_MULTIQUERY", "0") == "1"
+# Batch chat: max questions per request, concurrent LLM calls per batch, and
+# threads for those calls shared by all batches
+BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX", "100"))
+BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "4"))
+BATCH_WORKERS = int(os.getenv("CHAT_BATCH_WORKERS", "16"))
+
+# Prometheus instruments (GET /metrics)
+CHAT_STAGE_SECONDS = metrics.histogram(
+    "rag_chat_stage_seconds",
+    "Chat latency per stage (app_lookup, vector_store_open, query_embed, retrieve, llm)",
+    ["stage"],
+)
+CHAT_REQUESTS = metrics.counter("rag_chat_requests_total", "Chat questions by app and result", ["app", "result"])
+
+# Per-chunk LLM calls of map_reduce answers (shared, so load can't multiply threads)
+_map_pool = ThreadPoolExecutor(max_workers=max(1, MAP_WORKERS), thread_name_prefix="rag-map")
+# Per-question LLM calls of batch chats (shared, so concurrent batches can't multiply threads)
+_batch_pool = ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS), thread_name_prefix="chat-batch")
 
 
 # Custom prompt template for app-specific answers
@@ -67,20 +99,44 @@ Refined answer:""",
     )
 
 
+def get_map_prompt_template(app_name: str) -> PromptTemplate:
+    """Per-chunk prompt used for the 'map_reduce' chain type."""
+    return PromptTemplate(
+        template=f"""You are a helpful assistant for the {app_name} system.
+Extract the facts from the document excerpt below that help answer the question.
+Quote names, numbers and steps exactly. If nothing in the excerpt is relevant, reply with exactly: NONE
+
+Excerpt:
+{{context}}
+
+Question: {{question}}
+
+Relevant facts:""",
+        input_variables=["context", "question"],
+    )
+
+
 def load_vector_db(app_id: str):
-    """Load the persisted Chroma vector DB for an app."""
-    chroma_dir = get_chroma_dir(app_id)
+    """Load the persisted vector store for an app (cached across requests)."""
+    backend = get_vector_backend(app_id)
+    index_dir = get_index_dir(app_id, backend)
     
-    if not index_exists(app_id):
+    if not index_exists(app_id, backend):
         raise ValueError(f"No index found for app '{app_id}'. Please train first.")
     
-    embedding = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
-    vectordb = Chroma(
-        persist_directory=chroma_dir,
-        embedding_function=embedding
-    )
+    def _open():
+        # Queries from concurrent requests are encoded together by the batcher
+        return open_vector_store(app_id, backend, get_query_embeddings(EMBED_MODEL))
     
-    return vectordb
+    closer = None
+    if backend == "chroma":
+        closer = lambda _: vector_cache.release_chroma_client(index_dir)
+    return vector_cache.get_or_open(app_id, index_dir, _open, closer=closer)
+
+
+def _get_app_llm(app: Dict[str, Any]):
+    """Get the (shared) LLM client with the app's model/temperature overrides."""
+    return get_llm(app.get("llm_model"), app.get("llm_temperature"))
 
 
 def _make_retriever(vectordb, llm):
@@ -109,124 +165,341 @@ def _make_retriever(vectordb, llm):
     return base
 
 
-def chat(app_id: str, message: str) -> Dict[str, Any]:
+def _retrieve(vectordb, llm, message: str, query_vector: Optional[List[float]] = None) -> List[Document]:
+    """
+    Retrieve documents for one question with the same settings as _make_retriever(),
+    embedding the question separately (or reusing `query_vector` from the semantic cache
+    lookup) so query embedding and vector search are timed as their own stages.
+    """
+    if has_openai_key() and ENABLE_MULTI_QUERY:
+        # MultiQueryRetriever generates and embeds its own queries
+        with CHAT_STAGE_SECONDS.time("retrieve"):
+            return _make_retriever(vectordb, llm).invoke(message)
+
+    if query_vector is None:
+        query_vector = _embed_query(message)
+    with CHAT_STAGE_SECONDS.time("retrieve"):
+        if SEARCH_TYPE == "similarity":
+            return vectordb.similarity_search_by_vector(query_vector, k=TOP_K)
+        return vectordb.max_marginal_relevance_search_by_vector(
+            query_vector, k=TOP_K, fetch_k=FETCH_K, lambda_mult=MMR_LAMBDA
+        )
+
+
+def check_app_ready(app_id: str):
+    """
+    Validate that an app exists and is trained.
+    Returns (app, error) where error is None if the app can be chatted with.
+    """
+    app = get_app(app_id)
+    if not app:
+        return None, f"App '{app_id}' not found"
+    if app["status"] != "READY":
+        return app, f"App '{app_id}' is not trained yet. Status: {app['status']}"
+    return app, None
+
+
+def _source_filenames(docs) -> List[str]:
+    """Extract unique source filenames from retrieved documents."""
+    sources = []
+    for doc in docs:
+        source = doc.metadata.get("source", "unknown")
+        filename = os.path.basename(source)
+        if filename not in sources:
+            sources.append(filename)
+    return sources
+
+
+def _count(app_id: str, result: str):
+    """Count one question; unknown app ids share a label so they can't grow the metrics."""
+    app = metrics.OTHER_LABEL if result == "not_found" else metrics.bounded_label("app", app_id)
+    CHAT_REQUESTS.inc(app, result)
+
+
+def _count_unready(app_id: str, app: Optional[Dict[str, Any]]):
+    _count(app_id, "not_found" if app is None else "not_ready")
+
+
+def _cache_version(app: Dict[str, Any]) -> str:
+    """Cached answers are only valid for this index and these LLM settings."""
+    return f"{app.get('last_indexed_at')}|{app.get('llm_model')}|{app.get('llm_temperature')}"
+
+
+def _cached_response(cached: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "answer": cached["answer"],
+        "sources": cached["sources"],
+        "error": None,
+        "cached": cached["match"],
+    }
+
+
+def get_cached_answer(app_id: str, message: str) -> Optional[Dict[str, Any]]:
+    """
+    Return a chat() result for an exact answer-cache hit, or None.
+    Cheap enough to run before dispatching to the chat pool (off the event loop: the
+    app lookup may query SQLite).
+    """
+    app, error = check_app_ready(app_id)
+    if error:
+        return None
+    cached = answer_cache.get(app_id, _cache_version(app), message)
+    if not cached:
+        return None
+    _count(app_id, "cache_exact")
+    return _cached_response(cached)
+
+
+def _embed_query(message: str) -> List[float]:
+    with CHAT_STAGE_SECONDS.time("query_embed"):
+        return get_query_embeddings(EMBED_MODEL).embed_query(message)
+
+
+def _lookup_similar(app: Dict[str, Any], message: str):
+    """
+    Semantic answer-cache lookup. Returns (cached, query_vector); the vector is
+    stored with the new answer on a miss. Both are None when semantic mode is off.
+    """
+    if not (answer_cache.ENABLED and answer_cache.SEMANTIC):
+        return None, None
+    vector = _embed_query(message)
+    return answer_cache.get_similar(app["app_id"], _cache_version(app), vector), vector
+
+
+def _llm_text(result) -> str:
+    # Chat models return messages; completion models and MockLLM return strings
+    return getattr(result, "content", result)
+
+
+def _pack_context(llm, docs: List[Document]) -> List[Document]:
+    """Dedup, order and trim retrieved chunks to the model's context token budget."""
+    docs, report = context_packer.pack(docs, getattr(llm, "model_name", None))
+    print(
+        f"[RAG] context: {report['chunks_in']}->{report['chunks_out']} chunk(s) "
+        f"({report['duplicates_dropped']} duplicate, {report['overlaps_merged']} merged), "
+        f"{report['tokens_in']}->{report['tokens_sent']} tokens (budget {report['budget']})"
+    )
+    return docs
+
+
+def _map_reduce(llm, app_name: str, message: str, docs, prompt: PromptTemplate) -> str:
+    """
+    Extract relevant facts from each chunk with concurrent LLM calls, then answer once
+    from the collected facts. Up to RAG_MAP_CONCURRENCY calls per answer run on the
+    shared map pool; each call gets RAG_MAP_TIMEOUT seconds from when it starts (also
+    passed to the LLM client, so abandoned calls don't linger). Calls that fail or time
+    out are dropped; the answer uses whatever came back (all failing raises).
+    """
+    map_prompt = get_map_prompt_template(app_name)
+    prompts = iter(enumerate(map_prompt.format(context=doc.page_content, question=message) for doc in docs))
+    results: List[Optional[str]] = [None] * len(docs)
+    started: Dict[int, float] = {}
+    running = {}
+
+    def _extract(i: int, text: str):
+        started[i] = time.monotonic()
+        return llm.invoke(text, timeout=MAP_TIMEOUT)
+
+    def _submit_next():
+        for i, text in prompts:
+            running[_map_pool.submit(_extract, i, text)] = i
+            return
+
+    for _ in range(max(1, MAP_CONCURRENCY)):
+        _submit_next()
+    while running:
+        deadlines = [started[i] + MAP_TIMEOUT for i in running.values() if i in started]
+        timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else MAP_TIMEOUT
+        done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            i = running.pop(future)
+            if future.exception() is None:
+                results[i] = _llm_text(future.result()).strip()
+            _submit_next()
+        now = time.monotonic()
+        for future, i in list(running.items()):
+            if i in started and now - started[i] >= MAP_TIMEOUT:
+                # Give up on this call; its slot goes to the next chunk
+                running.pop(future)
+                _submit_next()
+
+    notes = [text for text in results if text and text.upper() != "NONE"]
+    failed = sum(1 for text in results if text is None)
+    print(f"[RAG] map_reduce: {len(docs) - failed}/{len(docs)} chunk call(s) answered, {len(notes)} with facts")
+    if failed == len(docs) and docs:
+        raise RuntimeError(f"All {len(docs)} map calls failed or timed out")
+
+    return _llm_text(llm.invoke(prompt.format(context="\n\n".join(notes), question=message)))
+
+
+async def _amap_reduce(llm, app_name: str, message: str, docs, prompt: PromptTemplate) -> str:
+    """Async _map_reduce(): the per-chunk calls are coroutines instead of pool threads."""
+    map_prompt = get_map_prompt_template(app_name)
+    limit = asyncio.Semaphore(max(1, MAP_CONCURRENCY))
+
+    async def _extract(doc):
+        async with limit:
+            # The timeout starts once the call holds a slot, not while it waits for one
+            return await asyncio.wait_for(
+                llm.ainvoke(map_prompt.format(context=doc.page_content, question=message)), MAP_TIMEOUT
+            )
+
+    results = await asyncio.gather(*[_extract(doc) for doc in docs], return_exceptions=True)
+
+    notes, failed = [], 0
+    for result in results:
+        if isinstance(result, BaseException):
+            failed += 1
+            continue
+        text = _llm_text(result).strip()
+        if text and text.upper() != "NONE":
+            notes.append(text)
+    print(f"[RAG] map_reduce: {len(docs) - failed}/{len(docs)} chunk call(s) answered, {len(notes)} with facts")
+    if failed == len(docs) and docs:
+        raise RuntimeError(f"All {len(docs)} map calls failed or timed out")
+
+    return _llm_text(await llm.ainvoke(prompt.format(context="\n\n".join(notes), question=message)))
+
+
+def _answer_from_docs(llm, app: Dict[str, Any], message: str, docs) -> str:
+    """Generate an answer to `message` from already retrieved and packed documents."""
+    app_id = app["app_id"]
+    app_name = app.get("name", app_id)
+    prompt = get_prompt_template(app_id, app_name)
+
+    if not has_openai_key():
+        # Mock LLM: build the prompt by hand
+        if not docs:
+            return f"I don't have that information in the uploaded {app_id} documents."
+        context = "\n\n".join([doc.page_content for doc in docs])
+        return llm.generate(prompt.format(context=context, question=message))
+
+    chain_type = CHAIN_TYPE if CHAIN_TYPE in ("refine", "stuff", "map_reduce") else "stuff"
+    inputs = {"input_documents": docs, "question": message}
+    try:
+        if chain_type == "map_reduce":
+            return _map_reduce(llm, app_name, message, docs, prompt)
+        if chain_type == "refine":
+            qa_chain = load_qa_chain(
+                llm,
+                chain_type="refine",
+                question_prompt=prompt,
+                refine_prompt=get_refine_prompt_template(app_id, app_name),
+                document_variable_name="context",
+            )
+        else:
+            qa_chain = load_qa_chain(llm, chain_type="stuff", prompt=prompt)
+        return qa_chain.invoke(inputs)["output_text"]
+    except Exception as e:
+        # Safe fallback (LangChain prompt keys can vary by version)
+        print(f"[WARN] QA chain failed (type={chain_type}); falling back to stuff. Error: {e}")
+        qa_chain = load_qa_chain(llm, chain_type="stuff", prompt=prompt)
+        return qa_chain.invoke(inputs)["output_text"]
+
+
+async def _aanswer_from_docs(llm, app: Dict[str, Any], message: str, docs) -> str:
+    """Async _answer_from_docs(): LLM calls and chains run with ainvoke."""
+    app_id = app["app_id"]
+    app_name = app.get("name", app_id)
+    prompt = get_prompt_template(app_id, app_name)
+
+    if not has_openai_key():
+        if not docs:
+            return f"I don't have that information in the uploaded {app_id} documents."
+        context = "\n\n".join([doc.page_content for doc in docs])
+        return await llm.ainvoke(prompt.format(context=context, question=message))
+
+    chain_type = CHAIN_TYPE if CHAIN_TYPE in ("refine", "stuff", "map_reduce") else "stuff"
+    inputs = {"input_documents": docs, "question": message}
+    try:
+        if chain_type == "map_reduce":
+            return await _amap_reduce(llm, app_name, message, docs, prompt)
+        if chain_type == "refine":
+            qa_chain = load_qa_chain(
+                llm,
+                chain_type="refine",
+                question_prompt=prompt,
+                refine_prompt=get_refine_prompt_template(app_id, app_name),
+                document_variable_name="context",
+            )
+        else:
+            qa_chain = load_qa_chain(llm, chain_type="stuff", prompt=prompt)
+        return (await qa_chain.ainvoke(inputs))["output_text"]
+    except Exception as e:
+        print(f"[WARN] QA chain failed (type={chain_type}); falling back to stuff. Error: {e}")
+        qa_chain = load_qa_chain(llm, chain_type="stuff", prompt=prompt)
+        return (await qa_chain.ainvoke(inputs))["output_text"]
+
+
+def chat(app_id: str, message: str, exact_cache_checked: bool = False) -> Dict[str, Any]:
     """
     Process a chat message using RAG.
     Returns answer and source documents.
+    Pass exact_cache_checked=True if get_cached_answer() already missed for this message.
     """
     print(f"\n[CHAT] Chat request for app: {app_id}")
     print(f"   Message: {message[:100]}...")
     
-    # Validate app exists
-    app = get_app(app_id)
-    if not app:
+    with CHAT_STAGE_SECONDS.time("app_lookup"):
+        app, error = check_app_ready(app_id)
+    if error:
+        _count_unready(app_id, app)
         return {
             "success": False,
-            "error": f"App '{app_id}' not found",
+            "error": error,
             "answer": None,
             "sources": []
         }
     
-    # Check if trained
-    if app["status"] != "READY":
-        return {
-            "success": False,
-            "error": f"App '{app_id}' is not trained yet. Status: {app['status']}",
-            "answer": None,
-            "sources": []
-        }
+    if not exact_cache_checked:
+        cached = answer_cache.get(app_id, _cache_version(app), message)
+        if cached:
+            print("   [OK] Answer served from cache (exact).")
+            _count(app_id, "cache_exact")
+            return _cached_response(cached)
     
     try:
+        cached, query_vector = _lookup_similar(app, message)
+        if cached:
+            print("   [OK] Answer served from cache (semantic).")
+            _count(app_id, "cache_semantic")
+            return _cached_response(cached)
+        
         # Load vector DB
-        vectordb = load_vector_db(app_id)
+        with CHAT_STAGE_SECONDS.time("vector_store_open"):
+            vectordb = load_vector_db(app_id)
         
         # Get LLM
-        llm = get_llm()
-        retriever = _make_retriever(vectordb, llm)
+        llm = _get_app_llm(app)
         print(
             f"[RAG] llm_mode={get_llm_mode()} "
             f"chain={CHAIN_TYPE} search={SEARCH_TYPE} k={TOP_K} fetch_k={FETCH_K} "
             f"multiquery={'on' if ENABLE_MULTI_QUERY else 'off'}"
         )
         
-        # Create QA chain with custom prompt
-        app_name = app.get("name", app_id)
-        prompt = get_prompt_template(app_id, app_name)
-        refine_prompt = get_refine_prompt_template(app_id, app_name)
-        
-        # Use RetrievalQA if we have OpenAI, otherwise do manual retrieval
-        if has_openai_key():
-            chain_type = CHAIN_TYPE if CHAIN_TYPE in ("refine", "stuff") else "stuff"
-            try:
-                if chain_type == "refine":
-                    qa_chain = RetrievalQA.from_chain_type(
-                        llm=llm,
-                        retriever=retriever,
-                        chain_type="refine",
-                        return_source_documents=True,
-                        chain_type_kwargs={
-                            "question_prompt": prompt,
-                            "refine_prompt": refine_prompt,
-                        },
-                    )
-                else:
-                    qa_chain = RetrievalQA.from_chain_type(
-                        llm=llm,
-                        retriever=retriever,
-                        chain_type="stuff",
-                        return_source_documents=True,
-                        chain_type_kwargs={"prompt": prompt},
-                    )
-
-                result = qa_chain.invoke(message)
-                answer = result["result"]
-                source_docs = result.get("source_documents", [])
-            except Exception as e:
-                # Safe fallback (LangChain prompt keys can vary by version)
-                print(f"[WARN] RetrievalQA chain failed (type={chain_type}); falling back to stuff. Error: {e}")
-                qa_chain = RetrievalQA.from_chain_type(
-                    llm=llm,
-                    retriever=retriever,
-                    chain_type="stuff",
-                    return_source_documents=True,
-                    chain_type_kwargs={"prompt": prompt},
-                )
-                result = qa_chain.invoke(message)
-                answer = result["result"]
-                source_docs = result.get("source_documents", [])
-        else:
-            # Manual retrieval for mock LLM
-            docs = retriever.invoke(message)
-            
-            if not docs:
-                answer = f"I don't have that information in the uploaded {app_id} documents."
-                source_docs = []
-            else:
-                # Construct context
-                context = "\n\n".join([doc.page_content for doc in docs])
-                full_prompt = prompt.format(context=context, question=message)
-                answer = llm.generate(full_prompt)
-                source_docs = docs
+        source_docs = _pack_context(llm, _retrieve(vectordb, llm, message, query_vector))
+        with CHAT_STAGE_SECONDS.time("llm"):
+            answer = _answer_from_docs(llm, app, message, source_docs)
         
-        # Extract source filenames
-        sources = []
-        for doc in source_docs:
-            source = doc.metadata.get("source", "unknown")
-            filename = os.path.basename(source)
-            if filename not in sources:
-                sources.append(filename)
+        # Only cite the chunks the LLM actually saw
+        sources = _source_filenames(source_docs)
         
         print(f"   [OK] Answer generated. Sources: {sources}")
+        answer_cache.put(app_id, _cache_version(app), message, answer, sources, query_vector)
+        _count(app_id, "answered")
         
         return {
             "success": True,
             "answer": answer,
             "sources": sources,
-            "error": None
+            "error": None,
+            "cached": None
         }
         
     except Exception as e:
         print(f"   [ERR] Error: {e}")
+        _count(app_id, "error")
         return {
             "success": False,
             "error": str(e),
@@ -234,3 +507,236 @@ def chat(app_id: str, message: str) -> Dict[str, Any]:
             "sources": []
         }
 
+
+async def achat(app_id: str, message: str, exact_cache_checked: bool = False) -> Dict[str, Any]:
+    """
+    Async chat(): same result, but no thread is held while waiting on the LLM.
+    LLM calls and chains use ainvoke. Everything that can block runs in short-lived
+    worker threads instead of on the event loop: the app lookup (its cache is
+    validated against SQLite), answer-cache reads and writes, opening the vector
+    store and the LLM client, query embedding, the vector search and context packing.
+    """
+    print(f"\n[CHAT] Async chat request for app: {app_id}")
+    print(f"   Message: {message[:100]}...")
+
+    with CHAT_STAGE_SECONDS.time("app_lookup"):
+        app, error = await asyncio.to_thread(check_app_ready, app_id)
+    if error:
+        _count_unready(app_id, app)
+        return {"success": False, "error": error, "answer": None, "sources": []}
+
+    if not exact_cache_checked:
+        cached = await asyncio.to_thread(answer_cache.get, app_id, _cache_version(app), message)
+        if cached:
+            print("   [OK] Answer served from cache (exact).")
+            _count(app_id, "cache_exact")
+            return _cached_response(cached)
+
+    try:
+        cached, query_vector = await asyncio.to_thread(_lookup_similar, app, message)
+        if cached:
+            print("   [OK] Answer served from cache (semantic).")
+            _count(app_id, "cache_semantic")
+            return _cached_response(cached)
+
+        with CHAT_STAGE_SECONDS.time("vector_store_open"):
+            vectordb = await asyncio.to_thread(load_vector_db, app_id)
+        llm = await asyncio.to_thread(_get_app_llm, app)
+
+        source_docs = await asyncio.to_thread(_retrieve, vectordb, llm, message, query_vector)
+        source_docs = await asyncio.to_thread(_pack_context, llm, source_docs)
+        with CHAT_STAGE_SECONDS.time("llm"):
+            answer = await _aanswer_from_docs(llm, app, message, source_docs)
+        sources = _source_filenames(source_docs)
+
+        print(f"   [OK] Answer generated. Sources: {sources}")
+        await asyncio.to_thread(
+            answer_cache.put, app_id, _cache_version(app), message, answer, sources, query_vector
+        )
+        _count(app_id, "answered")
+        return {"success": True, "answer": answer, "sources": sources, "error": None, "cached": None}
+
+    except Exception as e:
+        print(f"   [ERR] Error: {e}")
+        _count(app_id, "error")
+        return {"success": False, "error": str(e), "answer": None, "sources": []}
+
+
+def _retrieve_batch(vectordb, vectors: List[List[float]]) -> List[List[Document]]:
+    """
+    Retrieve documents for many query vectors with one collection query.
+    Applies the same MMR / similarity settings as the single-question retriever.
+    """
+    mmr = SEARCH_TYPE != "similarity"
+    if isinstance(vectordb, FlatVectorStore):
+        return vectordb.batch_search(vectors, TOP_K, fetch_k=FETCH_K if mmr else None, lambda_mult=MMR_LAMBDA)
+
+    include = ["documents", "metadatas"] + (["embeddings"] if mmr else [])
+    # Deliberately the underlying collection: LangChain's Chroma wrapper (0.0.x) only
+    # queries one vector per call, and MMR needs the candidates' embeddings back
+    results = vectordb._collection.query(
+        query_embeddings=vectors,
+        n_results=FETCH_K if mmr else TOP_K,
+        include=include,
+    )
+
+    batches = []
+    for i, vector in enumerate(vectors):
+        texts, metadatas = results["documents"][i], results["metadatas"][i]
+        if mmr and texts:
+            picked = maximal_marginal_relevance(
+                np.array(vector, dtype=np.float32), results["embeddings"][i],
+                k=TOP_K, lambda_mult=MMR_LAMBDA,
+            )
+        else:
+            picked = range(min(TOP_K, len(texts)))
+        batches.append([Document(page_content=texts[j], metadata=metadatas[j] or {}) for j in picked])
+    return batches
+
+
+def chat_batch(app_id: str, messages: List[str]) -> Dict[str, Any]:
+    """
+    Answer many questions for one app.
+    The app, vector store and LLM are set up once, all questions are embedded as one
+    batch and retrieved with one query, and LLM calls run CHAT_BATCH_CONCURRENCY at a time
+    on the shared batch pool (at most CHAT_BATCH_WORKERS across all batches).
+    Returns {"success", "error", "results"} with one chat()-style result per question, in input order.
+    """
+    print(f"\n[CHAT] Batch chat request for app: {app_id} ({len(messages)} question(s))")
+
+    with CHAT_STAGE_SECONDS.time("app_lookup"):
+        app, error = check_app_ready(app_id)
+    if error:
+        _count_unready(app_id, app)
+        return {"success": False, "error": error, "results": []}
+
+    cache_version = _cache_version(app)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+    pending = []
+    for i, message in enumerate(messages):
+        cached = answer_cache.get(app_id, cache_version, message)
+        if cached:
+            results[i] = _cached_response(cached)
+            _count(app_id, "cache_exact")
+        else:
+            pending.append(i)
+
+    if pending:
+        try:
+            with CHAT_STAGE_SECONDS.time("vector_store_open"):
+                vectordb = load_vector_db(app_id)
+            llm = _get_app_llm(app)
+            # Batch-level stages: one embed call and one search for all pending questions
+            with CHAT_STAGE_SECONDS.time("query_embed"):
+                vectors = get_embeddings(EMBED_MODEL).embed_documents([messages[i] for i in pending])
+            with CHAT_STAGE_SECONDS.time("retrieve"):
+                doc_batches = _retrieve_batch(vectordb, vectors)
+        except Exception as e:
+            print(f"   [ERR] Error: {e}")
+            _count(app_id, "error")
+            return {"success": False, "error": str(e), "results": []}
+
+        def _answer(i: int, vector: List[float], docs: List[Document]) -> Dict[str, Any]:
+            try:
+                docs = _pack_context(llm, docs)
+                with CHAT_STAGE_SECONDS.time("llm"):
+                    answer = _answer_from_docs(llm, app, messages[i], docs)
+            except Exception as e:
+                _count(app_id, "error")
+                return {"success": False, "error": str(e), "answer": None, "sources": [], "cached": None}
+            sources = _source_filenames(docs)
+            answer_cache.put(app_id, cache_version, messages[i], answer, sources, vector)
+            _count(app_id, "answered")
+            return {"success": True, "error": None, "answer": answer, "sources": sources, "cached": None}
+
+        questions = iter(zip(pending, vectors, doc_batches))
+        running = {}
+
+        def _submit_next():
+            for i, vector, docs in questions:
+                running[_batch_pool.submit(_answer, i, vector, docs)] = i
+                return
+
+        for _ in range(max(1, BATCH_CONCURRENCY)):
+            _submit_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+                _submit_next()
+
+    answered = sum(1 for r in results if r["success"])
+    print(f"   [OK] Batch answered: {answered}/{len(messages)} ({len(messages) - len(pending)} from cache)")
+    return {"success": True, "error": None, "results": results}
+
+
+def chat_stream(app_id: str, message: str) -> Iterator[Dict[str, Any]]:
+    """
+    Process a chat message using RAG, yielding events as they become available:
+    {"event": "sources", ...} once retrieval finishes, then {"event": "token", ...}
+    for each piece of the answer, then {"event": "done"} (or {"event": "error"}).
+
+    Streaming always answers with the single-call "stuff" prompt: the refine chain
+    only produces its final answer after every chunk has been processed.
+    """
+    print(f"\n[CHAT] Streaming chat request for app: {app_id}")
+    print(f"   Message: {message[:100]}...")
+
+    with CHAT_STAGE_SECONDS.time("app_lookup"):
+        app, error = check_app_ready(app_id)
+    if error:
+        _count_unready(app_id, app)
+        yield {"event": "error", "error": error}
+        return
+
+    try:
+        cached = answer_cache.get(app_id, _cache_version(app), message)
+        query_vector = None
+        if not cached:
+            cached, query_vector = _lookup_similar(app, message)
+        if cached:
+            _count(app_id, f"cache_{cached['match']}")
+            yield {"event": "sources", "sources": cached["sources"]}
+            yield {"event": "token", "text": cached["answer"]}
+            yield {"event": "done", "cached": cached["match"]}
+            return
+
+        with CHAT_STAGE_SECONDS.time("vector_store_open"):
+            vectordb = load_vector_db(app_id)
+        llm = _get_app_llm(app)
+
+        docs = _pack_context(llm, _retrieve(vectordb, llm, message, query_vector))
+        sources = _source_filenames(docs)
+        yield {"event": "sources", "sources": sources}
+
+        if not docs:
+            answer = f"I don't have that information in the uploaded {app_id} documents."
+            answer_cache.put(app_id, _cache_version(app), message, answer, sources, query_vector)
+            _count(app_id, "answered")
+            yield {"event": "token", "text": answer}
+            yield {"event": "done"}
+            return
+
+        prompt = get_prompt_template(app_id, app.get("name", app_id))
+        context = "\n\n".join([doc.page_content for doc in docs])
+        full_prompt = prompt.format(context=context, question=message)
+
+        parts = []
+        with CHAT_STAGE_SECONDS.time("llm"):
+            for chunk in llm.stream(full_prompt):
+                # Chat models yield message chunks; MockLLM yields plain strings
+                text = getattr(chunk, "content", chunk)
+                if text:
+                    parts.append(text)
+                    yield {"event": "token", "text": text}
+
+        # Only reached if the client consumed the whole stream
+        answer_cache.put(app_id, _cache_version(app), message, "".join(parts), sources, query_vector)
+        _count(app_id, "answered")
+        print("   [OK] Streamed answer.")
+        yield {"event": "done"}
+
+    except Exception as e:
+        print(f"   [ERR] Error: {e}")
+        _count(app_id, "error")
+        yield {"event": "error", "error": str(e)}
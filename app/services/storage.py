@@ -1,14 +1,33 @@
 """
 Storage service for managing local file storage.
-Handles file paths, saving, and hashing.
+Handles file paths, saving, hashing, and the content-addressed blob store.
 """
 import os
 import hashlib
 import shutil
-from typing import List
+import tempfile
+import time
+from typing import BinaryIO, List, Optional, Tuple
+
+from app.services import vector_cache
 
 # Base storage directory
 STORAGE_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "storage", "apps")
+# Content-addressed blob store shared by all apps (files are stored once per SHA256)
+BLOB_ROOT = os.path.join(os.path.dirname(STORAGE_ROOT), "blobs")
+
+# Upload limits
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_MB", "100")) * 1024 * 1024
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_MB", "500")) * 1024 * 1024
+
+# Blobs uploaded more recently than this are never released: an upload may have
+# stored (or reused) one without recording its reference yet
+BLOB_RELEASE_GRACE_SECONDS = 60
+
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload exceeds its size limit."""
 
 
 def get_app_root(app_id: str) -> str:
@@ -26,6 +45,11 @@ def get_chroma_dir(app_id: str) -> str:
     return os.path.join(get_app_root(app_id), "chroma_db")
 
 
+def get_flat_index_dir(app_id: str) -> str:
+    """Get flat (NumPy) vector index directory for an app."""
+    return os.path.join(get_app_root(app_id), "flat_index")
+
+
 def ensure_app_dirs(app_id: str):
     """Create app directories if they don't exist."""
     os.makedirs(get_files_dir(app_id), exist_ok=True)
@@ -38,6 +62,15 @@ def compute_file_hash(content: bytes) -> str:
     return hashlib.sha256(content).hexdigest()
 
 
+def compute_file_hash_from_path(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Compute SHA256 hash of a file on disk without reading it all into memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 def save_file(app_id: str, filename: str, content: bytes) -> str:
     """
     Save file to app's files directory.
@@ -45,6 +78,9 @@ def save_file(app_id: str, filename: str, content: bytes) -> str:
     """
     ensure_app_dirs(app_id)
     file_path = os.path.join(get_files_dir(app_id), filename)
+    # Never write through an existing path: it may be a hardlink to a shared blob
+    if os.path.exists(file_path):
+        os.remove(file_path)
     
     with open(file_path, "wb") as f:
         f.write(content)
@@ -53,6 +89,131 @@ def save_file(app_id: str, filename: str, content: bytes) -> str:
     return file_path
 
 
+def get_blob_path(file_hash: str) -> str:
+    """Get the blob store path for a content hash."""
+    return os.path.join(BLOB_ROOT, file_hash[:2], file_hash)
+
+
+def save_upload_stream(stream: BinaryIO, filename: str,
+                       max_bytes: int = UPLOAD_MAX_FILE_BYTES) -> Tuple[str, int, str]:
+    """
+    Stream an upload into the blob store in fixed-size chunks.
+    The SHA256 hash is computed while writing to a temporary file, which is then
+    atomically renamed to its content address (or discarded if that blob already
+    exists). Raises FileTooLargeError past `max_bytes`.
+    Returns (blob_path, size, hash).
+    """
+    tmp_dir = os.path.join(BLOB_ROOT, ".tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for block in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+                size += len(block)
+                if size > max_bytes:
+                    raise FileTooLargeError(
+                        f"{filename} exceeds the upload limit of {max_bytes // (1024 * 1024)} MB"
+                    )
+                digest.update(block)
+                f.write(block)
+        
+        file_hash = digest.hexdigest()
+        blob_path = get_blob_path(file_hash)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+            # Restart the grace period so a concurrent release keeps the blob
+            os.utime(blob_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_path, blob_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    return blob_path, size, file_hash
+
+
+def link_blob(app_id: str, filename: str, file_hash: str) -> str:
+    """
+    Reference a blob from app's files directory (hardlink, or copy where links
+    aren't supported). Replaces any existing file atomically.
+    Returns the full file path.
+    """
+    ensure_app_dirs(app_id)
+    file_path = os.path.join(get_files_dir(app_id), os.path.basename(filename))
+    blob_path = get_blob_path(file_hash)
+    # Unique temp name next to (not inside) the files directory, so concurrent
+    # uploads never share it and indexing never sees it
+    fd, tmp_path = tempfile.mkstemp(dir=get_app_root(app_id), suffix=".tmp")
+    os.close(fd)
+    try:
+        try:
+            os.remove(tmp_path)
+            os.link(blob_path, tmp_path)
+        except OSError:
+            shutil.copyfile(blob_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    finally:
+        # rename() is a no-op when both names already link the same blob
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    print(f"[SAVE] Saved file: {filename} for app: {app_id}")
+    return file_path
+
+
+def _remove_blobs(file_hashes: List[str], referenced_hashes: List[str], min_age_seconds: int) -> int:
+    referenced = set(referenced_hashes)
+    cutoff = time.time() - min_age_seconds
+    removed = 0
+    for file_hash in set(file_hashes) - referenced:
+        blob_path = get_blob_path(file_hash)
+        try:
+            if os.path.getmtime(blob_path) < cutoff:
+                os.remove(blob_path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    
+    if removed:
+        print(f"[DEL] Removed {removed} unreferenced blob(s)")
+    return removed
+
+
+def release_blobs(file_hashes: List[str], referenced_hashes: List[str],
+                  min_age_seconds: Optional[int] = None) -> int:
+    """
+    Delete the blobs of `file_hashes` that lost their last reference (i.e. are not in
+    `referenced_hashes`), e.g. after a file was replaced or an app deleted. Blobs
+    uploaded within the grace period are kept; remove_unreferenced_blobs() collects
+    them later. Returns the number removed.
+    """
+    if min_age_seconds is None:
+        min_age_seconds = BLOB_RELEASE_GRACE_SECONDS
+    return _remove_blobs(file_hashes, referenced_hashes, min_age_seconds)
+
+
+def remove_unreferenced_blobs(referenced_hashes: List[str], min_age_seconds: int = 3600) -> int:
+    """
+    Delete blobs no longer referenced by any app. Recent blobs are kept, since an
+    upload may not have recorded its reference yet. Returns the number removed.
+    """
+    if not os.path.exists(BLOB_ROOT):
+        return 0
+    
+    stored = []
+    for prefix in os.listdir(BLOB_ROOT):
+        prefix_dir = os.path.join(BLOB_ROOT, prefix)
+        if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+            continue
+        stored.extend(os.listdir(prefix_dir))
+    return _remove_blobs(stored, referenced_hashes, min_age_seconds)
+
+
 def get_all_file_paths(app_id: str) -> List[str]:
     """Get all file paths in app's files directory."""
     files_dir = get_files_dir(app_id)
@@ -60,7 +221,8 @@ def get_all_file_paths(app_id: str) -> List[str]:
         return []
     
     file_paths = []
-    for filename in os.listdir(files_dir):
+    # Sorted so indexing order (and the resulting index) is reproducible
+    for filename in sorted(os.listdir(files_dir)):
         file_path = os.path.join(files_dir, filename)
         if os.path.isfile(file_path):
             file_paths.append(file_path)
@@ -81,15 +243,28 @@ def delete_file(app_id: str, filename: str) -> bool:
 def clear_chroma_dir(app_id: str):
     """Clear the Chroma DB directory (for rebuilding index)."""
     chroma_dir = get_chroma_dir(app_id)
+    vector_cache.invalidate(app_id)
+    vector_cache.release_chroma_client(chroma_dir)
     if os.path.exists(chroma_dir):
         shutil.rmtree(chroma_dir)
         print(f"[DEL] Cleared Chroma DB for app: {app_id}")
     os.makedirs(chroma_dir, exist_ok=True)
 
 
+def clear_flat_index_dir(app_id: str):
+    """Clear the flat vector index directory (for rebuilding index)."""
+    flat_dir = get_flat_index_dir(app_id)
+    vector_cache.invalidate(app_id)
+    if os.path.exists(flat_dir):
+        shutil.rmtree(flat_dir)
+        print(f"[DEL] Cleared flat index for app: {app_id}")
+
+
 def delete_app_storage(app_id: str):
     """Delete all storage for an app."""
     app_root = get_app_root(app_id)
+    vector_cache.invalidate(app_id)
+    vector_cache.release_chroma_client(get_chroma_dir(app_id))
     if os.path.exists(app_root):
         shutil.rmtree(app_root)
         print(f"[DEL] Deleted all storage for app: {app_id}")
@@ -0,0 +1,165 @@
+"""
+Vector store cache service.
+Keeps recently used per-app vector stores open (LRU, bounded by count and approximate size).
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# Configuration
+MAX_APPS = int(os.getenv("VECTOR_CACHE_MAX_APPS", "32"))
+MAX_MB = int(os.getenv("VECTOR_CACHE_MAX_MB", "1024"))
+
+_entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.RLock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+# Bumped on every invalidation so a store opened concurrently isn't cached stale
+_generations: Dict[str, int] = {}
+
+
+def _dir_size(path: str) -> int:
+    """Approximate the in-memory footprint of a store (e.g. Chroma) from its on-disk size."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _store_size(store: Any, path: str) -> int:
+    """Bytes to charge against MAX_MB: what the store reports resident, else its directory size."""
+    resident = getattr(store, "resident_bytes", None)
+    if callable(resident):
+        return resident()
+    return _dir_size(path)
+
+
+def _close(entry: Dict[str, Any]):
+    """Release resources held by a cached vector store."""
+    closer = entry.get("close")
+    if closer is None:
+        return
+    try:
+        closer()
+    except Exception as e:
+        print(f"[WARN] Failed to close cached vector store: {e}")
+
+
+def _total_bytes() -> int:
+    return sum(e["size"] for e in _entries.values())
+
+
+def _evict_over_limit():
+    """Evict least recently used entries until within count and size limits."""
+    max_bytes = MAX_MB * 1024 * 1024
+    while _entries and (len(_entries) > MAX_APPS or _total_bytes() > max_bytes):
+        # Always keep the most recent entry, even if it alone exceeds the size cap
+        if len(_entries) == 1:
+            break
+        app_id, entry = _entries.popitem(last=False)
+        _stats["evictions"] += 1
+        _close(entry)
+        print(f"[CACHE] Evicted vector store for app: {app_id}")
+
+
+def get_or_open(app_id: str, path: str, opener: Callable[[], Any],
+                closer: Optional[Callable[[Any], None]] = None) -> Any:
+    """
+    Return the cached store for an app, opening it with `opener` on a miss.
+    `closer` (optional) is called with the store when it is evicted.
+    """
+    with _lock:
+        entry = _entries.get(app_id)
+        if entry is not None and entry["path"] == path:
+            _entries.move_to_end(app_id)
+            _stats["hits"] += 1
+            return entry["store"]
+
+        _stats["misses"] += 1
+        generation = _generations.get(app_id, 0)
+
+    # Open outside the lock so a cold app doesn't block cache hits for others
+    store = opener()
+
+    with _lock:
+        if _generations.get(app_id, 0) != generation:
+            # Invalidated while opening: serve this request but don't cache it
+            return store
+        entry = _entries.get(app_id)
+        if entry is not None and entry["path"] == path:
+            # Another request opened it first; keep theirs
+            _entries.move_to_end(app_id)
+            return entry["store"]
+        if entry is not None:
+            _close(entry)
+        _entries[app_id] = {
+            "store": store,
+            "path": path,
+            "size": _store_size(store, path),
+            "close": (lambda: closer(store)) if closer else None,
+        }
+        _entries.move_to_end(app_id)
+        _evict_over_limit()
+        return store
+
+
+def invalidate(app_id: str):
+    """Drop the cached store for an app (call before its index changes on disk)."""
+    with _lock:
+        _generations[app_id] = _generations.get(app_id, 0) + 1
+        entry = _entries.pop(app_id, None)
+    if entry is not None:
+        _close(entry)
+        print(f"[CACHE] Invalidated vector store for app: {app_id}")
+
+
+def clear():
+    """Drop every cached store."""
+    with _lock:
+        entries = list(_entries.values())
+        _entries.clear()
+    for entry in entries:
+        _close(entry)
+
+
+def release_chroma_client(path: str):
+    """
+    Stop and drop Chroma's process-wide client for a persist directory.
+    Chroma shares one client (a System holding SQLite connections and HNSW segments)
+    per path; without this a rebuilt directory would be served by a client still
+    pointing at the deleted files, and an evicted app's client would stay open.
+    """
+    try:
+        from chromadb.api.client import SharedSystemClient
+    except ImportError:
+        return
+    # chromadb (pinned to 0.4.x in requirements.txt) has no public way to drop the
+    # client of one path: the per-path registry is private (and spelled this way upstream)
+    systems = getattr(SharedSystemClient, "_identifer_to_system", None)
+    if not isinstance(systems, dict):
+        print(f"[WARN] Could not release Chroma client for {path}: unsupported chromadb version; "
+              f"restart the worker after rebuilding or deleting this app")
+        return
+    system = systems.pop(path, None)
+    if system is None:
+        return
+    try:
+        system.stop()
+    except Exception as e:
+        print(f"[WARN] Could not stop Chroma client for {path}: {e}")
+
+
+def stats() -> Dict[str, Any]:
+    """Return cache statistics."""
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "approx_bytes": _total_bytes(),
+            "max_apps": MAX_APPS,
+            "max_mb": MAX_MB,
+        }
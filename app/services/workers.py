@@ -0,0 +1,167 @@
+"""
+Worker pool service.
+Runs blocking work (chat, retrieval, LLM calls) off the event loop with a bounded wait queue,
+and caps how many async chat requests are in flight on the loop itself.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# Configuration
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "8"))
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "32"))
+CHAT_RETRY_AFTER = int(os.getenv("CHAT_RETRY_AFTER", "2"))
+# Async chat path: requests run as coroutines on the event loop instead of in chat workers
+CHAT_ASYNC = os.getenv("CHAT_ASYNC", "0") == "1"
+CHAT_MAX_INFLIGHT = int(os.getenv("CHAT_MAX_INFLIGHT", "256"))
+
+
+class PoolFullError(RuntimeError):
+    """Raised when a pool's wait queue is full and the job was rejected."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"Server busy: {name} queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a bounded number of waiting jobs.
+    Jobs beyond `max_workers + max_queue` are rejected instead of piling up.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int = 2):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                raise PoolFullError(self.name, self.retry_after)
+            self._pending += 1
+            self._stats["submitted"] += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+            self._stats["completed"] += 1
+
+    def _wrap(self, fn: Callable, args: tuple, kwargs: dict) -> Callable[[], Any]:
+        queued_at = time.perf_counter()
+
+        def _run():
+            waited = time.perf_counter() - queued_at
+            with self._lock:
+                self._active += 1
+                self._stats["wait_seconds_total"] += waited
+                self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+        return _run
+
+    def submit(self, fn: Callable, *args, **kwargs) -> "asyncio.Future":
+        """
+        Schedule `fn` in the pool and return an awaitable future.
+        Raises PoolFullError immediately when saturated.
+        """
+        self._acquire()
+        try:
+            future = self._pool.submit(self._wrap(fn, args, kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # Release on completion of the job itself, not the awaiting request, so a
+        # disconnected client doesn't free a slot its job is still using
+        future.add_done_callback(lambda _: self._release())
+        return asyncio.wrap_future(future)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run `fn` in the pool and await its result. Raises PoolFullError when saturated."""
+        return await self.submit(fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool metrics (queue depth, active workers, wait times)."""
+        with self._lock:
+            completed = self._stats["completed"]
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queue_depth": max(self._pending - self._active, 0),
+                **self._stats,
+                "wait_seconds_avg": (self._stats["wait_seconds_total"] / completed) if completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+class InflightLimiter:
+    """
+    Admission control for coroutines: at most `max_inflight` run at once,
+    further requests are rejected with PoolFullError instead of queueing.
+    """
+
+    def __init__(self, name: str, max_inflight: int, retry_after: int = 2):
+        self.name = name
+        self.max_inflight = max_inflight
+        self.retry_after = retry_after
+        self._inflight = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "inflight_max": 0,
+        }
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Await coroutine function `fn`. Raises PoolFullError when saturated."""
+        # Only touched from the event loop thread, so no lock is needed
+        if self._inflight >= self.max_inflight:
+            self._stats["rejected"] += 1
+            raise PoolFullError(self.name, self.retry_after)
+        self._inflight += 1
+        self._stats["submitted"] += 1
+        self._stats["inflight_max"] = max(self._stats["inflight_max"], self._inflight)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self._inflight -= 1
+            self._stats["completed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return limiter metrics (in-flight requests, rejections)."""
+        return {
+            "enabled": CHAT_ASYNC,
+            "max_inflight": self.max_inflight,
+            "inflight": self._inflight,
+            **self._stats,
+        }
+
+
+# Shared pool for chat requests
+chat_pool = BoundedExecutor("chat", CHAT_WORKERS, CHAT_QUEUE_SIZE, CHAT_RETRY_AFTER)
+
+# Admission limit for async chat requests (CHAT_ASYNC=1)
+chat_limiter = InflightLimiter("chat", CHAT_MAX_INFLIGHT, CHAT_RETRY_AFTER)
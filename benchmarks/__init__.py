@@ -0,0 +1,13 @@
+# Benchmarks
+#
+# Importing the package points the app's metadata DB at a throwaway directory
+# (unless METADATA_DB_PATH is already set), so benchmarks never write storage/.
+import atexit
+import os
+import shutil
+import tempfile
+
+if not os.getenv("METADATA_DB_PATH"):
+    _workdir = tempfile.mkdtemp(prefix="benchmarks_")
+    os.environ["METADATA_DB_PATH"] = os.path.join(_workdir, "metadata.db")
+    atexit.register(shutil.rmtree, _workdir, True)
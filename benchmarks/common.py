@@ -0,0 +1,17 @@
+"""Helpers shared by the benchmarks: latency percentiles and the synthetic-text vocabulary."""
+
+# Words synthetic documents and questions are made of
+VOCABULARY = [
+    "invoice", "refund", "account", "password", "shipping", "warranty", "policy", "order",
+    "payment", "subscription", "device", "install", "update", "support", "billing", "region",
+    "limit", "storage", "export", "backup", "report", "schedule", "contract", "renewal",
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of `values` (0.0 when empty)."""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
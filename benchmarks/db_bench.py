@@ -0,0 +1,153 @@
+"""
+Micro-benchmark for the app/db.py connection layer.
+
+Compares per-call latency of the old open-per-call pattern (makedirs + connect +
+close on every helper call, rollback journal) with the pooled thread-local WAL
+connections, under concurrent readers with a share of writers.
+
+Usage:
+    python -m benchmarks.db_bench --threads 8 --calls 2000 --write-ratio 0.05
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app import db
+from benchmarks.common import percentile
+
+
+def _legacy_connection(path: str) -> sqlite3.Connection:
+    """The pre-pooling get_connection(): a fresh connection per helper call."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _legacy_get_app(path: str, app_id: str):
+    conn = _legacy_connection(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM apps WHERE app_id = ?", (app_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def _legacy_update_status(path: str, app_id: str, status: str):
+    conn = _legacy_connection(path)
+    conn.execute(
+        "UPDATE apps SET status = ?, updated_at = ? WHERE app_id = ?",
+        (status, datetime.utcnow().isoformat(), app_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def _run(name, read, write, app_ids, threads, calls, write_ratio, seed):
+    def worker(worker_id):
+        rng = random.Random(seed + worker_id)
+        latencies = []
+        errors = 0
+        for _ in range(calls):
+            app_id = rng.choice(app_ids)
+            start = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    write(app_id, rng.choice(["READY", "FILES_UPDATED"]))
+                else:
+                    read(app_id)
+            except sqlite3.OperationalError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [l for result in results for l in result[0]]
+    return {
+        "mode": name,
+        "calls": len(latencies),
+        "errors": sum(result[1] for result in results),
+        "calls_per_sec": round(len(latencies) / elapsed, 1),
+        "mean_us": round(statistics.mean(latencies) * 1e6, 1),
+        "p50_us": round(percentile(latencies, 50) * 1e6, 1),
+        "p95_us": round(percentile(latencies, 95) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 99) * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=2000, help="calls per thread")
+    parser.add_argument("--apps", type=int, default=50)
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="db_bench_")
+    try:
+        app_ids = [f"app-{i}" for i in range(args.apps)]
+
+        # Legacy layout: same schema, default rollback journal
+        legacy_path = os.path.join(workdir, "legacy", "metadata.db")
+        db.DB_PATH = legacy_path
+        db.init_db()
+        for app_id in app_ids:
+            db.create_app(app_id, app_id)
+        db.close_connection()
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        before = _run(
+            "open-per-call",
+            lambda a: _legacy_get_app(legacy_path, a),
+            lambda a, s: _legacy_update_status(legacy_path, a, s),
+            app_ids, args.threads, args.calls, args.write_ratio, args.seed,
+        )
+
+        # Pooled thread-local WAL connections (current app/db.py)
+        db.DB_PATH = os.path.join(workdir, "pooled", "metadata.db")
+        db.init_db()
+        for app_id in app_ids:
+            db.create_app(app_id, app_id)
+        # Reads go straight to SQLite here; the app cache is measured separately below
+        after = _run(
+            "pooled-wal",
+            db._fetch_app,
+            db.update_app_status,
+            app_ids, args.threads, args.calls, args.write_ratio, args.seed,
+        )
+        cached = _run(
+            "pooled-wal+app-cache",
+            db.get_app,
+            db.update_app_status,
+            app_ids, args.threads, args.calls, args.write_ratio, args.seed,
+        )
+
+        print(json.dumps({
+            "threads": args.threads,
+            "calls_per_thread": args.calls,
+            "write_ratio": args.write_ratio,
+            "app_cache_check_interval": db.APP_CACHE_CHECK_INTERVAL,
+            "results": [before, after, cached],
+            "speedup_p50": round(before["p50_us"] / max(after["p50_us"], 1e-9), 2),
+            "app_cache_speedup_p50": round(after["p50_us"] / max(cached["p50_us"], 1e-9), 2),
+        }, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
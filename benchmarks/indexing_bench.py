@@ -0,0 +1,287 @@
+"""
+Stage-level benchmark for the indexing pipeline (load -> chunk -> embed -> persist).
+
+Generates a synthetic corpus of .txt, .md and .pdf files (a "page" is --page-chars of
+text; PDFs get one PDF page per page), then runs the same functions build_index uses,
+timing each stage separately with the process's peak RSS during that stage:
+
+    load     indexing.load_documents, once per format
+    chunk    indexing.chunk_documents, for every CHUNK_SIZE x CHUNK_OVERLAP
+    embed    indexing.embed_texts, for every chunking x EMBED_BATCH_SIZE (cache off)
+    persist  indexing.persist_chunks into a fresh Chroma or flat index
+
+Embeddings come from a deterministic fake model by default, which isolates pipeline
+overhead; use --embedder model to include the real EMBED_MODEL. Peak RSS is reset per
+stage on Linux (/proc/self/clear_refs); elsewhere it is the process-wide peak so far.
+Loader worker processes (LOAD_WORKERS) are not included in the RSS figures.
+
+Usage:
+    python -m benchmarks.indexing_bench --pages 2000 --chunk-sizes 500,800,1200 --overlaps 0,120 --batch-sizes 64,256
+    python -m benchmarks.indexing_bench --pages 10000 --formats pdf --embedder model --output capacity.json
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.common import VOCABULARY
+
+LINE_CHARS = 90
+
+
+def _csv_ints(value: str):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _reset_peak_rss() -> bool:
+    """Reset this process's peak RSS counter (VmHWM). Linux only."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb(field: str = "VmRSS") -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+@contextlib.contextmanager
+def _stdout_to_stderr():
+    """Send the pipeline's print() logging (including loader worker processes) to stderr."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def _measure(fn, *args):
+    """Run one stage; returns (result, {"seconds", "peak_rss_mb", "rss_delta_mb"})."""
+    _reset_peak_rss()
+    before = _rss_mb()
+    start = time.perf_counter()
+    with _stdout_to_stderr():
+        result = fn(*args)
+    elapsed = time.perf_counter() - start
+    return result, {
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": _rss_mb("VmHWM"),
+        "rss_delta_mb": round(_rss_mb() - before, 1),
+    }
+
+
+def _page(rng: random.Random, chars: int) -> str:
+    """One page of paragraphs made of vocabulary sentences."""
+    paragraphs, size = [], 0
+    while size < chars:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = rng.choices(VOCABULARY, k=rng.randint(8, 16))
+            sentences.append(" ".join(words).capitalize() + f" (ref {rng.randint(0, 99999)}).")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:chars]
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _write_pdf(path: str, pages):
+    """Write a minimal text PDF (Helvetica, one content stream per page)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for text in pages:
+        lines = []
+        for paragraph in text.split("\n\n"):
+            for i in range(0, len(paragraph), LINE_CHARS):
+                lines.append(f"({_pdf_escape(paragraph[i:i + LINE_CHARS])}) Tj T*")
+        stream = ("BT /F1 9 Tf 11 TL 40 800 Td\n" + "\n".join(lines) + "\nET").encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        page_refs.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(page_refs) + b"] /Count %d >>" % len(pages)
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate_corpus(root: str, formats, pages: int, pages_per_file: int, page_chars: int, seed: int):
+    """Write `pages` pages per format. Returns {format: {"files": [...], "pages", "bytes"}}."""
+    rng = random.Random(seed)
+    corpus = {}
+    for fmt in formats:
+        directory = os.path.join(root, fmt)
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for start in range(0, pages, pages_per_file):
+            file_pages = [_page(rng, page_chars) for _ in range(min(pages_per_file, pages - start))]
+            path = os.path.join(directory, f"doc-{start // pages_per_file:05d}.{fmt}")
+            if fmt == "pdf":
+                _write_pdf(path, file_pages)
+            else:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(("\n\n# Page\n\n" if fmt == "md" else "\n\n").join(file_pages))
+            files.append(path)
+        corpus[fmt] = {"files": files, "pages": pages, "bytes": sum(os.path.getsize(p) for p in files)}
+    return corpus
+
+
+def _open_store(backend: str, path: str, embedding):
+    if backend == "flat":
+        from app.services.flat_index import FlatVectorStore
+        return FlatVectorStore(path, embedding, writable=True)
+    from langchain_community.vectorstores import Chroma
+    return Chroma(persist_directory=path, embedding_function=embedding)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000, help="pages per format")
+    parser.add_argument("--pages-per-file", type=int, default=20)
+    parser.add_argument("--page-chars", type=int, default=3000)
+    parser.add_argument("--formats", default="txt,md,pdf")
+    parser.add_argument("--chunk-sizes", type=_csv_ints, default=[800])
+    parser.add_argument("--overlaps", type=_csv_ints, default=[120])
+    parser.add_argument("--batch-sizes", type=_csv_ints, default=[256])
+    parser.add_argument("--backend", choices=["chroma", "flat"], default="chroma")
+    parser.add_argument("--embedder", choices=["fake", "model"], default="fake")
+    parser.add_argument("--dim", type=int, default=384, help="fake embedding size")
+    parser.add_argument("--load-workers", type=int, default=None, help="override LOAD_WORKERS")
+    parser.add_argument("--embed-workers", type=int, default=None,
+                        help="override EMBED_WORKERS (--embedder model only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+
+    with _stdout_to_stderr():
+        from app.services import embedding_cache, embeddings, indexing
+
+    # Every run must encode: cached vectors would hide the embedding cost
+    embedding_cache.ENABLED = False
+    if args.embedder == "fake":
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        embeddings._models[embeddings.EMBED_MODEL] = DeterministicFakeEmbedding(size=args.dim)
+        embeddings.EMBED_WORKERS = 1  # Pool workers would load the real model
+    elif args.embed_workers is not None:
+        embeddings.EMBED_WORKERS = args.embed_workers
+    if args.load_workers is not None:
+        indexing.LOAD_WORKERS = args.load_workers
+    embedding = embeddings.get_embeddings(embeddings.EMBED_MODEL)
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    workdir = tempfile.mkdtemp(prefix="indexing_bench_")
+    try:
+        start = time.perf_counter()
+        corpus = generate_corpus(os.path.join(workdir, "corpus"), formats, args.pages,
+                                 args.pages_per_file, args.page_chars, args.seed)
+        print(f"[BENCH] Generated corpus in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        docs, load = [], {}
+        for fmt in formats:
+            (loaded, _), stage = _measure(indexing.load_documents, "bench", None, corpus[fmt]["files"])
+            docs.extend(loaded)
+            load[fmt] = {
+                "files": len(corpus[fmt]["files"]),
+                "pages": corpus[fmt]["pages"],
+                "mb": round(corpus[fmt]["bytes"] / 1024 / 1024, 2),
+                "documents": len(loaded),
+                **stage,
+                "pages_per_sec": round(corpus[fmt]["pages"] / max(stage["seconds"], 1e-9), 1),
+            }
+        total_pages = args.pages * len(formats)
+
+        runs = []
+        for chunk_size in args.chunk_sizes:
+            for overlap in args.overlaps:
+                if overlap >= chunk_size:
+                    continue
+                indexing.CHUNK_SIZE, indexing.CHUNK_OVERLAP = chunk_size, overlap
+                chunks, chunk_stage = _measure(indexing.chunk_documents, docs)
+                texts = [c.page_content for c in chunks]
+                ids = [hashlib.sha1(f"{i}:{t}".encode("utf-8")).hexdigest() for i, t in enumerate(texts)]
+
+                for batch_size in args.batch_sizes:
+                    indexing.EMBED_BATCH_SIZE = batch_size
+                    (vectors, _), embed_stage = _measure(indexing.embed_texts, texts)
+                    store_dir = os.path.join(workdir, "index", f"{chunk_size}-{overlap}-{batch_size}")
+                    store = _open_store(args.backend, store_dir, embedding)
+                    _, persist_stage = _measure(indexing.persist_chunks, store, chunks, ids, vectors)
+                    del store, vectors
+                    shutil.rmtree(store_dir, ignore_errors=True)
+
+                    stages = {"chunk": chunk_stage, "embed": embed_stage, "persist": persist_stage}
+                    seconds = sum(load[f]["seconds"] for f in formats) + sum(s["seconds"] for s in stages.values())
+                    runs.append({
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": overlap,
+                        "batch_size": batch_size,
+                        "chunks": len(chunks),
+                        "avg_chunk_chars": round(sum(map(len, texts)) / max(len(texts), 1), 1),
+                        "stages": stages,
+                        "chunks_per_sec": round(len(chunks) / max(embed_stage["seconds"] + persist_stage["seconds"], 1e-9), 1),
+                        "total_seconds": round(seconds, 3),
+                        "seconds_per_10k_pages": round(seconds * 10000 / max(total_pages, 1), 1),
+                    })
+                    print(f"[BENCH] size={chunk_size} overlap={overlap} batch={batch_size}: "
+                          f"{len(chunks)} chunks, {seconds:.1f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "config": {
+            "pages_per_format": args.pages,
+            "pages_per_file": args.pages_per_file,
+            "page_chars": args.page_chars,
+            "formats": formats,
+            "backend": args.backend,
+            "embedder": args.embedder if args.embedder == "fake" else embeddings.EMBED_MODEL,
+            "embed_workers": embeddings.EMBED_WORKERS,
+            "load_workers": indexing.LOAD_WORKERS,
+            "peak_rss_per_stage": _reset_peak_rss(),
+        },
+        "load": load,
+        "runs": runs,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Offline load test for the HTTP API.
+
+Starts the app under uvicorn in a subprocess with throwaway storage, a deterministic
+fake embedder (no model download) and the mock LLM with a simulated per-call latency
+(no OpenAI key needed). It then creates synthetic tenants and drives the API in phases:
+
+    upload  POST /api/apps/{id}/files   one synthetic .txt / .md document per request
+    train   POST /api/apps/{id}/train   latency = queued until the job has finished
+    chat    POST /api/chat              questions spread over all tenants
+
+Each phase runs at --concurrency and reports p50/p95/p99 latency, requests per second
+and error counts; the server's peak RSS is reported for the whole run. Everything is
+seeded, so two runs with the same arguments are comparable: save one with --output and
+pass it as --baseline to another to get per-metric deltas.
+
+Usage:
+    python -m benchmarks.load_test --tenants 10 --docs 5 --chats 2000 --concurrency 32 --llm-latency-ms 200
+    python -m benchmarks.load_test --output before.json
+    python -m benchmarks.load_test --baseline before.json --env CHAT_ASYNC=1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import VOCABULARY, percentile
+
+PHASES = ("upload", "train", "chat")
+COMPARED = ("p50_ms", "p95_ms", "p99_ms", "rps")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _peak_rss_mb(pid: int):
+    """Peak resident set size of a process (Linux /proc), or None where unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _document(rng: random.Random, tenant: int, doc: int, size_kb: int) -> str:
+    """Synthetic document: paragraphs of vocabulary sentences with tenant-specific facts."""
+    paragraphs, size = [], 0
+    while size < size_kb * 1024:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = rng.choices(VOCABULARY, k=rng.randint(8, 16))
+            sentences.append(" ".join(words).capitalize() + f" (ref T{tenant}-D{doc}-{rng.randint(0, 9999)}).")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def _question(rng: random.Random) -> str:
+    return f"What is the {rng.choice(VOCABULARY)} policy for {rng.choice(VOCABULARY)} and {rng.choice(VOCABULARY)}?"
+
+
+def serve(workdir: str, port: int, dim: int):
+    """Run the app in this process with storage under `workdir` and a fake embedder."""
+    import uvicorn
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+
+    from app.services import embeddings, storage
+
+    storage.STORAGE_ROOT = os.path.join(workdir, "apps")
+    storage.BLOB_ROOT = os.path.join(workdir, "blobs")
+    embeddings._models[embeddings.EMBED_MODEL] = DeterministicFakeEmbedding(size=dim)
+
+    from app.main import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def _start_server(args, workdir: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "",  # Set (empty) so .env can't switch the run to OpenAI
+        "MOCK_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "EMBED_WARMUP": "0",
+        "EMBED_WORKERS": "1",  # Encode in-process, where the fake embedder is installed
+        "LOAD_WORKERS": "1",
+        "METADATA_DB_PATH": os.path.join(workdir, "metadata.db"),
+        "EMBED_CACHE_DIR": os.path.join(workdir, "embedding_cache"),
+        "TRAIN_RESUME_ON_STARTUP": "0",
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log = open(os.path.join(workdir, "server.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load_test", "--serve", "--workdir", workdir,
+         "--port", str(port), "--dim", str(args.dim)],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def _wait_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("Server exited during startup (see server.log)")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("Server did not become ready")
+
+
+async def _run_phase(name: str, requests: list, concurrency: int) -> dict:
+    """Run `requests` (coroutine factories returning an HTTP status) `concurrency` at a time."""
+    latencies, statuses = [], {}
+    pending = iter(requests)
+
+    async def worker():
+        for request in pending:
+            start = time.perf_counter()
+            try:
+                status = await request()
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+    elapsed = time.perf_counter() - start
+
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    print(f"[BENCH] {name}: {len(latencies)} request(s) in {elapsed:.1f}s", file=sys.stderr)
+    return {
+        "requests": len(latencies),
+        "ok": ok,
+        "errors": len(latencies) - ok,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2) if latencies else 0.0,
+    }
+
+
+async def _drive(args, client: httpx.AsyncClient) -> dict:
+    rng = random.Random(args.seed)
+    tenants = [f"load-{i}" for i in range(args.tenants)]
+    for app_id in tenants:
+        response = await client.post("/api/apps", json={"appId": app_id, "name": f"Tenant {app_id}"})
+        response.raise_for_status()
+
+    def upload(app_id, filename, text):
+        async def _request():
+            files = {"files": (filename, text.encode("utf-8"), "text/plain")}
+            return (await client.post(f"/api/apps/{app_id}/files", files=files)).status_code
+        return _request
+
+    uploads = [
+        upload(app_id, f"doc-{d}.{'md' if d % 2 else 'txt'}", _document(rng, t, d, args.doc_kb))
+        for t, app_id in enumerate(tenants) for d in range(args.docs)
+    ]
+
+    def train(app_id):
+        async def _request():
+            response = await client.post(f"/api/apps/{app_id}/train")
+            if response.status_code != 202:
+                return response.status_code
+            job_id = response.json()["data"]["job_id"]
+            while True:
+                await asyncio.sleep(0.05)
+                job = (await client.get(f"/api/jobs/{job_id}")).json()["data"]
+                if job["status"] == "SUCCEEDED":
+                    return 200
+                if job["status"] == "FAILED":
+                    return "job_failed"
+        return _request
+
+    def chat(app_id, message):
+        async def _request():
+            response = await client.post("/api/chat", json={"appId": app_id, "message": message})
+            return response.status_code
+        return _request
+
+    questions = []
+    for i in range(args.chats):
+        if questions and rng.random() < args.repeat_ratio:
+            questions.append(rng.choice(questions[:i]))
+        else:
+            questions.append((rng.choice(tenants), _question(rng) + f" #{i}"))
+
+    return {
+        "upload": await _run_phase("upload", uploads, args.concurrency),
+        "train": await _run_phase("train", [train(app_id) for app_id in tenants], args.concurrency),
+        "chat": await _run_phase("chat", [chat(app_id, q) for app_id, q in questions], args.concurrency),
+    }
+
+
+def _compare(results: dict, baseline: dict) -> dict:
+    """Percent change per phase metric vs. a previous run (positive = higher)."""
+    deltas = {}
+    for phase in PHASES:
+        before, after = baseline.get("phases", {}).get(phase), results["phases"].get(phase)
+        if not before or not after:
+            continue
+        deltas[phase] = {
+            metric: round(100 * (after[metric] - before[metric]) / before[metric], 1) if before[metric] else None
+            for metric in COMPARED
+        }
+    if baseline.get("server_peak_rss_mb") and results.get("server_peak_rss_mb"):
+        deltas["server_peak_rss_mb"] = round(
+            100 * (results["server_peak_rss_mb"] - baseline["server_peak_rss_mb"]) / baseline["server_peak_rss_mb"], 1
+        )
+    if baseline.get("config") != results["config"]:
+        deltas["warning"] = "baseline was run with different arguments"
+    return deltas
+
+
+async def _main(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    port = _free_port()
+    server = _start_server(args, workdir, port)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=args.timeout) as client:
+            await _wait_ready(client, server)
+            phases = await _drive(args, client)
+            metrics = (await client.get("/api/metrics")).json()
+        return {
+            "config": {key: value for key, value in vars(args).items()
+                       if key not in ("serve", "workdir", "port", "output", "baseline", "keep")},
+            "phases": phases,
+            "server_peak_rss_mb": _peak_rss_mb(server.pid),
+            "server_metrics": metrics,
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        if args.keep:
+            print(f"[BENCH] Kept server storage and log in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=10)
+    parser.add_argument("--docs", type=int, default=5, help="documents per tenant")
+    parser.add_argument("--doc-kb", type=int, default=20, help="approx. size of each document")
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--repeat-ratio", type=float, default=0.0,
+                        help="share of chat questions repeated from earlier ones (answer cache hits)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--dim", type=int, default=384, help="fake embedding size")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra server environment, e.g. CHAT_WORKERS=16 (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    parser.add_argument("--baseline", help="previous --output file to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the server's storage and log")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.workdir, args.port, args.dim)
+        return
+
+    results = asyncio.run(_main(args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["vs_baseline"] = _compare(results, json.load(f))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
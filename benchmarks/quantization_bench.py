@@ -0,0 +1,107 @@
+"""
+Benchmark for compact vector storage in the flat index (float16 / int8, with and
+without float32 re-rank).
+
+Generates clustered unit vectors (closer to real chunk embeddings than uniform noise,
+so near neighbours are actually hard to separate), builds one flat index per setting,
+and reports recall@k against exact float32 search, query latency, and the size of the
+matrix a hot index keeps in memory.
+
+Usage:
+    python -m benchmarks.quantization_bench --chunks 20000 --dim 384 --queries 200 --k 6
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.services import flat_index
+from app.services.flat_index import FlatVectorStore
+from benchmarks.common import percentile
+
+SETTINGS = [
+    ("float32", False),
+    ("float16", False),
+    ("float16", True),
+    ("int8", False),
+    ("int8", True),
+]
+
+
+def _corpus(chunks: int, dim: int, clusters: int, queries: int, seed: int):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, chunks)] + 0.6 * rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries: perturbed corpus vectors, so each has a dense neighbourhood
+    picks = vectors[rng.integers(0, chunks, queries)]
+    query_vectors = picks + 0.3 * rng.standard_normal(picks.shape).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, query_vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors, queries = _corpus(args.chunks, args.dim, args.clusters, args.queries, args.seed)
+    exact = [set(np.argsort(-(vectors @ q))[:args.k].tolist()) for q in queries]
+    ids = [str(i) for i in range(args.chunks)]
+    documents = [""] * args.chunks
+    metadatas = [{"row": i} for i in range(args.chunks)]
+
+    workdir = tempfile.mkdtemp(prefix="quant_bench_")
+    results = []
+    try:
+        for dtype, rerank in SETTINGS:
+            path = os.path.join(workdir, f"{dtype}-{int(rerank)}")
+            store = FlatVectorStore(path, None, writable=True, dtype=dtype, rerank=rerank)
+            store.upsert(ids, vectors, metadatas, documents)
+            store.persist()
+
+            store = FlatVectorStore(path, None)
+            recalls, latencies = [], []
+            for q, truth in zip(queries, exact):
+                start = time.perf_counter()
+                docs = store.similarity_search_by_vector(q, k=args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(truth & {d.metadata["row"] for d in docs}) / args.k)
+
+            results.append({
+                "dtype": dtype,
+                "rerank": rerank,
+                f"recall_at_{args.k}": round(statistics.mean(recalls), 4),
+                "p50_ms": round(percentile(latencies, 50), 3),
+                "p95_ms": round(percentile(latencies, 95), 3),
+                "matrix_mb": round(store.matrix_bytes() / 1024 / 1024, 2),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = results[0]["matrix_mb"]
+    for result in results:
+        result["memory_saving_pct"] = round(100 * (1 - result["matrix_mb"] / baseline), 1) if baseline else 0.0
+
+    print(json.dumps({
+        "chunks": args.chunks,
+        "dim": args.dim,
+        "queries": args.queries,
+        "k": args.k,
+        "rerank_factor": flat_index.RERANK_FACTOR,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark for the per-app vector store backends (Chroma vs the flat NumPy index).
+
+Builds both indexes from the same random unit vectors, then opens each one in a fresh
+subprocess (so imports and caches don't leak between backends) and reports cold-open
+time, similarity / MMR query latency and resident memory.
+
+Usage:
+    python -m benchmarks.vector_backend_bench --chunks 5000 --dim 384 --queries 200
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.flat_index import FlatVectorStore
+from benchmarks.common import percentile
+
+
+def _rss_bytes() -> int:
+    """Current resident set size (falls back to the peak where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _fake_embedding(dim: int):
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    return DeterministicFakeEmbedding(size=dim)
+
+
+def _open(backend: str, path: str, dim: int):
+    if backend == "flat":
+        return FlatVectorStore(path, _fake_embedding(dim))
+    from langchain_community.vectorstores import Chroma
+    return Chroma(persist_directory=path, embedding_function=_fake_embedding(dim))
+
+
+def build(workdir: str, chunks: int, dim: int, seed: int):
+    """Write the same random corpus to both backends."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"chunk-{i}" for i in range(chunks)]
+    documents = [f"synthetic chunk {i} " * 20 for i in range(chunks)]
+    metadatas = [{"source": f"doc-{i % 50}.txt"} for i in range(chunks)]
+
+    flat = FlatVectorStore(os.path.join(workdir, "flat"), _fake_embedding(dim), writable=True)
+    flat.upsert(ids, vectors.tolist(), metadatas, documents)
+    flat.persist()
+
+    chroma = _open("chroma", os.path.join(workdir, "chroma"), dim)
+    for i in range(0, chunks, 1000):
+        chroma._collection.upsert(
+            ids=ids[i:i + 1000],
+            embeddings=vectors[i:i + 1000].tolist(),
+            metadatas=metadatas[i:i + 1000],
+            documents=documents[i:i + 1000],
+        )
+    np.save(os.path.join(workdir, "queries.npy"), vectors[rng.integers(0, chunks, 1000)])
+
+
+def run_child(backend: str, workdir: str, dim: int, queries: int, k: int, fetch_k: int):
+    """Measure one backend in this (fresh) process and print JSON."""
+    query_vectors = np.load(os.path.join(workdir, "queries.npy"))[:queries].tolist()
+    rss_before = _rss_bytes()
+
+    start = time.perf_counter()
+    store = _open(backend, os.path.join(workdir, backend), dim)
+    store.similarity_search_by_vector(query_vectors[0], k=k)
+    cold_open_ms = (time.perf_counter() - start) * 1000
+
+    similarity, mmr = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        store.similarity_search_by_vector(vector, k=k)
+        similarity.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        store.max_marginal_relevance_search_by_vector(vector, k=k, fetch_k=fetch_k)
+        mmr.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        "backend": backend,
+        "cold_open_ms": round(cold_open_ms, 2),
+        "similarity_p50_ms": round(percentile(similarity, 50), 3),
+        "similarity_p95_ms": round(percentile(similarity, 95), 3),
+        "similarity_mean_ms": round(statistics.mean(similarity), 3),
+        "mmr_p50_ms": round(percentile(mmr, 50), 3),
+        "mmr_p95_ms": round(percentile(mmr, 95), 3),
+        "rss_delta_mb": round((_rss_bytes() - rss_before) / 1024 / 1024, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--fetch-k", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", choices=["chroma", "flat"], help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.workdir, args.dim, args.queries, args.k, args.fetch_k)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="vector_bench_")
+    try:
+        start = time.perf_counter()
+        build(workdir, args.chunks, args.dim, args.seed)
+        print(f"[BENCH] Built both indexes in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        results = []
+        for backend in ("chroma", "flat"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.vector_backend_bench", "--child", backend,
+                 "--workdir", workdir, "--dim", str(args.dim), "--queries", str(args.queries),
+                 "--k", str(args.k), "--fetch-k", str(args.fetch_k)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        print(json.dumps({
+            "chunks": args.chunks,
+            "dim": args.dim,
+            "queries": args.queries,
+            "k": args.k,
+            "fetch_k": args.fetch_k,
+            "results": results,
+        }, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -202,9 +202,22 @@ function App() {
 
     try {
       const response = await axios.post(`${API_URL}/api/apps/${appId}/train`);
-      showSnackbar(
-        `Training complete! ${response.data.data.documents} docs, ${response.data.data.chunks} chunks`
-      );
+      const jobId = response.data.data.job_id;
+      fetchApps();
+
+      // Training runs in the background; poll the job until it finishes
+      let job = response.data.data;
+      while (job.status === 'QUEUED' || job.status === 'RUNNING') {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        const jobResponse = await axios.get(`${API_URL}/api/jobs/${jobId}`);
+        job = jobResponse.data.data;
+      }
+
+      if (job.status === 'SUCCEEDED') {
+        showSnackbar(`Training complete! ${job.result.documents} docs, ${job.result.chunks} chunks`);
+      } else {
+        showSnackbar(job.error || 'Training failed', 'error');
+      }
       fetchApps();
     } catch (error) {
       showSnackbar(error.response?.data?.detail || 'Training failed', 'error');
@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+# Before any app import: importing app.db creates the metadata DB
+os.environ.setdefault("METADATA_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="tests_"), "metadata.db"))
+
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from app import db
+from app.services import embedding_cache, embeddings, indexing, storage
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Metadata DB and app storage under a temp directory, with a fake embedder and the flat backend."""
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "metadata.db"))
+    monkeypatch.setattr(storage, "STORAGE_ROOT", str(tmp_path / "apps"))
+    monkeypatch.setattr(storage, "BLOB_ROOT", str(tmp_path / "blobs"))
+    monkeypatch.setattr(embedding_cache, "ENABLED", False)
+    monkeypatch.setattr(embeddings, "EMBED_WORKERS", 1)
+    monkeypatch.setitem(embeddings._models, embeddings.EMBED_MODEL, DeterministicFakeEmbedding(size=16))
+    monkeypatch.setattr(indexing, "VECTOR_BACKEND", "flat")
+    db.init_db()
+    db.invalidate_app_cache()
+    yield tmp_path
+    db.close_connection()
+    db.invalidate_app_cache()
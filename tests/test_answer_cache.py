@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pytest
+
+from app import db
+from app.services import answer_cache, indexing, llm, rag, storage
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(answer_cache, "ENABLED", True)
+    monkeypatch.setattr(answer_cache, "SEMANTIC", True)
+    answer_cache.clear()
+    yield
+    answer_cache.clear()
+
+
+def _unit(i, dim=8):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def test_exact_and_semantic_hits_stay_within_the_app(cache):
+    answer_cache.put("a", "v1", "What is the refund window?", "14 days", ["a.txt"], _unit(0))
+    answer_cache.put("b", "v1", "Shipping time?", "3-5 days", ["b.txt"], _unit(1))
+
+    assert answer_cache.get("a", "v1", "  what is the REFUND window ")["answer"] == "14 days"
+    assert answer_cache.get_similar("a", "v1", _unit(0) + 0.01 * _unit(2))["match"] == "semantic"
+    # The closest question overall belongs to another app
+    assert answer_cache.get_similar("a", "v1", _unit(1)) is None
+    assert answer_cache.get_similar("c", "v1", _unit(0)) is None
+
+
+def test_new_version_drops_the_apps_entries(cache):
+    answer_cache.put("a", "v1", "q1", "old", [], _unit(0))
+    answer_cache.put("b", "v1", "q1", "other", [], _unit(0))
+
+    assert answer_cache.get("a", "v2", "q1") is None
+    assert answer_cache.get_similar("a", "v2", _unit(0)) is None
+    assert answer_cache.get("b", "v1", "q1")["answer"] == "other"
+    assert answer_cache.stats()["invalidations"] == 1
+
+
+def test_semantic_index_follows_puts_and_evictions(cache, monkeypatch):
+    monkeypatch.setattr(answer_cache, "MAX_ENTRIES", 2)
+    answer_cache.put("a", "v1", "q0", "zero", [], _unit(0))
+    assert answer_cache.get_similar("a", "v1", _unit(0))["answer"] == "zero"
+    answer_cache.put("a", "v1", "q1", "one", [], _unit(1))
+    assert answer_cache.get_similar("a", "v1", _unit(1))["answer"] == "one"
+
+    # q0 is the least recently used and makes room for q2
+    answer_cache.put("a", "v1", "q2", "two", [], _unit(2))
+    assert answer_cache.get_similar("a", "v1", _unit(0)) is None
+    assert answer_cache.get_similar("a", "v1", _unit(2))["answer"] == "two"
+    assert answer_cache.stats()["entries"] == 2
+
+
+def test_expired_entries_are_not_semantic_matches(cache, monkeypatch):
+    answer_cache.put("a", "v1", "q0", "zero", [], _unit(0))
+    assert answer_cache.get_similar("a", "v1", _unit(0)) is not None
+    monkeypatch.setattr(answer_cache, "TTL_SECONDS", 1)
+    monkeypatch.setattr(answer_cache.time, "time", lambda: 1e12)
+    assert answer_cache.get_similar("a", "v1", _unit(0)) is None
+
+
+def test_retrain_and_settings_change_invalidate_cached_answers(workspace, cache, monkeypatch):
+    monkeypatch.setattr(llm, "_get_openai_api_key", lambda: None)
+    monkeypatch.setattr(rag, "has_openai_key", lambda: False)
+    db.create_app("cached", "Cached")
+    storage.ensure_app_dirs("cached")
+    path = os.path.join(storage.get_files_dir("cached"), "a.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Refunds are issued within 14 days of the return being received.")
+    indexing.build_index("cached")
+
+    assert rag.chat("cached", "When do refunds arrive?")["cached"] is None
+    assert rag.get_cached_answer("cached", "When do refunds arrive?")["cached"] == "exact"
+
+    # A retrain that changed nothing keeps the answers
+    indexing.build_index("cached")
+    assert rag.get_cached_answer("cached", "When do refunds arrive?") is not None
+
+    # Retrained with new content (by any worker): last_indexed_at moves in the metadata DB
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Refunds are issued within 30 days of the return being received.")
+    indexing.build_index("cached")
+    assert rag.get_cached_answer("cached", "When do refunds arrive?") is None
+
+    rag.chat("cached", "When do refunds arrive?")
+    # LLM settings changed without going through this process's PATCH handler
+    db.update_app_settings("cached", llm_temperature=0.7)
+    assert rag.get_cached_answer("cached", "When do refunds arrive?") is None
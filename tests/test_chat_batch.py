@@ -0,0 +1,42 @@
+import os
+import threading
+import time
+
+from app import db
+from app.services import answer_cache, indexing, llm, rag, storage
+
+
+def test_batch_answers_in_order_with_bounded_llm_calls(workspace, monkeypatch):
+    monkeypatch.setattr(llm, "_get_openai_api_key", lambda: None)
+    monkeypatch.setattr(answer_cache, "ENABLED", False)
+    monkeypatch.setattr(rag, "BATCH_CONCURRENCY", 2)
+    db.create_app("batch", "Batch")
+    storage.ensure_app_dirs("batch")
+    with open(os.path.join(storage.get_files_dir("batch"), "a.txt"), "w", encoding="utf-8") as f:
+        f.write("Refunds are issued within 14 days of the return being received.")
+    indexing.build_index("batch")
+
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def answer(llm, app, message, docs):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        if message == "fail":
+            raise RuntimeError("llm down")
+        return f"answer to {message}"
+
+    monkeypatch.setattr(rag, "_answer_from_docs", answer)
+    questions = [f"q{i}" for i in range(6)] + ["fail"]
+    result = rag.chat_batch("batch", questions)
+
+    assert result["success"]
+    answers = [r["answer"] for r in result["results"]]
+    assert answers == [f"answer to q{i}" for i in range(6)] + [None]
+    assert result["results"][-1]["error"] == "llm down"
+    assert result["results"][0]["sources"] == ["a.txt"]
+    assert peak[0] == 2
@@ -0,0 +1,70 @@
+import os
+
+from langchain_core.documents import Document
+
+from app import db
+from app.services import answer_cache, context_packer, indexing, llm, rag, storage
+
+SENTENCES = [
+    "Refunds are issued within 14 days of the return being received at our warehouse.",
+    "Shipping to the EU region takes three to five business days with tracked delivery.",
+    "Gift cards never expire and can be combined with any seasonal discount code.",
+    "Support is available by chat from nine to five on weekdays, except public holidays.",
+]
+
+
+def _doc(text, source="a.txt"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_pack_never_exceeds_the_budget(monkeypatch):
+    monkeypatch.setattr(context_packer, "MIN_TAIL_TOKENS", 5)
+    docs = [_doc(" ".join([s] * 3), f"{i}.txt") for i, s in enumerate(SENTENCES)]
+    tokens = [context_packer.count_tokens(doc.page_content) for doc in docs]
+    budget = tokens[0] + tokens[1] // 2
+
+    packed, report = context_packer.pack(docs, budget=budget)
+    assert report["tokens_sent"] <= budget
+    assert report["chunks_over_budget"] == 3
+    # The most relevant chunk is kept whole, the next one is cut to fill the budget
+    assert packed[0].page_content == docs[0].page_content
+    assert len(packed) == 2 and docs[1].page_content.startswith(packed[1].page_content)
+    assert [doc.metadata["source"] for doc in packed] == ["0.txt", "1.txt"]
+
+
+def test_pack_keeps_the_first_chunk_even_if_it_alone_is_over_budget():
+    docs = [_doc(" ".join(SENTENCES * 4))]
+    packed, report = context_packer.pack(docs, budget=20)
+    assert len(packed) == 1
+    assert 0 < report["tokens_sent"] <= 20
+
+
+def test_pack_drops_duplicates_and_merges_overlapping_chunks():
+    text = " ".join(SENTENCES)
+    first, second = text[:200], text[120:]
+    docs = [_doc(first), _doc(first.upper()), _doc(second), _doc(SENTENCES[2], "b.txt")]
+
+    packed, report = context_packer.pack(docs, budget=10_000)
+    assert report["duplicates_dropped"] == 2
+    assert report["overlaps_merged"] == 1
+    assert [doc.page_content for doc in packed] == [text]
+
+
+def test_chat_only_cites_sources_that_were_packed(workspace, monkeypatch):
+    # Mock LLM: answers without network access
+    monkeypatch.setattr(llm, "_get_openai_api_key", lambda: None)
+    monkeypatch.setattr(rag, "has_openai_key", lambda: False)
+    monkeypatch.setattr(answer_cache, "ENABLED", False)
+    db.create_app("packed", "Packed")
+    storage.ensure_app_dirs("packed")
+    for i, sentence in enumerate(SENTENCES):
+        with open(os.path.join(storage.get_files_dir("packed"), f"{i}.txt"), "w", encoding="utf-8") as f:
+            f.write(" ".join([sentence] * 4))
+    indexing.build_index("packed")
+
+    # Room for exactly one file's chunk
+    one_file = context_packer.count_tokens(" ".join([SENTENCES[0]] * 4))
+    monkeypatch.setattr(context_packer, "TOKEN_BUDGET", one_file + 10)
+    result = rag.chat("packed", "When do refunds arrive?")
+    assert result["success"], result["error"]
+    assert len(result["sources"]) == 1
@@ -0,0 +1,39 @@
+import sqlite3
+
+from app import db
+
+
+def test_app_cache_sees_writes_from_other_connections(workspace):
+    db.create_app("cached", "Before")
+    assert db.get_app("cached")["name"] == "Before"
+    assert db.get_app("cached")["name"] == "Before"
+    hits = db.app_cache_stats()["hits"]
+
+    # Another process (e.g. a second uvicorn worker) renames the app
+    other = sqlite3.connect(db.DB_PATH)
+    other.execute("UPDATE apps SET name = 'After' WHERE app_id = 'cached'")
+    other.commit()
+    other.close()
+
+    assert db.get_app("cached")["name"] == "After"
+    assert db.app_cache_stats()["hits"] == hits
+
+
+def test_app_cache_sees_local_writes(workspace):
+    db.create_app("local", "Local")
+    assert db.get_app("local")["status"] == "CREATED"
+    db.update_app_status("local", "READY")
+    assert db.get_app("local")["status"] == "READY"
+    assert [app["app_id"] for app in db.get_all_apps()] == ["local"]
+    db.delete_app("local")
+    assert db.get_app("local") is None
+    assert db.get_all_apps() == []
+
+
+def test_unknown_apps_are_not_cached(workspace):
+    for i in range(100):
+        assert db.get_app(f"missing-{i}") is None
+    assert db.app_cache_stats()["entries"] == 0
+    # Created later (e.g. by another worker): found without any invalidation
+    db.create_app("missing-0", "Now here")
+    assert db.get_app("missing-0")["name"] == "Now here"
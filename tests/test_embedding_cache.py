@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from app.services import embedding_cache
+
+MODEL = "test-model"
+# Two rows of this dimension fill a 1 MB cache
+DIM = 1024 * 1024 // 4 // 2
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "CACHE_DIR", str(tmp_path / "embedding_cache"))
+    monkeypatch.setattr(embedding_cache, "MAX_MB", 1)
+    return tmp_path
+
+
+def _vector(value):
+    return np.full(DIM, value, dtype=np.float32)
+
+
+def test_full_cache_evicts_least_recently_used(cache_dir):
+    embedding_cache.put_many(MODEL, [("a", _vector(1)), ("b", _vector(2))])
+    embedding_cache.get_many(MODEL, ["a"])
+    embedding_cache.put_many(MODEL, [("c", _vector(3))])
+
+    a, b, c = embedding_cache.get_many(MODEL, ["a", "b", "c"])
+    assert b is None
+    assert a[0] == 1 and c[0] == 3
+
+
+def test_failed_write_never_leaves_entries_on_foreign_vectors(cache_dir):
+    embedding_cache.put_many(MODEL, [("a", _vector(1)), ("b", _vector(2))])
+    # Not convertible to float32: fails while writing the reused row
+    with pytest.raises(ValueError):
+        embedding_cache.put_many(MODEL, [("bad", ["x"] * DIM)])
+
+    a, b, bad = embedding_cache.get_many(MODEL, ["a", "b", "bad"])
+    assert bad is None
+    # The evicted entry is gone rather than pointing at a half-written row
+    assert (a is None) != (b is None)
+    survivor = a if a is not None else b
+    assert survivor[0] in (1, 2) and np.all(survivor == survivor[0])
+
+    # The reserved row is reused instead of leaking, so the survivor is not evicted
+    embedding_cache.put_many(MODEL, [("c", _vector(3))])
+    assert embedding_cache.get_many(MODEL, ["c"])[0][0] == 3
+    assert embedding_cache.stats()["entries"] == 2
@@ -0,0 +1,143 @@
+import shutil
+import threading
+
+import numpy as np
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from app.services import vector_cache
+from app.services.flat_index import FlatVectorStore
+
+
+def _store(path, writable=False, dim=16):
+    return FlatVectorStore(str(path), DeterministicFakeEmbedding(size=dim), writable=writable)
+
+
+def _unit(i, dim=16):
+    vector = np.zeros(dim)
+    vector[i] = 1.0
+    return vector
+
+
+def test_persisted_index_reopens_read_only(tmp_path):
+    path = tmp_path / "index"
+    assert not FlatVectorStore.exists(str(path))
+    writer = _store(path, writable=True)
+    writer.upsert(["a", "b", "c"], [_unit(0).tolist(), _unit(1).tolist(), _unit(2).tolist()],
+                  [{"source": "a.txt"}, {"source": "b.txt"}, {}], ["alpha", "beta", "gamma"])
+    writer.persist()
+
+    assert FlatVectorStore.exists(str(path))
+    reader = _store(path)
+    assert len(reader) == 3
+    docs = reader.similarity_search_by_vector(_unit(1).tolist(), k=2)
+    assert [doc.page_content for doc in docs] == ["beta", "alpha"]
+    assert docs[0].metadata == {"source": "b.txt"}
+    with pytest.raises(RuntimeError):
+        reader.upsert(["d"], [_unit(3).tolist()], [{}], ["delta"])
+
+
+def test_upsert_replaces_and_delete_removes_rows(tmp_path):
+    path = tmp_path / "index"
+    writer = _store(path, writable=True)
+    writer.upsert(["a", "b"], [_unit(0).tolist(), _unit(1).tolist()], [{}, {}], ["alpha", "beta"])
+    writer.upsert(["a"], [_unit(2).tolist()], [{"version": 2}], ["alpha v2"])
+    writer.delete(["b"])
+    writer.persist()
+
+    reader = _store(path)
+    assert len(reader) == 1
+    doc = reader.similarity_search_by_vector(_unit(2).tolist(), k=4)[0]
+    assert doc.page_content == "alpha v2"
+    assert doc.metadata == {"version": 2}
+
+
+def test_mmr_prefers_diverse_results(tmp_path):
+    path = tmp_path / "index"
+    writer = _store(path, writable=True)
+    writer.upsert(["a", "a2", "b"], [_unit(0).tolist(), (_unit(0) + 0.01 * _unit(1)).tolist(), _unit(3).tolist()],
+                  [{}, {}, {}], ["first", "near copy", "other"])
+    writer.persist()
+    reader = _store(path)
+
+    query = (_unit(0) + 0.3 * _unit(3)).tolist()
+    assert [d.page_content for d in reader.similarity_search_by_vector(query, k=2)] == ["first", "near copy"]
+    picked = reader.max_marginal_relevance_search_by_vector(query, k=2, fetch_k=3, lambda_mult=0.3)
+    assert [d.page_content for d in picked] == ["first", "other"]
+
+
+def test_batch_search_matches_single_queries(tmp_path):
+    path = tmp_path / "index"
+    rng = np.random.default_rng(0)
+    writer = _store(path, writable=True)
+    writer.upsert([f"id-{i}" for i in range(50)], rng.normal(size=(50, 16)).tolist(),
+                  [{} for _ in range(50)], [f"chunk {i}" for i in range(50)])
+    writer.persist()
+    reader = _store(path)
+
+    queries = rng.normal(size=(4, 16)).tolist()
+    for query, docs in zip(queries, reader.batch_search(queries, 5)):
+        assert docs == reader.similarity_search_by_vector(query, k=5)
+    for query, docs in zip(queries, reader.batch_search(queries, 3, fetch_k=10)):
+        assert docs == reader.max_marginal_relevance_search_by_vector(query, k=3, fetch_k=10)
+
+
+def _build(path, dtype, rows=200, dim=64):
+    rng = np.random.default_rng(0)
+    store = FlatVectorStore(str(path), DeterministicFakeEmbedding(size=dim), writable=True, dtype=dtype)
+    store.upsert([f"id-{i}" for i in range(rows)], rng.normal(size=(rows, dim)).tolist(),
+                 [{"source": "doc.txt"} for _ in range(rows)], [f"chunk {i}" for i in range(rows)])
+    store.persist()
+    return FlatVectorStore(str(path), DeterministicFakeEmbedding(size=dim))
+
+
+def test_compact_indexes_are_charged_less_than_float32(tmp_path):
+    sizes = {}
+    for dtype in ("float32", "float16", "int8"):
+        store = _build(tmp_path / dtype, dtype)
+        sizes[dtype] = vector_cache._store_size(store, str(tmp_path / dtype))
+    assert sizes["int8"] < sizes["float16"] < sizes["float32"]
+    # The float32 rows a compact index keeps on disk are not charged
+    assert sizes["int8"] < vector_cache._dir_size(str(tmp_path / "float32"))
+
+
+def test_readers_never_see_a_half_written_index(tmp_path):
+    path = str(tmp_path / "index")
+    writer = FlatVectorStore(path, DeterministicFakeEmbedding(size=16), writable=True)
+    rng = np.random.default_rng(1)
+    errors, done = [], threading.Event()
+
+    def read():
+        while not done.is_set():
+            try:
+                store = FlatVectorStore(path, DeterministicFakeEmbedding(size=16))
+                assert len(store) == len(store._vectors)
+            except Exception as e:
+                errors.append(e)
+
+    writer.upsert(["first"], rng.normal(size=(1, 16)).tolist(), [{}], ["first"])
+    writer.persist()
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for i in range(50):
+            writer.upsert([f"id-{i}"], rng.normal(size=(1, 16)).tolist(), [{}], [f"chunk {i}"])
+            writer.persist()
+    finally:
+        done.set()
+        reader.join()
+    assert not errors
+    assert len(FlatVectorStore(path, DeterministicFakeEmbedding(size=16))) == 51
+
+
+def test_index_cleared_while_opening_opens_empty(tmp_path, monkeypatch):
+    path = tmp_path / "index"
+    _build(path, "float32")
+    # exists() saw the index, then the app was cleared before it was loaded
+    monkeypatch.setattr(FlatVectorStore, "exists", staticmethod(lambda persist_directory: True))
+    for child in path.iterdir():
+        if child.is_dir():
+            shutil.rmtree(child)
+        else:
+            child.unlink()
+    assert len(FlatVectorStore(str(path), DeterministicFakeEmbedding(size=64))) == 0
@@ -0,0 +1,38 @@
+import os
+
+from app import db
+from app.services import indexing, storage
+
+
+def _write(app_id, filename, text):
+    storage.ensure_app_dirs(app_id)
+    path = os.path.join(storage.get_files_dir(app_id), filename)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def test_failed_file_is_retried_on_next_train(workspace, monkeypatch):
+    db.create_app("retry", "Retry")
+    _write("retry", "a.txt", "Refunds are issued within 14 days of the return being received.")
+    b_path = _write("retry", "b.txt", "Shipping to the EU region takes three to five business days.")
+
+    load_file = indexing.load_file
+
+    def failing_load_file(file_path, timeout=0):
+        if file_path == b_path:
+            return [], "simulated parse error"
+        return load_file(file_path, timeout)
+
+    monkeypatch.setattr(indexing, "load_file", failing_load_file)
+    first = indexing.build_index("retry")
+    assert first["files_added"] == 2
+    assert first["files_failed"] == 1
+    assert b_path not in db.get_indexed_files("retry")
+
+    monkeypatch.setattr(indexing, "load_file", load_file)
+    second = indexing.build_index("retry")
+    assert second["files_added"] == 1
+    assert second["files_skipped"] == 1
+    assert second["files_failed"] == 0
+    assert db.get_indexed_files("retry")[b_path]["chunk_ids"]
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.services import jobs
+
+
+def test_create_job_deduplicates_active_jobs(workspace):
+    db.create_app("dedup", "Dedup")
+    assert db.create_job("job-1", "dedup", jobs.JOB_TYPE_TRAIN)
+    assert db.create_job("job-2", "dedup", jobs.JOB_TYPE_TRAIN) is None
+
+    assert db.claim_job("job-1", "host:1:a", 60)
+    assert not db.claim_job("job-1", "host:2:b", 60)
+    assert db.get_job("job-1")["owner"] == "host:1:a"
+
+
+def test_resume_skips_jobs_held_by_a_live_worker(workspace, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(jobs, "_submit", lambda job_id, app_id: submitted.append(job_id))
+    for app_id in ("live", "expired", "queued"):
+        db.create_app(app_id, app_id)
+        db.create_job(f"job-{app_id}", app_id, jobs.JOB_TYPE_TRAIN)
+    # A worker on another host, still renewing its lease
+    db.claim_job("job-live", "elsewhere:1:a", 60)
+    # A worker on another host that stopped renewing
+    db.claim_job("job-expired", "elsewhere:2:b", 60)
+    conn = db.get_connection()
+    conn.execute("UPDATE jobs SET lease_expires_at = ? WHERE job_id = 'job-expired'",
+                 ((datetime.utcnow() - timedelta(seconds=1)).isoformat(),))
+    conn.commit()
+
+    jobs.resume_unfinished_jobs()
+    assert sorted(submitted) == ["job-expired", "job-queued"]
+    assert db.get_job("job-live")["status"] == "RUNNING"
+    assert db.get_job("job-expired")["status"] == "QUEUED"
+
+    # A second worker starting now queues the same jobs too; only one claim wins
+    submitted.clear()
+    jobs.resume_unfinished_jobs()
+    assert sorted(submitted) == ["job-expired", "job-queued"]
+    assert db.claim_job("job-expired", "here:1:c", 60)
+    assert not db.claim_job("job-expired", "here:2:d", 60)
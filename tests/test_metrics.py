@@ -0,0 +1,61 @@
+import re
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import metrics
+
+# name{label="value",...} number
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? -?[0-9.e+-]+$|'
+                    r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{.*\})? (\+Inf|-Inf|NaN)$')
+
+
+def test_counter_and_histogram_text_format():
+    requests = metrics.Counter("test_requests_total", "Requests", ["app", "result"])
+    requests.inc("a", "ok")
+    requests.inc("a", "ok", amount=2)
+    requests.inc('quote"d\\app', "error")
+    latency = metrics.HistogramFamily("test_latency_seconds", "Latency", ["stage"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, "llm")
+
+    assert requests.collect() == [
+        "# HELP test_requests_total Requests",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{app="a",result="ok"} 3',
+        'test_requests_total{app="quote\\"d\\\\app",result="error"} 1',
+    ]
+    assert latency.collect() == [
+        "# HELP test_latency_seconds Latency",
+        "# TYPE test_latency_seconds histogram",
+        'test_latency_seconds_bucket{stage="llm",le="0.1"} 1',
+        'test_latency_seconds_bucket{stage="llm",le="1"} 2',
+        'test_latency_seconds_bucket{stage="llm",le="+Inf"} 3',
+        'test_latency_seconds_sum{stage="llm"} 5.55',
+        'test_latency_seconds_count{stage="llm"} 3',
+    ]
+
+
+def test_bounded_label_folds_extra_values():
+    values = [metrics.bounded_label("test_kind", f"app-{i}", limit=2) for i in range(4)]
+    assert values == ["app-0", "app-1", metrics.OTHER_LABEL, metrics.OTHER_LABEL]
+    assert metrics.bounded_label("test_kind", "app-0", limit=2) == "app-0"
+
+
+def test_metrics_endpoint_is_valid_exposition_format(workspace):
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    typed = set()
+    for line in response.text.splitlines():
+        if line.startswith("# TYPE "):
+            name, kind = line.split()[2:4]
+            assert kind in ("counter", "gauge", "histogram")
+            assert name not in typed, f"duplicate family {name}"
+            typed.add(name)
+        elif not line.startswith("# HELP "):
+            assert SAMPLE.match(line), line
+            name = re.match(r"[a-zA-Z0-9_:]+", line).group(0)
+            assert re.sub(r"_(bucket|sum|count)$", "", name) in typed or name in typed, line
+    assert "rag_chat_stage_seconds" in typed
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from app.services import embeddings, query_batcher
+
+MODEL = "batcher-test-model"
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    calls: list = []
+    fail: bool = False
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = CountingEmbedding(size=8)
+    fake.calls = []
+    monkeypatch.setitem(embeddings._models, MODEL, fake)
+    return fake
+
+
+def _embed_concurrently(batcher, texts):
+    results, errors = {}, {}
+    start = threading.Barrier(len(texts))
+
+    def run(text):
+        start.wait()
+        try:
+            results[text] = batcher.embed(text)
+        except Exception as e:
+            errors[text] = e
+
+    threads = [threading.Thread(target=run, args=(text,)) for text in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_queries_share_model_calls(model):
+    batcher = query_batcher.QueryBatcher(MODEL, window_ms=50, max_batch=8)
+    texts = [f"question {i}" for i in range(20)]
+
+    results, errors = _embed_concurrently(batcher, texts)
+    assert errors == {}
+    assert sum(model.calls) == len(texts)
+    assert len(model.calls) < len(texts)
+    assert max(model.calls) <= 8
+    assert batcher.stats()["batch_size"]["count"] == len(model.calls)
+    # Every caller gets the vector of its own text
+    for text in texts:
+        assert results[text] == model.embed_query(text)
+
+
+def test_model_errors_reach_every_caller_in_the_batch(model):
+    batcher = query_batcher.QueryBatcher(MODEL, window_ms=50, max_batch=8)
+    model.fail = True
+    results, errors = _embed_concurrently(batcher, [f"question {i}" for i in range(5)])
+    assert results == {}
+    assert len(errors) == 5
+    assert all(str(e) == "model unavailable" for e in errors.values())
+
+    # The batcher thread survives and serves later queries
+    model.fail = False
+    assert batcher.embed("later") == model.embed_query("later")
+
+
+def test_batched_embeddings_only_batch_queries(model, monkeypatch):
+    monkeypatch.setattr(query_batcher, "ENABLED", True)
+    monkeypatch.setattr(query_batcher, "_batchers", {})
+    adapter = query_batcher.get_query_embeddings(MODEL)
+    assert adapter.embed_query("q") == model.embed_query("q")
+    assert adapter.embed_documents(["a", "b"]) == model.embed_documents(["a", "b"])
+    assert list(query_batcher.stats()["models"]) == [MODEL]
+
+    monkeypatch.setattr(query_batcher, "ENABLED", False)
+    assert query_batcher.get_query_embeddings(MODEL) is model
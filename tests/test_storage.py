@@ -0,0 +1,133 @@
+import io
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import db
+from app.main import app
+from app.services import storage
+
+
+def _upload(client, app_id, filename, content):
+    response = client.post(f"/api/apps/{app_id}/files", files={"files": (filename, content, "text/plain")})
+    assert response.status_code == 200
+    return response.json()["data"]
+
+
+def _blob_count(root):
+    return sum(len(files) for path, _, files in os.walk(root) if ".tmp" not in path)
+
+
+def test_identical_uploads_share_one_blob(workspace):
+    content = b"Refunds are issued within 14 days of the return being received."
+    first = storage.save_upload_stream(io.BytesIO(content), "a.txt")
+    second = storage.save_upload_stream(io.BytesIO(content), "b.txt")
+    assert first == second
+    assert _blob_count(storage.BLOB_ROOT) == 1
+
+    a = storage.link_blob("one", "a.txt", first[2])
+    b = storage.link_blob("two", "b.txt", first[2])
+    for path in (a, b):
+        with open(path, "rb") as f:
+            assert f.read() == content
+    # Only the linked file is visible to indexing
+    assert storage.get_all_file_paths("one") == [a]
+
+
+def test_concurrent_links_of_the_same_file_do_not_collide(workspace):
+    content = b"Shipping to the EU region takes three to five business days."
+    _, _, file_hash = storage.save_upload_stream(io.BytesIO(content), "a.txt")
+    storage.ensure_app_dirs("race")
+    errors = []
+
+    def link():
+        try:
+            for _ in range(20):
+                storage.link_blob("race", "a.txt", file_hash)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=link) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    # No temp links left behind, even when the file already linked the same blob
+    assert sorted(os.listdir(storage.get_app_root("race"))) == ["chroma_db", "files"]
+    assert storage.get_all_file_paths("race") == [os.path.join(storage.get_files_dir("race"), "a.txt")]
+
+
+def test_blobs_are_released_with_their_last_reference(workspace, monkeypatch):
+    monkeypatch.setattr(storage, "BLOB_RELEASE_GRACE_SECONDS", 0)
+    client = TestClient(app)
+    for app_id in ("first", "second"):
+        assert client.post("/api/apps", json={"appId": app_id, "name": app_id}).status_code == 200
+
+    shared, v1, v2 = b"Shared policy text.", b"Version one.", b"Version two."
+    _upload(client, "first", "shared.txt", shared)
+    _upload(client, "second", "shared.txt", shared)
+    _upload(client, "first", "notes.txt", v1)
+    v1_blob = storage.get_blob_path(storage.compute_file_hash(v1))
+    assert os.path.exists(v1_blob)
+
+    # Replacing a file drops the blob nothing else references
+    _upload(client, "first", "notes.txt", v2)
+    assert not os.path.exists(v1_blob)
+    assert _blob_count(storage.BLOB_ROOT) == 2
+
+    # Deleting an app drops its own blobs but keeps the ones still shared
+    assert client.delete("/api/apps/first").status_code == 200
+    assert not os.path.exists(storage.get_blob_path(storage.compute_file_hash(v2)))
+    assert os.path.exists(storage.get_blob_path(storage.compute_file_hash(shared)))
+    with open(db.get_file_by_name("second", "shared.txt")["file_path"], "rb") as f:
+        assert f.read() == shared
+
+
+def test_recently_uploaded_blobs_survive_release(workspace):
+    _, _, file_hash = storage.save_upload_stream(io.BytesIO(b"Just uploaded."), "a.txt")
+    # Not referenced yet: the upload hasn't recorded its file row
+    assert storage.release_blobs([file_hash], []) == 0
+    assert storage.remove_unreferenced_blobs([], min_age_seconds=0) == 1
+    assert not os.path.exists(storage.get_blob_path(file_hash))
+
+
+class _CountingStream(io.BytesIO):
+    def __init__(self, size):
+        super().__init__(b"x" * size)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        block = super().read(size)
+        self.bytes_read += len(block)
+        return block
+
+
+def test_oversized_upload_is_rejected_mid_stream(workspace, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_CHUNK_SIZE", 1024)
+    stream = _CountingStream(64 * 1024)
+
+    with pytest.raises(storage.FileTooLargeError):
+        storage.save_upload_stream(stream, "big.txt", max_bytes=4 * 1024)
+    # Stopped at the first chunk past the limit, without reading the rest
+    assert stream.bytes_read == 5 * 1024
+    # Nothing kept: no blob and no partial temp file
+    assert _blob_count(storage.BLOB_ROOT) == 0
+    assert os.listdir(os.path.join(storage.BLOB_ROOT, ".tmp")) == []
+
+
+def test_request_limit_caps_later_files(workspace, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_MAX_REQUEST_BYTES", 3 * 1024)
+    client = TestClient(app)
+    assert client.post("/api/apps", json={"appId": "capped", "name": "Capped"}).status_code == 200
+
+    response = client.post("/api/apps/capped/files", files=[
+        ("files", ("a.txt", b"a" * 2048, "text/plain")),
+        ("files", ("b.txt", b"b" * 2048, "text/plain")),
+    ])
+    data = response.json()["data"]
+    assert [f["filename"] for f in data["uploaded"]] == ["a.txt"]
+    assert len(data["errors"]) == 1 and "b.txt" in data["errors"][0]
+    assert storage.get_all_file_paths("capped") == [os.path.join(storage.get_files_dir("capped"), "a.txt")]